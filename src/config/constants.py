@@ -2,10 +2,12 @@
 # Header Names
 X_BOBB_HEADER = "X-Bobb-Header"
 X_BOBB_OPTIONAL_HEADER = "X-Bobb-Optional-Header"
+X_BOBB_ROUTE_HEADER = "X-Bobb-Route-Header"
 
 # Error Messages
 ERROR_INVALID_BOBB_HEADER = "Invalid Bobb header"
 ERROR_INVALID_OPTIONAL_HEADER = "Invalid Bobb optional header"
+ERROR_INVALID_ROUTE_HEADER = "Invalid Bobb route header"
 
 # Default Values
 DEFAULT_HOP_COUNT = 255
@@ -31,3 +33,14 @@ SATELLITE_FUNCTION_POST_FLOOD_SURVIVOR_DETECTION_AERIALDRONES = "aerial-drones"
 # Timeout limit for neighbour last contact (90 seconds)
 MAX_TIMEOUT = 90
 
+
+
+# Routing table generation modes
+ROUTING_TABLE_MODE_OWN_SOURCE = "own-source"  # Only routes from the local satellite
+ROUTING_TABLE_MODE_FULL = "full"  # Routes between every pair of satellites
+ROUTING_TABLE_MODE_LAZY = "lazy"  # No tables, routes are generated in memory when first looked up
+
+# Routing table file formats
+ROUTING_TABLE_FORMAT_JSON = "json"  # Indented JSON, for tooling
+ROUTING_TABLE_FORMAT_BINARY = "binary"  # Compact, memory-mapped by lookups
+ROUTING_TABLE_FORMAT_BOTH = "both"
\ No newline at end of file
@@ -1,27 +1,16 @@
 # Written by Claire, modified by Niels, Patrick. Discovery lists added by Eoghan
 import subprocess
 import re
-import csv
-import requests
 import os
 import random
 import re
 import time
 from src.config.config import valid_functions
 
-# TODO allow self signed certificates
-import urllib3
-
+from src.helpers import http_client
+from src.helpers.state_store import FULL_SATELLITE_LISTING, TO_BE_DISCOVERED, write_listing
 from src.helpers.send_handshake_helper import send_handshakes
 
-urllib3.disable_warnings()
-
-# To block the SCSS proxying, to connect directly to the other pis
-proxies = {
-  'http': '',
-  'https': '',
-}
-
 
 def ping_with_contact_time(ipv4, timeout=1):
     """Ping an IPv4 address and return the last contact time as a UNIX timestamp"""
@@ -47,8 +36,7 @@ def check_device_type(ipv4, port, endpoint, verbose):
         addr = f"https://{ipv4}:{port}/{endpoint}"
         if verbose:
             print(f"Attempting HTTP request to {addr}...")
-        # TODO: Allow self signed certificates
-        resp = requests.get(addr, verify=False, timeout=3, proxies=proxies)
+        resp = http_client.get(addr, timeout=3)
         # Check the HTTP status code and response
         if resp.status_code == 200:
             if verbose:
@@ -111,17 +99,6 @@ def get_neighbouring_satellites():
     port = os.getenv("PORT")
     starter_satellite_list = find_x_satellites(port=int(port))
 
-    base_dir = os.getcwd()
-    directory_path = os.path.join(base_dir, "resources", "satellite_listings")
-    discovery_dir = os.path.join(base_dir, "resources", "to_be_discovered")
-    
-    
-    file_name = os.path.join(directory_path, f"full_satellite_listing_{port}.csv")
-    discovery_file = os.path.join(discovery_dir, f"to_be_discovered_{port}.csv")
-    
-    os.makedirs(directory_path, exist_ok=True)
-    os.makedirs(discovery_dir, exist_ok=True)
-    
     # Calculate the number of satellites to move to the to-be-discovered list (5% of the total)
     total_satellites = len(starter_satellite_list)
     discovery_count = max(1, int(total_satellites * 0.05))  # Ensure at least 1 satellite is selected
@@ -133,23 +110,12 @@ def get_neighbouring_satellites():
     # print(f"[DEBUG] Remaining satellites: {len(remaining_satellites)}")
     # Write the remaining satellites to the full satellite listing file
     try:
-        with open(file_name, "w", newline="") as csvfile:
-            # print(f"[DEBUG] Writing full satellite listing to {file_name}")
-            fieldnames = ["IPv4", "Port", "Contact Time", "Device Function"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(remaining_satellites)  # Write the remaining satellites to the file
-            csvfile.close()
+        write_listing(FULL_SATELLITE_LISTING, remaining_satellites, port)
     except Exception as e:
         print(f"[ERROR] Failed to write full satellite listing: {e}")
     # Write the to-be-discovered satellites to the discovery file
     try:
-        with open(discovery_file, "w", newline="") as csvfile:
-            # print(f"[DEBUG] Writing to_be_discovered list to {discovery_file}")
-            fieldnames = ["IPv4", "Port", "Contact Time", "Device Function"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(to_be_discovered)  # Write the to-be-discovered satellites to the file
+        write_listing(TO_BE_DISCOVERED, to_be_discovered, port)
     except Exception as e:
         print(f"[ERROR] Failed to write to_be_discovered list: {e}")
 
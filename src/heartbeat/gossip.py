@@ -0,0 +1,111 @@
+"""
+Delta heartbeats.
+
+Every constellation entry carries a version, which its satellite increments whenever anything
+but its freshness changes. Each satellite remembers which version of every entry it last
+delivered to each neighbour, and only sends the entries that changed since. The freshness of
+every entry is still sent with each heartbeat, as a compact map of { id: [version, freshness] },
+so satellites keep seeing that the others are alive. A receiver that finds an entry in the map
+with a version it doesn't have answers with its ID in "missing", and the entry is resent on the
+next heartbeat. Every HEARTBEAT_FULL_SYNC_ROUNDS heartbeats the whole constellation is sent
+again, in case anything was lost along the way.
+
+Entries from satellites that predate versions are all version 0, and only compared by freshness,
+so a new freshness may come with new content. They are resent whenever their freshness
+advanced, and the freshness map never updates them on its own.
+"""
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+heartbeat_full_sync_rounds = int(os.getenv("HEARTBEAT_FULL_SYNC_ROUNDS", 10))
+
+
+def entry_version(entry: dict) -> int:
+    # Entries from satellites that predate versions are all version 0, and compared by freshness
+    return entry.get("version", 0)
+
+
+def next_version(previous: Optional[dict], entry: dict) -> int:
+    """Version of our own entry, which only changes if anything but its freshness changed"""
+    if previous is None:
+        return 1
+    if {**previous, "freshness": None, "version": None} == {**entry, "freshness": None, "version": None}:
+        return entry_version(previous)
+    return entry_version(previous) + 1
+
+
+def delivery_stamp(entry: dict):
+    """What is remembered of a delivered entry, which must change for it to be sent again"""
+    version = entry_version(entry)
+    return version if version > 0 else (0, entry["freshness"])
+
+
+def freshness_map(constellation: Dict[str, dict]) -> Dict[str, List[int]]:
+    return {
+        node_id: [entry_version(entry), entry["freshness"]]
+        for node_id, entry in constellation.items()
+    }
+
+
+def apply_freshness(our_constellation: Dict[str, dict], received_freshness: Dict[str, List[int]]) -> Tuple[Set[str], List[str]]:
+    """
+    Bring the freshness of our entries up to date with a received freshness map.
+    Returns the IDs of the entries that were updated, and of those we don't have the version of.
+    """
+    changed = set()
+    missing = []
+    for node_id, (version, freshness) in received_freshness.items():
+        entry = our_constellation.get(node_id)
+        if entry is None or entry_version(entry) < version:
+            missing.append(node_id)
+        elif version > 0 and entry_version(entry) == version and freshness > entry["freshness"]:
+            # Copied rather than modified in place, as route engines hold on to the previous entries
+            our_constellation[node_id] = {**entry, "freshness": freshness}
+            changed.add(node_id)
+    return changed, missing
+
+
+class GossipState:
+    """Versions of the entries last delivered to each neighbour, see delivery_stamp()"""
+
+    def __init__(self, full_sync_rounds: int = heartbeat_full_sync_rounds):
+        self.full_sync_rounds = full_sync_rounds
+        self.rounds = 0
+        self._delivered: Dict[str, Dict[str, object]] = {}
+        self._lock = threading.Lock()
+
+    def begin_round(self) -> bool:
+        """Start a heartbeat round, returning whether it should send the whole constellation"""
+        with self._lock:
+            full_sync = self.rounds % self.full_sync_rounds == 0
+            self.rounds += 1
+            return full_sync
+
+    def delta(self, neighbour_id: str, constellation: Dict[str, dict], full_sync: bool) -> Dict[str, dict]:
+        """The entries of constellation the neighbour doesn't have yet, or all of them on a full sync"""
+        with self._lock:
+            delivered = self._delivered.get(neighbour_id)
+        if full_sync or delivered is None:
+            return constellation
+        return {
+            node_id: entry
+            for node_id, entry in constellation.items()
+            if delivered.get(node_id) != delivery_stamp(entry)
+        }
+
+    def delivered(self, neighbour_id: str, constellation: Dict[str, dict], missing: Iterable[str] = ()):
+        """Record that the neighbour has acknowledged constellation, except for the missing entries"""
+        versions = {node_id: delivery_stamp(entry) for node_id, entry in constellation.items()}
+        for node_id in missing:
+            versions.pop(node_id, None)
+        with self._lock:
+            self._delivered[neighbour_id] = versions
+
+    def forget(self, neighbour_id: str):
+        """Send the whole constellation to the neighbour next time, e.g. after it timed out"""
+        with self._lock:
+            self._delivered.pop(neighbour_id, None)
+
+
+gossip_state = GossipState()
@@ -8,9 +8,19 @@ import threading
 import time
 import random
 import csv
+from concurrent.futures import ThreadPoolExecutor
 
 from src.config.constants import MAX_TIMEOUT, X_BOBB_HEADER
-from src.routing.route_generator import create_routing_tables
+from src.helpers import http_client
+from src.heartbeat.gossip import apply_freshness, freshness_map, gossip_state, next_version
+from src.heartbeat.neighbour_table import get_neighbour_table
+from src.helpers.state_store import TO_BE_DISCOVERED, add_to_blocklist, read_blocklist, read_constellation, \
+    read_listing, remove_from_listing, write_constellation
+from src.routing.contact_plan import gossiped_rtt, read_contact_plan, upcoming_windows
+from src.routing.areas import area_entries, hierarchical_routing, in_area, merge_area_summaries, \
+    read_area_summaries, routing_area, summarise_area, write_area_summaries
+from src.routing.forwarding_load import forwarding_load
+from src.routing.route_generator import create_routing_tables, merge_constellation
 from src.utils.headers.necessary_headers import BobbHeaders
 from src.helpers.send_handshake_helper import send_handshake
 
@@ -20,10 +30,11 @@ app = Flask(__name__)
 our_port = os.getenv("PORT")
 our_ip = os.getenv("IP")
 
-proxies = {
-  'http': '',
-  'https': '',
-}
+# Heartbeats are sent to this many neighbours at once, so unreachable ones don't hold up the round
+heartbeat_workers = int(os.getenv("HEARTBEAT_WORKERS", 16))
+heartbeat_timeout = float(os.getenv("HEARTBEAT_TIMEOUT", 3))
+# Timing of the last heartbeat round, see send_heartbeat_to_neighbours()
+last_heartbeat_round = {}
 
 # ******** Remove THIS WHEN ACTUALLY RUNNING *****
 # our_port = 33001
@@ -77,88 +88,79 @@ if not os.path.exists(to_be_discovered_csv):
 #         json.dump(data, f, indent=4)
 
 
-def update_last_contact(ip, port):
+def update_last_contact(ip, port, rtt=None):
     """
     Updates the last_contact time for the given neighbour (identified by IP and port)
-    in the neighbours_<our_port>.json file.
+    in the neighbours_<our_port>.json file, and its smoothed RTT if one was measured.
     """
+    update_last_contacts({(ip, port): rtt})
 
-    # neighbours_data = safe_load_json(neighbours_file)
-    with open(neighbours_file, 'r') as f:
-        neighbours_data = json.load(f)
-    
-    for neighbour in neighbours_data:
-        if neighbour['ip'] == ip and neighbour['port'] == port:
-            neighbour['last_contact'] = int(time.time())
-            break
-    
-    # safe_save_json(neighbours_file, neighbours_data)
-    with open(neighbours_file, 'w') as f:
-        json.dump(neighbours_data, f, indent=4)
+
+def update_last_contacts(contacts):
+    """
+    Updates the last_contact time of several neighbours at once, given as {(ip, port): rtt},
+    in the neighbour table, which writes them to the neighbours_<our_port>.json file later.
+    """
+    get_neighbour_table(our_port).record_contacts(contacts)
 
 def heartbeat():
+    # Reported to the sender, which takes it off the round trip time it measures for the link
+    processing_start = time.perf_counter()
     received_constellation = request.json.get("constellation", {}) if request.json else {}
+    # Only the entries that changed are sent, along with the freshness of all of them, see gossip.py
+    received_freshness = request.json.get("freshness", {}) if request.json else {}
 
     # Load our existing constellation data
-    constellation_file = f'resources/satellite_constellation_set/constellation_{our_port}.json'
-    try:
-        with open(constellation_file, 'r') as f:
-            our_constellation = json.load(f)
-            f.close()
-    except (FileNotFoundError, json.JSONDecodeError):
-        our_constellation = {}
+    our_constellation = read_constellation(our_port)
+
+    if hierarchical_routing:
+        # Only our own area is kept in full, other areas are known from their summaries
+        received_constellation = area_entries(received_constellation, routing_area)
+        received_freshness = {
+            node_id: freshness for node_id, freshness in received_freshness.items()
+            if node_id in received_constellation or node_id in our_constellation
+        }
+        our_summaries = read_area_summaries(our_port)
+        received_summaries = request.json.get("area_summaries", {}) if request.json else {}
+        if merge_area_summaries(our_summaries, received_summaries, routing_area):
+            write_area_summaries(our_port, our_summaries)
 
     # Update constellation data based on received information
-    for node_id, node_data in received_constellation.items():
-        # If node doesn't exist in our constellation, add it
-        if node_id not in our_constellation:
-            our_constellation[node_id] = node_data
-        # If node exists and received data is fresher
-        elif node_data['freshness'] > our_constellation[node_id]['freshness']:
-            # Compare neighbours data excluding freshness
-            current_neighbours = our_constellation[node_id]['neighbours']
-            new_neighbours = node_data['neighbours']
-
-            if current_neighbours != new_neighbours:
-                # Update entire node data if there are changes
-                our_constellation[node_id] = node_data
-            else:
-                # Only update freshness if no other changes
-                our_constellation[node_id]['freshness'] = node_data['freshness']
-
+    changed = merge_constellation(our_constellation, received_constellation)
+    freshened, missing = apply_freshness(our_constellation, received_freshness)
 
-    # Save the updated constellation data
+    # Save the updated constellation data, if anything changed
 
     # safe_save_json(constellation_file, our_constellation)
-    with open(constellation_file, 'w') as f:
-        json.dump(our_constellation, f, indent=4)
+    if changed or freshened:
+        write_constellation(our_constellation, changed | freshened, our_port)
 
     try:
-        create_routing_tables()
+        # Other satellites on this host rebuild their own tables when they receive heartbeats
+        create_routing_tables(port=our_port)
     except Exception as e:
         # Log the exception or handle it appropriately
         print(f"An error occurred while creating routing tables: {e}")
 
-    return jsonify({"message": "Constellation data processed"}), 200
+    # The sender resends the entries we don't have the latest version of
+    processing_ms = (time.perf_counter() - processing_start) * 1000
+    return jsonify({"message": "Constellation data processed", "missing": missing, "processing_ms": processing_ms}), 200
 
 
 def send_heartbeat_to_neighbours():
 
-    # Load neighbours from the JSON file
-    try:
-        with open(neighbours_file) as f:
-            raw_neighbours = json.load(f)
-    except FileNotFoundError:
-        return # If no neighbours, we don't care
+    # Load neighbours from the neighbour table
+    neighbour_table = get_neighbour_table(our_port)
+    raw_neighbours = neighbour_table.all()
     
-    with open(blocklist_file, 'r') as f:
-        blocklist = json.load(f)
+    blocklist = read_blocklist(our_port)
     
     # Initialize neighbours dictionary from the provided JSON format
     neighbours = {}
     current_time = int(time.time())
-    neighbour_urls = set()
-    valid_neighbours = []
+    # Heartbeat URL of each neighbour, and its ID
+    neighbour_urls = {}
+    contact_plan = read_contact_plan(our_port)
     
     for neighbour in raw_neighbours:
         if neighbour in blocklist:  # Skip blocklisted neighbours
@@ -172,31 +174,28 @@ def send_heartbeat_to_neighbours():
                 "function": neighbour["function"],
                 "last_contact": neighbour["last_contact"],
             }
-
-            neighbour_urls.add(f'https://{neighbour["ip"]}:{neighbour["port"]}/heartbeat')
-            valid_neighbours.append(neighbour)
+            # Measured latency and predicted visibility of the link, for contact plan routes
+            if "rtt" in neighbour:
+                neighbours[neighbour_id]["rtt"] = neighbour["rtt"]
+            contact_windows = upcoming_windows(contact_plan.get(neighbour_id, []), current_time)
+            if contact_windows:
+                neighbours[neighbour_id]["contact_windows"] = contact_windows
+
+            neighbour_urls[f'https://{neighbour["ip"]}:{neighbour["port"]}/heartbeat'] = neighbour_id
         else:
             # Remove neighbours that have timed out
             print(f"Neighbour {neighbour['ip']}:{neighbour['port']} has timed out and will be removed.")
-
-    # Save the updated list of valid neighbours
-    # safe_save_json(neighbours_file, valid_neighbours)
-        with open(neighbours_file, 'w') as f:
-            json.dump(valid_neighbours, f, indent=4)
+            neighbour_table.remove(neighbour['ip'], neighbour['port'])
+            gossip_state.forget(f"{neighbour['ip']}:{neighbour['port']}")
     
     # print(f"Neighbours : {neighbours}")
     # print(f'Neighbours urls: {neighbour_urls}')
     
-    # Define directory and file paths
-    constellation_dir = 'resources/satellite_constellation_set'
-    constellation_file = f'{constellation_dir}/constellation_{our_port}.json'
-    
-    # Check if directory exists, if not create it
-    if not os.path.exists(constellation_dir):
-        os.makedirs(constellation_dir)
+    # Load our constellation, which is empty before our first heartbeat
+    constellation_data = read_constellation(our_port)
 
-    # Check if the constellation JSON file exists
-    if not os.path.exists(constellation_file):
+    # Check if we have a constellation yet
+    if not constellation_data:
         # Create the initial data structure
         satellite_id = f"{our_ip}:{our_port}"
         current_time = int(time.time())
@@ -204,36 +203,71 @@ def send_heartbeat_to_neighbours():
         satellite_data = {
             satellite_id: {
                 "freshness": current_time,
-                "neighbours": list(neighbours.values())
+                "version": 1,
+                "neighbours": list(neighbours.values()),
+                "load": forwarding_load.snapshot()
             }
         }
+        if hierarchical_routing:
+            satellite_data[satellite_id]["area"] = routing_area
         # Write to the file
-        with open(constellation_file, 'w') as f:
-            json.dump(satellite_data, f, indent=4)
+        write_constellation(satellite_data, satellite_data.keys(), our_port)
         
         # Assign the initial data to constellation_data
         constellation_data = satellite_data
     else:
-        # File exists, read the existing data
-        with open(constellation_file, 'r') as f:
-            constellation_data = json.load(f)
-        
         # Our satellite ID
         satellite_id = f"{our_ip}:{our_port}"
         current_time = int(time.time())
 
-        # Update our satellite's neighbours
-        constellation_data[satellite_id] = {
+        # Update our satellite's neighbours, and the traffic we forwarded for load balancing
+        satellite_data = {
             "freshness": current_time,
-            "neighbours": neighbours
+            "neighbours": neighbours,
+            "load": forwarding_load.snapshot()
         }
+        # Keep gossiping the RTTs we gossiped before, unless they changed noticeably since
+        previous_links = constellation_data.get(satellite_id, {}).get("neighbours")
+        if isinstance(previous_links, dict):
+            for neighbour_id, link in neighbours.items():
+                if "rtt" in link and neighbour_id in previous_links:
+                    link["rtt"] = gossiped_rtt(previous_links[neighbour_id].get("rtt"), link["rtt"])
+        if hierarchical_routing:
+            satellite_data["area"] = routing_area
+        satellite_data["version"] = next_version(constellation_data.get(satellite_id), satellite_data)
+        constellation_data[satellite_id] = satellite_data
 
         # Write the updated constellation data back to the JSON file
-        with open(constellation_file, 'w') as f:
-            json.dump(constellation_data, f, indent=4)
+        write_constellation(constellation_data, {satellite_id}, our_port)
                 
-    # Send POST requests to all neighbour URLs
-    for url in neighbour_urls:
+    if hierarchical_routing:
+        area_summaries = read_area_summaries(our_port)
+        area_summaries[routing_area] = summarise_area(constellation_data, routing_area)
+        area_body = {
+            "constellation": area_entries(constellation_data, routing_area),
+            "area_summaries": area_summaries
+        }
+        # Satellites in other areas only need the summaries. Our own entry is still sent, as a neighbour
+        # we have no entry for may be in our area but not know about us yet
+        border_body = {
+            "constellation": {satellite_id: constellation_data[satellite_id]},
+            "area_summaries": area_summaries
+        }
+    else:
+        area_body = border_body = {"constellation": constellation_data}
+    area_body["freshness"] = freshness_map(area_body["constellation"])
+    border_body["freshness"] = freshness_map(border_body["constellation"])
+
+    full_sync = gossip_state.begin_round()
+
+    def send_heartbeat(url):
+        """Send a heartbeat to one neighbour, returning its IP and port and the RTT, or None if it failed"""
+        neighbour_id = neighbour_urls[url]
+        neighbour_entry = constellation_data.get(neighbour_id)
+        same_area = neighbour_entry is not None and in_area(neighbour_entry, routing_area)
+        body = area_body if same_area else border_body
+        # Only send the entries that changed since the neighbour last acknowledged them
+        delta_body = {**body, "constellation": gossip_state.delta(neighbour_id, body["constellation"], full_sync)}
         try:            
             header = BobbHeaders(message_type=1, source_ipv4=our_ip,
                          source_port=int(our_port)).build_header().hex()
@@ -242,15 +276,12 @@ def send_heartbeat_to_neighbours():
             }
 
             # Send handshake
-            response = requests.post(
+            response = http_client.post(
 
                 url, 
-                verify=False,  # Already set
-
-                timeout=3,
-                proxies=proxies,
+                timeout=heartbeat_timeout,
                 headers=headers,
-                json={"constellation": constellation_data},
+                json=delta_body,
                 allow_redirects=True
             )
 
@@ -264,12 +295,46 @@ def send_heartbeat_to_neighbours():
                 neighbour_ip = url_components[1].replace('//', '')
                 neighbour_port = int(url_components[2].split('/')[0])
 
-                # Update last_contact for this neighbour
-                update_last_contact(neighbour_ip, neighbour_port)
+                try:
+                    response_body = response.json()
+                except ValueError:
+                    response_body = {}
+                missing = response_body.get("missing", [])
+                gossip_state.delivered(neighbour_id, body["constellation"], missing)
+
+                # The response only comes back once the neighbour has processed the heartbeat, which
+                # says more about how busy it is than about the link. Neighbours that don't report
+                # their processing time give no RTT
+                processing_ms = response_body.get("processing_ms")
+                rtt = None
+                if processing_ms is not None:
+                    rtt = max(response.elapsed.total_seconds() * 1000 - processing_ms, 0)
+                return (neighbour_ip, neighbour_port), rtt
             else:
                 print(f"Failed to send heartbeat to {url}. Status code: {response.status_code}")
         except requests.RequestException as e:
             print(f"Error sending heartbeat to {url}: {e}")
+        return None
+
+    # Send POST requests to all neighbour URLs at once
+    round_start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, min(heartbeat_workers, len(neighbour_urls)))) as executor:
+        results = [result for result in executor.map(send_heartbeat, neighbour_urls) if result is not None]
+    round_duration = (time.time() - round_start) * 1000
+
+    # Update last_contact for the neighbours that answered, and the RTT of the links to them
+    contacts = dict(results)
+    if contacts:
+        update_last_contacts(contacts)
+
+    last_heartbeat_round.update({
+        "started": int(round_start),
+        "duration_ms": round(round_duration),
+        "neighbours": len(neighbour_urls),
+        "delivered": len(contacts),
+        "slowest_ms": round(max((rtt for rtt in contacts.values() if rtt is not None), default=0))
+    })
+    print(f"[INFO] Heartbeat round took {round_duration:.0f} ms, {len(contacts)}/{len(neighbour_urls)} neighbours answered.")
 
 
 def manage_neighbours():
@@ -279,39 +344,25 @@ def manage_neighbours():
     # while True:
     # time.sleep(10)
     # print("[DEBUG] Loading neighbours and blocklist files.")
-    with open(neighbours_file, 'r') as f:
-        neighbours = json.load(f)
-    with open(blocklist_file, 'r') as f:
-        blocklist = json.load(f)
+    neighbour_table = get_neighbour_table(own_port)
+    neighbours = neighbour_table.all()
     #if neighbours:
     if len(neighbours) > 3:
         #print(f"[DEBUG] Neighbours list before removal: {neighbours}")
         removed_neighbour = random.choice(neighbours)
-        neighbours.remove(removed_neighbour)
+        neighbour_table.remove(removed_neighbour['ip'], removed_neighbour['port'])
         # print(removed_neighbour)
         print(f"[INFO] The neighbour with IP {own_ip} and port {own_port} removed the neighbour with IP {removed_neighbour['ip']} and port {removed_neighbour['port']}.")
         #print(f"[DEBUG] Removed neighbour: {removed_neighbour}")
-        # Check if the neighbour is already in the blocklist before adding
-        if not any(
-                n["ip"] == removed_neighbour["ip"] and
-                n["port"] == removed_neighbour["port"] and
-                n["public_key"] == removed_neighbour["public_key"]
-                for n in blocklist
-        ):
-            blocklist.append(removed_neighbour)
-            # print(f"[DEBUG] Added to blocklist: {removed_neighbour}")
-        with open(neighbours_file, 'w') as f:
-            json.dump(neighbours, f, indent=4)
-        with open(blocklist_file, 'w') as f:
-            json.dump(blocklist, f, indent=4)
+        # Only added if the neighbour isn't already in the blocklist
+        add_to_blocklist(removed_neighbour, own_port)
     else:
          print("[INFO] Skipping removal to avoid empty neighbour list.")
     # time.sleep(10)
-    if os.path.exists(to_be_discovered_csv):
+    try:
         # print("[DEBUG] Loading to_be_discovered CSV.")
-        with open(to_be_discovered_csv, 'r') as f:
-            to_be_discovered = list(csv.DictReader(f))
-    else:
+        to_be_discovered = read_listing(TO_BE_DISCOVERED, own_port)
+    except FileNotFoundError:
         # print("[DEBUG] to_be_discovered CSV not found. Initializing empty list.")
         to_be_discovered = []
     if to_be_discovered:
@@ -330,8 +381,5 @@ def manage_neighbours():
         # with open(neighbours_file, 'w') as f:
         #     json.dump(neighbours, f, indent=4)
         # print(f"[DEBUG] Updated neighbours list: {neighbours}")
-        with open(to_be_discovered_csv, 'w', newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=new_neighbour.keys())
-            writer.writeheader()
-            writer.writerows(to_be_discovered)
+        remove_from_listing(TO_BE_DISCOVERED, new_neighbour, own_port)
         # print(f"[DEBUG] Updated to_be_discovered list: {to_be_discovered}")
\ No newline at end of file
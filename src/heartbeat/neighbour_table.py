@@ -0,0 +1,149 @@
+"""
+In-memory table of a device's neighbours.
+
+The neighbours used to be read from and written back to neighbours_<port>.json by every
+heartbeat response, handshake and neighbour management job, each racing the others from its
+own scheduler or request thread. The table now lives in memory behind a lock, and is written
+to that file in the background: NEIGHBOUR_FLUSH_INTERVAL seconds after the first change since
+the last write, which covers every change made in the meantime, and when the process exits.
+With STATE_STORE=sqlite only the neighbours that changed are written, to the device's state
+store (see src/helpers/state_store.py) rather than to the file.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.helpers.state_store import StateStore, get_state_store, neighbours_file_path, use_state_store
+from src.routing.contact_plan import smoothed_rtt
+
+neighbour_flush_interval = float(os.getenv("NEIGHBOUR_FLUSH_INTERVAL", 5))
+
+
+class NeighbourTable:
+    def __init__(self, path: str, flush_interval: float = neighbour_flush_interval, store: Optional[StateStore] = None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.store = store
+        self._neighbours: Optional[List[dict]] = None
+        self._dirty = False
+        # Neighbours updated and removed since the last write, which are all that is written to a store
+        self._updated: Set[Tuple[str, int]] = set()
+        self._removed: Set[Tuple[str, int]] = set()
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+
+    def _load(self) -> List[dict]:
+        if self._neighbours is None and self.store is not None:
+            self._neighbours = self.store.neighbours()
+        elif self._neighbours is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self._neighbours = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._neighbours = []
+        return self._neighbours
+
+    def all(self) -> List[dict]:
+        """Copy of every neighbour, in the order they were added"""
+        with self._lock:
+            return [dict(neighbour) for neighbour in self._load()]
+
+    def addresses(self) -> List[Tuple[str, int]]:
+        with self._lock:
+            return [(neighbour["ip"], neighbour["port"]) for neighbour in self._load()]
+
+    def add(self, neighbour: dict) -> bool:
+        """Add a neighbour, returning False if there already is one with its IP and port"""
+        with self._lock:
+            neighbours = self._load()
+            if any(n["ip"] == neighbour["ip"] and n["port"] == neighbour["port"] for n in neighbours):
+                return False
+            neighbours.append(dict(neighbour))
+            self._changed(neighbour["ip"], neighbour["port"])
+            return True
+
+    def remove(self, ip: str, port: int) -> bool:
+        with self._lock:
+            neighbours = self._load()
+            remaining = [n for n in neighbours if not (n["ip"] == ip and n["port"] == port)]
+            if len(remaining) == len(neighbours):
+                return False
+            self._neighbours = remaining
+            self._changed(ip, port, removed=True)
+            return True
+
+    def record_contacts(self, contacts: Dict[Tuple[str, int], Optional[float]]):
+        """
+        Set the last_contact time of the neighbours that answered, given as {(ip, port): rtt},
+        and update their smoothed RTT if one was measured.
+        """
+        current_time = int(time.time())
+        with self._lock:
+            for neighbour in self._load():
+                key = (neighbour["ip"], neighbour["port"])
+                if key in contacts:
+                    neighbour["last_contact"] = current_time
+                    if contacts[key] is not None:
+                        neighbour["rtt"] = smoothed_rtt(neighbour.get("rtt"), contacts[key])
+                    self._changed(*key)
+
+    def _changed(self, ip: str, port: int, removed: bool = False):
+        self._dirty = True
+        if removed:
+            self._updated.discard((ip, port))
+            self._removed.add((ip, port))
+        else:
+            self._removed.discard((ip, port))
+            self._updated.add((ip, port))
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write the table to its file now, if it changed since it was last written"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            if self.store is not None:
+                self.store.delete_neighbours(self._removed)
+                self.store.upsert_neighbours(
+                    n for n in self._neighbours if (n["ip"], n["port"]) in self._updated
+                )
+            else:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(f"{self.path}.tmp", 'w') as f:
+                    json.dump(self._neighbours, f, indent=4)
+                os.replace(f"{self.path}.tmp", self.path)
+            self._updated.clear()
+            self._removed.clear()
+            self._dirty = False
+
+
+# One table per device port, see get_neighbour_table()
+_neighbour_tables: Dict[Optional[str], NeighbourTable] = {}
+_neighbour_tables_lock = threading.Lock()
+
+
+def get_neighbour_table(port: Optional[str] = None) -> NeighbourTable:
+    """The neighbour table of the device on port, by default this device"""
+    port = str(port) if port is not None else os.getenv("PORT")
+    with _neighbour_tables_lock:
+        table = _neighbour_tables.get(port)
+        if table is None:
+            store = get_state_store(port) if use_state_store else None
+            table = NeighbourTable(neighbours_file_path(port), store=store)
+            _neighbour_tables[port] = table
+        return table
+
+
+@atexit.register
+def flush_neighbour_tables():
+    for table in list(_neighbour_tables.values()):
+        table.flush()
@@ -3,8 +3,8 @@ from src.utils.handshake_body import SatelliteHandshake
 from src.utils.headers.necessary_headers import BobbHeaders
 from src.config.constants import X_BOBB_HEADER
 from src.helpers.response_helper import create_response
+from src.heartbeat.neighbour_table import get_neighbour_table
 import json
-import os
 
 
 def create_handshake_message(name, device_function, public_key, port, ip):
@@ -46,30 +46,6 @@ def write_received_handshake(handshake_data, bobb_header):
 
 
 def write_to_json(source_ip, device_function, public_key, port, timestamp):
-    # Get file path for storing neighbor data
-    own_port = os.getenv("PORT")
-    base_dir = os.getcwd()
-    directory_path = os.path.join(
-        base_dir, "resources", "satellite_neighbours")
-    file_name = os.path.join(directory_path, f"neighbours_{own_port}.json")
-    os.makedirs(directory_path, exist_ok=True)
-
-    # Load existing data if the JSON file exists
-    if os.path.isfile(file_name):
-        with open(file_name, "r") as json_file:
-            try:
-                neighbors = json.load(json_file)
-            except json.JSONDecodeError:
-                # Reset neighbors if file is corrupted
-                neighbors = []
-    else:
-        neighbors = []
-
-    # Check if the neighbor (source_ip, port) combination already exists
-    for neighbor in neighbors:
-        if neighbor["ip"] == source_ip and neighbor["port"] == port:
-            return False  # Neighbor already exists
-
     # Flexible validation for required fields
     if source_ip is None or port is None:
         print("Error: Missing required fields in neighbour.")
@@ -84,10 +60,6 @@ def write_to_json(source_ip, device_function, public_key, port, timestamp):
         "last_contact": timestamp
     }
 
-    # Append the new neighbor and save back to JSON
-    neighbors.append(new_neighbor)
-
-    with open(file_name, "w") as json_file:
-        json.dump(neighbors, json_file, indent=4)
-
-    return True
+    # Add the new neighbor to the neighbour table, which saves it back to JSON.
+    # Returns False if the neighbor (source_ip, port) combination already exists
+    return get_neighbour_table().add(new_neighbor)
@@ -0,0 +1,49 @@
+"""
+Shared HTTP client for all traffic between devices.
+
+Every request used to open a new connection, so each message between two Pis paid for a TCP
+and a TLS handshake, which took longer than the request itself. All requests now go through
+one session, which keeps a pool of open connections to each peer and reuses them across
+requests and threads.
+"""
+import os
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+# Certificates aren't verified yet, see create_session()
+urllib3.disable_warnings()
+
+# Number of peers connections are kept open to, and number of connections kept open to each of them
+http_pool_peers = int(os.getenv("HTTP_POOL_PEERS", 32))
+http_pool_size = int(os.getenv("HTTP_POOL_SIZE", 8))
+# Used for requests that don't set their own timeout. Images are relayed synchronously hop by hop,
+# so waiting for a response can take much longer than connecting
+http_connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3))
+http_read_timeout = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+
+
+def create_session(pool_peers: int = http_pool_peers, pool_size: int = http_pool_size) -> requests.Session:
+    session = requests.Session()
+    # To block the SCSS proxying, to connect directly to the other pis
+    session.trust_env = False
+    # TODO allow self signed certificates
+    session.verify = False
+    adapter = HTTPAdapter(pool_connections=pool_peers, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+session = create_session()
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("timeout", (http_connect_timeout, http_read_timeout))
+    return session.get(url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("timeout", (http_connect_timeout, http_read_timeout))
+    return session.post(url, **kwargs)
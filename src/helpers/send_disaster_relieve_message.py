@@ -4,10 +4,12 @@ import json
 import os
 import random
 
-import requests
-
 from src.config.constants import SATELLITE_FUNCTION_DISASTER_IMAGING, X_BOBB_HEADER
+from src.helpers import http_client
+from src.helpers.state_store import read_constellation
 from src.routing.find_best_route import find_best_route
+from src.routing.reachability import reachability
+from src.routing.source_routing import route_headers
 from src.utils.headers.necessary_headers import BobbHeaders
 
 CITY_LIST = [
@@ -35,9 +37,7 @@ def get_random_city():
 
 def get_random_basestation(port):
 
-    with open(f"resources/satellite_constellation_set/constellation_{port}.json", "r") as f:
-        data = json.load(f)
-        f.close()
+    data = read_constellation(port)
 
     base_stations = []
 
@@ -75,14 +75,19 @@ def send_disaster_relieve_message():
     header = BobbHeaders(message_type=1, source_ipv4=source_ip,
                 source_port=int(source_port), dest_ipv4=basestation["ip"], dest_port=int(basestation["port"])).build_header().hex()
 
+    if not reachability.reachable(f"{source_ip}:{source_port}", f"{basestation['ip']}:{basestation['port']}"):
+        print("Base station is unreachable")
+        return
+
     route_info = find_best_route(f"{source_ip}:{source_port}", f"{basestation['ip']}:{basestation['port']}", "high")
     if not route_info:
         print("No route found")
         return
 
-    headers = {
+    # Send the whole route along, so the satellites on the way don't need to look it up
+    headers = route_headers({
         X_BOBB_HEADER: header,
-    }
+    }, route_info["path"], 0)
 
     with open("src/helpers/Valencia_Spain.jpg", "rb") as image_file:
         encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
@@ -150,5 +155,5 @@ def send_disaster_relieve_message():
     print(json_output)
 
     print(f"Sending disaster relieve message to {basestation['ip']}:{basestation['port']}")
-    response = requests.post(f"https://{route_info['path'][0]}/image", headers=headers, verify=False, json=json_output)
+    response = http_client.post(f"https://{route_info['path'][0]}/image", headers=headers, json=json_output)
     print(response.status_code)
@@ -1,22 +1,14 @@
 # Written by Claire, modified by Patrick, 
 import os
-import csv
 import json
-import requests
+from src.helpers import http_client
 from src.utils.headers.necessary_headers import BobbHeaders
 from src.config.constants import X_BOBB_HEADER
 from src.config.config import CONFIG_FILE_PATH
 from src.helpers.general_handshake_helper import create_handshake_message, write_received_handshake
+from src.heartbeat.neighbour_table import get_neighbour_table
+from src.helpers.state_store import FULL_SATELLITE_LISTING, read_listing
 
-# TODO allow self signed certificates
-import urllib3
-urllib3.disable_warnings()
-
-# To block the SCSS proxying, to connect directly to the other pis
-proxies = {
-  'http': '',
-  'https': '',
-}
 
 def send_handshakes():
     try:
@@ -47,7 +39,7 @@ def send_handshake(neighbour):
             handshake_body, headers = create_handshake_message(name, function, public_key, port, ip)
 
             # Send handshake
-            resp = requests.post(f"https://{n_ip}:{n_port}/handshake", verify=False, timeout=3, proxies=proxies, headers=headers, json=handshake_body)
+            resp = http_client.post(f"https://{n_ip}:{n_port}/handshake", timeout=3, headers=headers, json=handshake_body)
 
             # Deal with response from handshake - another handshake
             data = resp.json()["data"]
@@ -58,40 +50,17 @@ def send_handshake(neighbour):
 def get_known_satellites():
     ip_port_pairs = []
 
-    port = os.getenv("PORT")
-    base_dir = os.getcwd()
-    directory_path = os.path.join(base_dir, "resources", "satellite_listings")
-    file_name = os.path.join(directory_path, f"full_satellite_listing_{port}.csv")
-    
-    with open(file_name, mode="r", newline="") as csv_file:
-        reader = csv.DictReader(csv_file)
+    for row in read_listing(FULL_SATELLITE_LISTING):
+        # Extract the IP and Port values
+        ipv4 = row.get("IPv4")
+        port = int(row.get("Port"))
         
-        for row in reader:
-            # Extract the IP and Port values
-            ipv4 = row.get("IPv4")
-            port = int(row.get("Port"))
-            
-            # Add IPv4 and Port if both are present
-            if ipv4 and port:
-                ip_port_pairs.append((ipv4, port))
+        # Add IPv4 and Port if both are present
+        if ipv4 and port:
+            ip_port_pairs.append((ipv4, port))
     
     return ip_port_pairs
 
 def get_neighbours():
-    # Get file path for reading neighbor data
-    own_port = os.getenv("PORT")
-    base_dir = os.getcwd()
-    file_name = os.path.join(base_dir, "resources", "satellite_neighbours", f"neighbours_{own_port}.json")
-    
-    # Check if file exists
-    if not os.path.isfile(file_name):
-        return []  # Return an empty list if the file doesn't exist
-
-    # Load the JSON data
-    with open(file_name, "r") as json_file:
-        neighbors = json.load(json_file)
-
-    # Extract (ip, port) combinations
-    ip_port_combinations = [(neighbor["ip"], neighbor["port"]) for neighbor in neighbors]
-
-    return ip_port_combinations
+    # Extract (ip, port) combinations from the neighbour table
+    return get_neighbour_table().addresses()
@@ -0,0 +1,486 @@
+"""
+SQLite store for a device's neighbours, blocklist, satellite listings, constellation and routes.
+
+With STATE_STORE=sqlite this state is kept in resources/state/state_<port>.db, in WAL mode so
+request handlers and scheduler jobs can read it while another thread writes, instead of each
+loading and rewriting a whole JSON or CSV file. Changes are point updates of the affected rows:
+a heartbeat only writes the constellation entries it changed, and a routing table build only
+the destinations whose routes changed. The first time a device opens its database, whatever is
+in its existing files is imported.
+
+Readers of the constellation and of routing tables used to detect changes by the files' stamps.
+Every write of the constellation, and of each source's routes, now increments a version counter
+in the same transaction, which is what constellation_stamp() and route_stamp() return.
+
+The read_*/write_* functions below use the database or the files, depending on STATE_STORE.
+"""
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+state_store_backend = os.getenv("STATE_STORE", "files").lower()
+use_state_store = state_store_backend == "sqlite"
+
+# Satellite listings, with the same columns as their CSV files
+FULL_SATELLITE_LISTING = "full_satellite_listing"
+TO_BE_DISCOVERED = "to_be_discovered"
+LISTING_FIELDS = ["IPv4", "Port", "Contact Time", "Device Function"]
+
+SCHEMA_VERSION = 2
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS neighbours (
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    last_contact INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (ip, port)
+);
+CREATE INDEX IF NOT EXISTS neighbours_position ON neighbours (position);
+CREATE TABLE IF NOT EXISTS blocklist (
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    public_key TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (ip, port, public_key)
+);
+CREATE TABLE IF NOT EXISTS listings (
+    listing TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    contact_time TEXT,
+    function TEXT,
+    PRIMARY KEY (listing, ip, port)
+);
+CREATE INDEX IF NOT EXISTS listings_position ON listings (listing, position);
+CREATE TABLE IF NOT EXISTS constellation (
+    node_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    freshness INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS constellation_position ON constellation (position);
+CREATE TABLE IF NOT EXISTS routes (
+    source TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    routes TEXT NOT NULL,
+    ranked TEXT NOT NULL,
+    PRIMARY KEY (source, destination)
+);
+CREATE TABLE IF NOT EXISTS route_versions (
+    source TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+
+def state_db_path(port: Optional[str]) -> str:
+    return os.path.join("resources", "state", f"state_{port}.db")
+
+
+def constellation_file_path(port: Optional[str]) -> str:
+    return os.path.join("resources", "satellite_constellation_set", f"constellation_{port}.json")
+
+
+def constellation_path(port: Optional[str]) -> str:
+    """Where the constellation of the device on port is kept: its state store, or its file"""
+    return state_db_path(port) if use_state_store else constellation_file_path(port)
+
+
+def neighbours_file_path(port: Optional[str]) -> str:
+    return os.path.join("resources", "satellite_neighbours", f"neighbours_{port}.json")
+
+
+def blocklist_file_path(port: Optional[str]) -> str:
+    return os.path.join("resources", "satellite_blocklists", f"blocklist_{port}.json")
+
+
+def listing_file_path(port: Optional[str], listing: str) -> str:
+    directory = "satellite_listings" if listing == FULL_SATELLITE_LISTING else "to_be_discovered"
+    return os.path.join("resources", directory, f"{listing}_{port}.csv")
+
+
+class StateStore:
+    def __init__(self, path: str):
+        self.path = path
+        # sqlite3 connections can't be shared between threads, so each thread opens its own
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = self._connection()
+        # WAL mode is stored in the database, so readers never wait for a writer
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            connection.executescript(SCHEMA)
+            connection.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),)
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # Constellation
+
+    def constellation(self) -> Dict[str, dict]:
+        """Every constellation entry, in the order they were added"""
+        rows = self._connection().execute("SELECT node_id, data FROM constellation ORDER BY position")
+        return {node_id: json.loads(data) for node_id, data in rows}
+
+    def constellation_version(self) -> int:
+        """Incremented by every write of the constellation"""
+        return int(self.get_meta("constellation_version") or 0)
+
+    def write_constellation(self, entries: Dict[str, dict]):
+        """Add or replace constellation entries, keeping the position of the ones already stored"""
+        with self._connection() as connection:
+            for node_id, entry in entries.items():
+                connection.execute(
+                    "INSERT INTO constellation (node_id, position, version, freshness, data) "
+                    "VALUES (?, (SELECT COALESCE(MAX(position), 0) + 1 FROM constellation), ?, ?, ?) "
+                    "ON CONFLICT (node_id) DO UPDATE SET "
+                    "version = excluded.version, freshness = excluded.freshness, data = excluded.data",
+                    (node_id, entry.get("version", 0), entry["freshness"], json.dumps(entry))
+                )
+            connection.execute(
+                "INSERT INTO meta (key, value) VALUES ('constellation_version', '1') "
+                "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+            )
+
+    # Routes
+
+    def route_version(self, source: str) -> int:
+        """Incremented by every write of the routes from source that changed any of them"""
+        row = self._connection().execute("SELECT version FROM route_versions WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else 0
+
+    def route_destinations(self, source: str) -> List[str]:
+        rows = self._connection().execute("SELECT destination FROM routes WHERE source = ?", (source,))
+        return [destination for (destination,) in rows]
+
+    def routes_to(self, source: str, destination: str) -> Optional[Tuple[List[dict], Dict[str, List[int]]]]:
+        """Routes from source to destination and their ranking, None if there are none"""
+        row = self._connection().execute(
+            "SELECT routes, ranked FROM routes WHERE source = ? AND destination = ?", (source, destination)
+        ).fetchone()
+        return (json.loads(row[0]), json.loads(row[1])) if row else None
+
+    def write_routes(self, source: str, routes: Dict[str, List[dict]], ranked: Dict[str, Dict[str, List[int]]]) -> bool:
+        """
+        Replace the routes from source, only writing the destinations whose routes or ranking changed.
+        Returns True if any did.
+        """
+        digests = {
+            destination: hashlib.blake2b(
+                json.dumps([dest_routes, ranked[destination]], sort_keys=True).encode("utf-8"), digest_size=8
+            ).hexdigest()
+            for destination, dest_routes in routes.items()
+        }
+        with self._connection() as connection:
+            stored = dict(connection.execute(
+                "SELECT destination, digest FROM routes WHERE source = ?", (source,)
+            ).fetchall())
+            changed = [destination for destination, digest in digests.items() if stored.get(destination) != digest]
+            removed = [destination for destination in stored if destination not in digests]
+            if not changed and not removed:
+                return False
+
+            connection.executemany(
+                "INSERT OR REPLACE INTO routes (source, destination, digest, routes, ranked) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (source, destination, digests[destination],
+                     json.dumps(routes[destination]), json.dumps(ranked[destination]))
+                    for destination in changed
+                ]
+            )
+            connection.executemany(
+                "DELETE FROM routes WHERE source = ? AND destination = ?",
+                [(source, destination) for destination in removed]
+            )
+            connection.execute(
+                "INSERT INTO route_versions (source, version) VALUES (?, 1) "
+                "ON CONFLICT (source) DO UPDATE SET version = version + 1",
+                (source,)
+            )
+            return True
+
+    # Neighbours
+
+    def neighbours(self) -> List[dict]:
+        rows = self._connection().execute("SELECT data FROM neighbours ORDER BY position")
+        return [json.loads(data) for (data,) in rows]
+
+    def upsert_neighbours(self, neighbours: Iterable[dict]):
+        """Add or update neighbours, keeping the position of the ones already stored"""
+        with self._connection() as connection:
+            for neighbour in neighbours:
+                connection.execute(
+                    "INSERT INTO neighbours (ip, port, position, last_contact, data) "
+                    "VALUES (?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM neighbours), ?, ?) "
+                    "ON CONFLICT (ip, port) DO UPDATE SET last_contact = excluded.last_contact, data = excluded.data",
+                    (neighbour["ip"], neighbour["port"], neighbour["last_contact"], json.dumps(neighbour))
+                )
+
+    def delete_neighbours(self, addresses: Iterable[Tuple[str, int]]):
+        with self._connection() as connection:
+            connection.executemany("DELETE FROM neighbours WHERE ip = ? AND port = ?", list(addresses))
+
+    # Blocklist
+
+    def blocklist(self) -> List[dict]:
+        return [json.loads(data) for (data,) in self._connection().execute("SELECT data FROM blocklist")]
+
+    def add_to_blocklist(self, neighbour: dict) -> bool:
+        """Blocklist a neighbour, returning False if it already was"""
+        with self._connection() as connection:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO blocklist (ip, port, public_key, data) VALUES (?, ?, ?, ?)",
+                (neighbour["ip"], neighbour["port"], neighbour["public_key"], json.dumps(neighbour))
+            )
+            return cursor.rowcount == 1
+
+    # Satellite listings
+
+    def listing(self, listing: str) -> List[Dict[str, str]]:
+        """Rows of a listing, as they would be read from its CSV file"""
+        rows = self._connection().execute(
+            "SELECT ip, port, contact_time, function FROM listings WHERE listing = ? ORDER BY position", (listing,)
+        )
+        return [
+            dict(zip(LISTING_FIELDS, (ip, str(port), contact_time or "", function or "")))
+            for ip, port, contact_time, function in rows
+        ]
+
+    def replace_listing(self, listing: str, rows: Iterable[dict]):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM listings WHERE listing = ?", (listing,))
+            connection.executemany(
+                "INSERT OR REPLACE INTO listings (listing, ip, port, position, contact_time, function) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (listing, row["IPv4"], int(row["Port"]), position,
+                     str(row.get("Contact Time") or ""), row.get("Device Function"))
+                    for position, row in enumerate(rows)
+                ]
+            )
+
+    def remove_from_listing(self, listing: str, ip: str, port: int):
+        with self._connection() as connection:
+            connection.execute(
+                "DELETE FROM listings WHERE listing = ? AND ip = ? AND port = ?", (listing, ip, int(port))
+            )
+
+    def migrate_from_files(self, port: Optional[str]):
+        """Import the state kept in the files of the device on port, once"""
+        if not self.get_meta("migrated_constellation_from_file"):
+            # Stores created before the constellation was kept in them have imported everything else already
+            try:
+                with open(constellation_file_path(port), 'r') as f:
+                    self.write_constellation(json.load(f))
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+            self.set_meta("migrated_constellation_from_file", "1")
+
+        if self.get_meta("migrated_from_files"):
+            return
+
+        try:
+            with open(neighbours_file_path(port), 'r') as f:
+                self.upsert_neighbours(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        try:
+            with open(blocklist_file_path(port), 'r') as f:
+                for neighbour in json.load(f):
+                    self.add_to_blocklist(neighbour)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        for listing in (FULL_SATELLITE_LISTING, TO_BE_DISCOVERED):
+            try:
+                with open(listing_file_path(port, listing), 'r', newline="") as f:
+                    self.replace_listing(listing, csv.DictReader(f))
+            except FileNotFoundError:
+                pass
+
+        self.set_meta("migrated_from_files", "1")
+
+
+# One store per device port, see get_state_store()
+_state_stores: Dict[Optional[str], StateStore] = {}
+_state_stores_lock = threading.Lock()
+
+
+def get_state_store(port: Optional[str] = None) -> StateStore:
+    """The state store of the device on port, by default this device"""
+    port = str(port) if port is not None else os.getenv("PORT")
+    with _state_stores_lock:
+        store = _state_stores.get(port)
+        if store is None:
+            store = StateStore(state_db_path(port))
+            store.migrate_from_files(port)
+            _state_stores[port] = store
+        return store
+
+
+def _is_state_db(path: str) -> bool:
+    return path.endswith(".db")
+
+
+def state_store_at(path: str) -> StateStore:
+    # Databases are named after the port of their device, see state_db_path()
+    return get_state_store(os.path.basename(path)[len("state_"):-len(".db")])
+
+
+def file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_ino
+
+
+def constellation_stamp(path: str) -> Optional[Tuple[int, int]]:
+    """
+    Changes whenever the constellation at path (see constellation_path()) is written: the version
+    of a state store's constellation, or the stamp of a file. None if it was never written.
+    """
+    if _is_state_db(path):
+        version = state_store_at(path).constellation_version()
+        return (version, 0) if version else None
+    return file_stamp(path)
+
+
+def load_constellation(path: str) -> Dict[str, dict]:
+    """The constellation at path, see constellation_path()"""
+    if _is_state_db(path):
+        return state_store_at(path).constellation()
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def read_constellation(port: Optional[str] = None) -> Dict[str, dict]:
+    """The constellation of the device on port, empty if it has none yet"""
+    try:
+        return load_constellation(constellation_path(port if port is not None else os.getenv("PORT")))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_constellation(constellation: Dict[str, dict], changed: Collection[str], port: Optional[str] = None):
+    """Save the constellation of the device on port, in which the entries in changed were added or modified"""
+    if use_state_store:
+        get_state_store(port).write_constellation({node_id: constellation[node_id] for node_id in changed})
+        return
+
+    path = constellation_file_path(port if port is not None else os.getenv("PORT"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Swapped in whole, as route engines, reachability checks and lazy lookups read it from other threads.
+    # Heartbeats from several neighbours write it at once, so each writes its own temporary file
+    temporary_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temporary_path, 'w') as f:
+        json.dump(constellation, f, indent=4)
+    os.replace(temporary_path, path)
+
+
+def route_store_path(source: str) -> Optional[str]:
+    """
+    State store the routes from source are kept in: that of the source's own device if it runs on
+    this host, as every device stores its own routes, or else this device's, which has the routes
+    from every source in full mode. None if neither has any.
+    """
+    for port in dict.fromkeys((source.rsplit(":", 1)[-1], os.getenv("PORT"))):
+        path = state_db_path(port)
+        if port is not None and os.path.exists(path) and state_store_at(path).route_version(source):
+            return path
+    return None
+
+
+def route_stamp(path: str, source: str) -> Tuple[int, int]:
+    """Changes whenever the routes from source in the state store at path change"""
+    return state_store_at(path).route_version(source), 0
+
+
+def read_blocklist(port: Optional[str] = None) -> List[dict]:
+    if use_state_store:
+        return get_state_store(port).blocklist()
+    with open(blocklist_file_path(port if port is not None else os.getenv("PORT")), 'r') as f:
+        return json.load(f)
+
+
+def add_to_blocklist(neighbour: dict, port: Optional[str] = None) -> bool:
+    """Blocklist a neighbour, returning False if one with the same IP, port and public key already was"""
+    if use_state_store:
+        return get_state_store(port).add_to_blocklist(neighbour)
+
+    path = blocklist_file_path(port if port is not None else os.getenv("PORT"))
+    with open(path, 'r') as f:
+        blocklist = json.load(f)
+    if any(
+            n["ip"] == neighbour["ip"] and
+            n["port"] == neighbour["port"] and
+            n["public_key"] == neighbour["public_key"]
+            for n in blocklist
+    ):
+        return False
+    blocklist.append(neighbour)
+    with open(path, 'w') as f:
+        json.dump(blocklist, f, indent=4)
+    return True
+
+
+def read_listing(listing: str, port: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    Rows of a satellite listing, as read from its CSV file.
+    Raises FileNotFoundError if the listing was never written and is kept in files.
+    """
+    if use_state_store:
+        return get_state_store(port).listing(listing)
+    with open(listing_file_path(port if port is not None else os.getenv("PORT"), listing), 'r', newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def write_listing(listing: str, rows: List[dict], port: Optional[str] = None):
+    if use_state_store:
+        get_state_store(port).replace_listing(listing, rows)
+        return
+
+    path = listing_file_path(port if port is not None else os.getenv("PORT"), listing)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=LISTING_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def remove_from_listing(listing: str, row: dict, port: Optional[str] = None):
+    if use_state_store:
+        get_state_store(port).remove_from_listing(listing, row["IPv4"], row["Port"])
+        return
+
+    rows = [
+        other for other in read_listing(listing, port)
+        if not (other["IPv4"] == row["IPv4"] and str(other["Port"]) == str(row["Port"]))
+    ]
+    write_listing(listing, rows, port)
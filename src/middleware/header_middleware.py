@@ -2,12 +2,15 @@
 from flask import request, g
 from src.utils.headers.necessary_headers import BobbHeaders
 from src.utils.headers.optional_header import BobbOptionalHeaders
+from src.utils.headers.route_header import BobbRouteHeader
 from src.helpers.response_helper import create_response
 from src.config.constants import (
     X_BOBB_HEADER,
     X_BOBB_OPTIONAL_HEADER,
+    X_BOBB_ROUTE_HEADER,
     ERROR_INVALID_BOBB_HEADER,
-    ERROR_INVALID_OPTIONAL_HEADER
+    ERROR_INVALID_OPTIONAL_HEADER,
+    ERROR_INVALID_ROUTE_HEADER
 )
 
 
@@ -41,6 +44,17 @@ def check_headers():
    # else:
         #return create_response({"error": ERROR_INVALID_OPTIONAL_HEADER}, 400)
 
+    # Parse BobbRouteHeader, only present on source routed messages
+    route_header = request.headers.get(X_BOBB_ROUTE_HEADER)
+    if route_header:
+        try:
+            route = BobbRouteHeader()
+            g.bobb_route_header = route.parse_route_header(bytes.fromhex(route_header))
+        except Exception as e:
+            return create_response({"error": ERROR_INVALID_ROUTE_HEADER, "details": str(e)}, 400)
+    else:
+        g.bobb_route_header = None
+
     # print(f"Bobb Header: {g.bobb_header}")
     # print(f"Bobb Optional Header: {g.bobb_optional_header}")
 
@@ -1,14 +1,16 @@
 # Written by Aryan, modified by Niels, Patrick, Claire
-import csv
 import random
-from flask import Blueprint, app, jsonify, request  # Add request here
+from flask import Blueprint, app, g, jsonify, request  # Add request here
 import base64
 import json
 import os
+import re
 import requests
 
 from src.config.constants import SATELLITE_FUNCTION_DISASTER_IMAGING, BASESTATION
 from src.controllers.create_headers import create_header
+from src.helpers import http_client
+from src.helpers.state_store import FULL_SATELLITE_LISTING, read_listing
 from src.controllers.hello import hello
 from src.controllers.identify import return_identity
 from src.controllers.handshake import handshake
@@ -16,12 +18,42 @@ from src.heartbeat.heartbeat import heartbeat
 from src.middleware.header_middleware import check_headers, extract_bobb_headers
 from enum import Enum
 from typing import Dict, List, Optional, Tuple
-from src.routing.find_best_route import find_alternate_route, find_best_route, simulate_satellite_failure
+from src.routing.find_best_route import get_forwarding_table, get_routing_table, query_route, \
+    simulate_satellite_failure
+from src.routing.forwarding_load import forwarding_load
+from src.routing.reachability import reachability
+from src.routing.routing_table_versions import RoutingTableVersions, versions_file_path
+from src.routing.source_routing import next_hop_from_route, route_headers
 
 
 
 router = Blueprint('main', __name__)
 
+# Fields of a /route result returned unless the request selects others
+ROUTE_RESPONSE_FIELDS = [
+    "source", "destination", "original_route", "working_route",
+    "failed_satellites", "route_type", "route_metrics", "attempt_number"
+]
+# Fields of a /route result that are only returned when selected
+ROUTE_OPTIONAL_FIELDS = ["routing_table"]
+# Destinations per page of GET /routing_table
+ROUTING_TABLE_PAGE_SIZE = 50
+# Satellite IDs given in requests, which routing table files are named after
+SATELLITE_ID_PATTERN = re.compile(r"[A-Za-z0-9.\-]+:[0-9]{1,5}")
+
+
+def is_satellite_id(value) -> bool:
+    """Whether value is an "ip:port" satellite ID, so it can't point outside resources/"""
+    return isinstance(value, str) and SATELLITE_ID_PATTERN.fullmatch(value) is not None
+
+
+def invalid_satellite_id_response(name: str):
+    return jsonify({
+        "status": "error",
+        "message": f"{name} must be a satellite ID, ip:port",
+        "status_code": 400
+    }), 400
+
 
 # In routers/__main__.py
 
@@ -93,31 +125,35 @@ def call_satellite_from_whale():
         # Add current satellite to hops
         hops.append(current_satellite)
 
-        # Read satellite listings file
-        listings_file = f"resources/satellite_listings/full_satellite_listing_{current_port}.csv"
-        available_satellites = []
+        # Forward towards the destination if our forwarding table knows the way
+        try:
+            next_satellite = get_forwarding_table(current_satellite).next_hop(destination, avoid=hops)
+        except FileNotFoundError:
+            next_satellite = None
+
+        if next_satellite is None:
+            # Read satellite listings
+            available_satellites = []
 
-        with open(listings_file, 'r') as f:
-            csv_reader = csv.DictReader(f)
-            for row in csv_reader:
+            for row in read_listing(FULL_SATELLITE_LISTING, current_port):
                 satellite_id = f"{row['IPv4']}:{row['Port']}"
                 if satellite_id not in hops:  # Only add satellites we haven't visited
                     available_satellites.append(satellite_id)
 
-        if not available_satellites:
-            return jsonify({
-                "status": "error",
-                "message": "No available satellites found",
-                "status_code": 404
-            }), 404
+            if not available_satellites:
+                return jsonify({
+                    "status": "error",
+                    "message": "No available satellites found",
+                    "status_code": 404
+                }), 404
 
-        # Choose random satellite
-        random_satellite = random.choice(available_satellites)
+            # Choose random satellite
+            next_satellite = random.choice(available_satellites)
 
         try:
-            # Forward the request to random satellite with timeout
-            forward_response = requests.post(
-                f"https://{random_satellite}/call_satellite_from_whale",
+            # Forward the request to the next satellite with timeout
+            forward_response = http_client.post(
+                f"https://{next_satellite}/call_satellite_from_whale",
                 json={
                     "source": source,
                     "destination": destination,
@@ -128,15 +164,14 @@ def call_satellite_from_whale():
                     'Content-Type': 'application/json',
                     'X-Bobb-Header': request.headers.get('X-Bobb-Header')
                 },
-                verify=False,
-                proxies={'http': '', 'https': ''},
                 timeout=5  # 5 second timeout
             )
+            forwarding_load.record(next_satellite, len(request.get_data()))
 
             return jsonify({
                 "status": "success",
                 "data": {
-                    "forwarded_to": random_satellite,
+                    "forwarded_to": next_satellite,
                     "forward_response": forward_response.json(),
                     "hops": hops
                 },
@@ -146,13 +181,13 @@ def call_satellite_from_whale():
         except requests.Timeout:
             return jsonify({
                 "status": "error",
-                "message": f"Timeout while forwarding to {random_satellite}",
+                "message": f"Timeout while forwarding to {next_satellite}",
                 "status_code": 408
             }), 408
         except requests.RequestException as e:
             return jsonify({
                 "status": "error",
-                "message": f"Error forwarding to {random_satellite}: {str(e)}",
+                "message": f"Error forwarding to {next_satellite}: {str(e)}",
                 "status_code": 500
             }), 500
 
@@ -182,18 +217,52 @@ def route_message():
         source = body["source"]
         destination = body["destination"]
         message = body["message"]
+        if not is_satellite_id(source):
+            return invalid_satellite_id_response("source")
+        if not is_satellite_id(destination):
+            return invalid_satellite_id_response("destination")
         priority = body.get("priority", "medium")
         failed_satellites = body.get("failed_satellites", [])
         max_attempts = 3  # Maximum number of complete route attempts
+        # Which fields of the result to return. The routing table can be megabytes, so it is only
+        # included when asked for - GET /routing_table pages through it instead
+        fields = body.get("fields", ROUTE_RESPONSE_FIELDS)
+        if not isinstance(fields, list) or any(
+                not isinstance(field, str) or field not in ROUTE_RESPONSE_FIELDS + ROUTE_OPTIONAL_FIELDS
+                for field in fields
+        ):
+            return jsonify({
+                "status": "error",
+                "message": f"fields must be a list of: {', '.join(ROUTE_RESPONSE_FIELDS + ROUTE_OPTIONAL_FIELDS)}",
+                "status_code": 400
+            }), 400
+        if body.get("include_routing_table") and "routing_table" not in fields:
+            fields = list(fields) + ["routing_table"]
+
+        # No attempt can succeed if the destination is in another partition of the constellation
+        if not reachability.reachable(source, destination):
+            return jsonify({
+                "status": "error",
+                "message": f"No path exists between {source} and {destination}",
+                "failed_satellites": failed_satellites,
+                "attempts_made": 0,
+                "status_code": 404
+            }), 404
 
+        attempts_made = 0
         for attempt in range(max_attempts):
             # print(f"Attempt {attempt + 1} of {max_attempts}")
+            attempts_made = attempt + 1
 
-            # Try to find a route
-            route_info = find_best_route(source, destination, priority)
+            # Try the best route that avoids every satellite that has failed so far
+            try:
+                route_info = query_route(source, destination, priority, failed_satellites)
+            except Exception as e:
+                print(f"Error finding route: {str(e)}")
+                route_info = None
 
             if not route_info:
-                continue  # Try next attempt if no route found
+                break  # No route survives the failures, so further attempts can't find one either
 
             current_path = route_info["path"]
             working_path = []
@@ -203,47 +272,50 @@ def route_message():
             for hop in current_path:
                 if simulate_satellite_failure(hop):
                     # print(f"Satellite {hop} failed on attempt {attempt + 1}")
+                    if hop == destination:
+                        # Excluding the destination would leave no route at all, so try it again next attempt
+                        route_failed = True
+                        break
                     failed_satellites.append(hop)
 
-                    # Try up to 3 alternate routes from last working point
-                    for alternate_attempt in range(3):
-                        last_working = working_path[-1] if working_path else source
-                        alternate_route = find_alternate_route(
-                            last_working,
-                            destination,
-                            failed_satellites,
-                            priority
-                        )
-
-                        if alternate_route:
-                            # print(f"Found alternate route on attempt {alternate_attempt + 1}")
-                            working_path.extend(alternate_route["path"])
-                            route_info = alternate_route
-                            route_failed = False
-                            break
-                        else:
-                            route_failed = True
-
-                    if route_failed:
-                        break  # Try next complete route attempt
+                    # Continue on the best route from the last working point that avoids every failed
+                    # satellite, which is found in its forwarding table
+                    last_working = working_path[-1] if working_path else source
+                    try:
+                        alternate_route = query_route(last_working, destination, priority, failed_satellites)
+                    except Exception as e:
+                        print(f"Error finding alternate route: {str(e)}")
+                        alternate_route = None
+
+                    if alternate_route:
+                        # The alternate route takes us to the destination
+                        working_path.extend(alternate_route["path"])
+                        route_info = alternate_route
+                    else:
+                        route_failed = True
+                    # The rest of the original route is abandoned either way
+                    break
                 else:
                     working_path.append(hop)
 
             # If we have a working path, return it
             if not route_failed and working_path:
+                forwarding_load.record(working_path[0], len(request.get_data()))
+                result = {
+                    "source": source,
+                    "destination": destination,
+                    "original_route": current_path,
+                    "working_route": working_path,
+                    "failed_satellites": failed_satellites,
+                    "route_type": route_info["type"],
+                    "route_metrics": route_info["metrics"],
+                    "attempt_number": attempt + 1
+                }
+                if "routing_table" in fields:
+                    result["routing_table"] = get_routing_table(source).routes
                 return jsonify({
                     "status": "success",
-                    "data": {
-                        "source": source,
-                        "destination": destination,
-                        "original_route": current_path,
-                        "working_route": working_path,
-                        "failed_satellites": failed_satellites,
-                        "route_type": route_info["type"],
-                        "route_metrics": route_info["metrics"],
-                        "routing_table": route_info["routing_table"],
-                        "attempt_number": attempt + 1
-                    },
+                    "data": {field: result[field] for field in fields if field in result},
                     "status_code": 200
                 }), 200
 
@@ -252,7 +324,7 @@ def route_message():
             "status": "error",
             "message": "All route attempts failed",
             "failed_satellites": failed_satellites,
-            "attempts_made": max_attempts,
+            "attempts_made": attempts_made,
             "status_code": 503
         }), 503
 
@@ -265,6 +337,104 @@ def route_message():
 
 
 
+@router.route('/routing_table', methods=['GET'])
+def routing_table_page():
+    """
+    Page through the routes from a satellite, by default our own, a few destinations at a time.
+    Query parameters: source, offset, limit.
+    """
+    middleware_response = check_headers()
+    if middleware_response is not True:
+        return middleware_response
+
+    source = request.args.get("source", f"{os.getenv('IP')}:{os.getenv('PORT')}")
+    if not is_satellite_id(source):
+        return invalid_satellite_id_response("source")
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit = min(max(int(request.args.get("limit", ROUTING_TABLE_PAGE_SIZE)), 1), ROUTING_TABLE_PAGE_SIZE)
+    except ValueError:
+        return jsonify({
+            "status": "error",
+            "message": "offset and limit must be integers",
+            "status_code": 400
+        }), 400
+
+    try:
+        routing_table = get_routing_table(source)
+    except FileNotFoundError:
+        return jsonify({
+            "status": "error",
+            "message": f"No routing table for {source}",
+            "status_code": 404
+        }), 404
+
+    destinations = sorted(routing_table.destinations())
+    page = destinations[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(destinations) else None
+    return jsonify({
+        "status": "success",
+        "data": {
+            "source": source,
+            # Pages of different generations come from different tables
+            "generation": routing_table.generation,
+            "version": RoutingTableVersions.load(versions_file_path(source)).version,
+            "routes": {destination: routing_table.routes_to(destination) for destination in page},
+            "offset": offset,
+            "limit": limit,
+            "total": len(destinations),
+            "next_offset": next_offset
+        },
+        "status_code": 200
+    }), 200
+
+
+@router.route('/routing_table/changes', methods=['GET'])
+def routing_table_changes():
+    """
+    Routes to the destinations whose ranked routes changed since the version a client last saw,
+    and the destinations that were removed. Query parameters: source, since (default 0, everything).
+    """
+    middleware_response = check_headers()
+    if middleware_response is not True:
+        return middleware_response
+
+    source = request.args.get("source", f"{os.getenv('IP')}:{os.getenv('PORT')}")
+    if not is_satellite_id(source):
+        return invalid_satellite_id_response("source")
+    try:
+        since = int(request.args.get("since", 0))
+    except ValueError:
+        return jsonify({
+            "status": "error",
+            "message": "since must be an integer",
+            "status_code": 400
+        }), 400
+
+    versions = RoutingTableVersions.load(versions_file_path(source))
+    try:
+        routing_table = get_routing_table(source)
+    except FileNotFoundError:
+        return jsonify({
+            "status": "error",
+            "message": f"No routing table for {source}",
+            "status_code": 404
+        }), 404
+
+    changed, removed = versions.changes_since(since)
+    return jsonify({
+        "status": "success",
+        "data": {
+            "source": source,
+            # Pass this as since on the next poll
+            "version": versions.version,
+            "changed": {destination: routing_table.routes_to(destination) for destination in changed},
+            "removed": removed
+        },
+        "status_code": 200
+    }), 200
+
+
 @router.route('/', methods=['GET'])
 def root():
     middleware_response = check_headers()
@@ -328,17 +498,49 @@ def receive_image():
             "status_code": 200
         }), 200
 
-    route_info = find_best_route(f"{current_ip}:{current_port}", f"{dest_ip}:{dest_port}", "high")
-    if not route_info:
-        return jsonify({
-            "status": "error",
-            "message": f"No route found between {current_ip}:{current_port} and {dest_ip}:{dest_port}",
-            "status_code": 404
-        }), 404
+    current_id = f"{current_ip}:{current_port}"
+    dest_id = f"{dest_ip}:{dest_port}"
+
+    def forward_image(next_hop: str, path: Optional[List[str]] = None, cursor: int = 0):
+        print("Sending image to: ", next_hop)
+        response = http_client.post(f"https://{next_hop}/image", headers=route_headers(request.headers, path, cursor),
+                                    json=request.json)
+        forwarding_load.record(next_hop, len(request.get_data()))
+        return response
+
+    failed_hops = []
+    # Images carry the route chosen by the satellite they came from, so only look one up if they don't
+    source_route = next_hop_from_route(g.bobb_route_header, current_id)
+    if source_route is not None:
+        path, cursor = source_route
+        try:
+            return forward_image(path[cursor], path, cursor).json()
+        except requests.RequestException as e:
+            print(f"Error sending image to {path[cursor]}: {e}")
+            failed_hops.append(path[cursor])
 
-    print("Sending image to: ", route_info["path"][0])
-    response = requests.post(f"https://{route_info['path'][0]}/image", headers=request.headers, verify=False, json=request.json)
-    return response.json()
+    # Otherwise forward hop by hop, trying the next best hop whenever one is down
+    next_hops = []
+    if reachability.reachable(current_id, dest_id):
+        try:
+            next_hops = get_forwarding_table(current_id).next_hops(dest_id, "high")
+        except FileNotFoundError as e:
+            print(f"Error finding route: {str(e)}")
+
+    for next_hop in next_hops:
+        if next_hop in failed_hops:
+            continue
+        try:
+            return forward_image(next_hop).json()
+        except requests.RequestException as e:
+            print(f"Error sending image to {next_hop}: {e}")
+            failed_hops.append(next_hop)
+
+    return jsonify({
+        "status": "error",
+        "message": f"No route found between {current_id} and {dest_id}",
+        "status_code": 404
+    }), 404
 
 
 # Base station routes
@@ -0,0 +1,79 @@
+"""
+Two-level routing areas.
+
+With HIERARCHICAL_ROUTING=true every device belongs to an area (ROUTING_AREA, by default its
+function), and only keeps the full constellation entries of its own area. Between areas just
+a summary of each area is gossiped: its members, and the links its border satellites have to
+satellites of other areas. Routes inside an area are generated as usual. Routes to other areas
+lead to the nearest border link towards them, and are continued by the satellites there.
+
+Summaries are kept in resources/area_summaries/area_summaries_<port>.json as
+    { area: { "freshness": int, "members": [id, ...], "links": { border id: [id in another area, ...] } } }
+"""
+import json
+import os
+from typing import Dict, Optional
+
+hierarchical_routing = os.getenv("HIERARCHICAL_ROUTING", "false").lower() == "true"
+routing_area = os.getenv("ROUTING_AREA") or os.getenv("DEVICE_FUNCTION")
+
+
+def area_summaries_file_path(port: Optional[str]) -> str:
+    return os.path.join("resources", "area_summaries", f"area_summaries_{port}.json")
+
+
+def read_area_summaries(port: Optional[str]) -> Dict[str, dict]:
+    try:
+        with open(area_summaries_file_path(port), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_area_summaries(port: Optional[str], summaries: Dict[str, dict]):
+    path = area_summaries_file_path(port)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(summaries, f, indent=4)
+    os.replace(f"{path}.tmp", path)
+
+
+def in_area(entry: dict, area: str) -> bool:
+    # Devices that don't declare an area predate areas, so they are kept like before
+    return entry.get("area", area) == area
+
+
+def area_entries(constellation: Dict[str, dict], area: str) -> Dict[str, dict]:
+    """The constellation entries of the satellites in area"""
+    return {sat_id: entry for sat_id, entry in constellation.items() if in_area(entry, area)}
+
+
+def summarise_area(constellation: Dict[str, dict], area: str) -> dict:
+    """Summary of area from the full entries of its satellites"""
+    entries = area_entries(constellation, area)
+    links = {}
+    for sat_id, entry in entries.items():
+        foreign_ids = sorted(neighbour_id for neighbour_id in entry["neighbours"] if neighbour_id not in entries)
+        if foreign_ids:
+            links[sat_id] = foreign_ids
+    return {
+        "freshness": max((entry["freshness"] for entry in entries.values()), default=0),
+        "members": sorted(entries),
+        "links": links
+    }
+
+
+def merge_area_summaries(our_summaries: Dict[str, dict], received_summaries: Dict[str, dict], area: str) -> bool:
+    """
+    Merge received summaries into ours, keeping the freshest summary of each area.
+    Our own area is summarised from its full entries instead. Returns True if any summary was replaced.
+    """
+    updated = False
+    for summary_area, summary in received_summaries.items():
+        if summary_area == area:
+            continue
+        ours = our_summaries.get(summary_area)
+        if ours is None or summary["freshness"] > ours["freshness"]:
+            our_summaries[summary_area] = summary
+            updated = True
+    return updated
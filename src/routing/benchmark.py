@@ -0,0 +1,99 @@
+"""
+Benchmark route generation on synthetic constellations of increasing size.
+
+    python3 -m src.routing.benchmark --sizes 50 100 200 400 --degree 4
+
+With --workers N the full matrix is also generated across N processes and timed.
+"""
+import argparse
+import random
+import time
+from typing import Dict
+
+from src.config.constants import BASESTATION, SATELLITE_FUNCTION_DISASTER_IMAGING, SATELLITE_FUNCTION_WHALE_TRACKING
+from src.routing.route_generator import RouteGenerator, generate_pairs_parallel, generate_routes_from_source
+
+
+def synthetic_constellation(size: int, degree: int = 4, seed: int = 0) -> Dict[str, dict]:
+    """
+    Build a constellation in the heartbeat format with `size` nodes.
+    Nodes form a ring (so the constellation is connected) plus random extra links,
+    giving each node at least `degree` neighbours.
+    """
+    rng = random.Random(seed)
+    functions = [SATELLITE_FUNCTION_DISASTER_IMAGING, SATELLITE_FUNCTION_WHALE_TRACKING, BASESTATION]
+    node_ids = [f"10.35.{i // 100}.{i % 100}:{33001 + i % 100}" for i in range(size)]
+    node_functions = {node_id: rng.choice(functions) for node_id in node_ids}
+
+    links = {node_id: set() for node_id in node_ids}
+    for position, node_id in enumerate(node_ids):
+        links[node_id].add(node_ids[(position + 1) % size])
+        while len(links[node_id]) < min(degree, size - 1):
+            other_id = rng.choice(node_ids)
+            if other_id != node_id:
+                links[node_id].add(other_id)
+
+    now = int(time.time())
+    constellation = {}
+    for node_id in node_ids:
+        constellation[node_id] = {
+            "freshness": now - rng.randint(0, 60),
+            "neighbours": {
+                neighbour_id: {
+                    "ip": neighbour_id.split(":")[0],
+                    "port": int(neighbour_id.split(":")[1]),
+                    "public_key": "-----BEGIN PUBLIC KEY-----\n-----END PUBLIC KEY-----\n",
+                    "function": node_functions[neighbour_id],
+                    "last_contact": now,
+                }
+                for neighbour_id in sorted(links[node_id])
+            }
+        }
+    return constellation
+
+
+def benchmark(size: int, degree: int, sources: int, workers: int = 1) -> Dict[str, float]:
+    constellation = synthetic_constellation(size, degree)
+    generator = RouteGenerator(constellation=constellation)
+
+    source_ids = list(generator.satellites)[:sources]
+    start = time.perf_counter()
+    for source_id in source_ids:
+        generate_routes_from_source(generator, source_id)
+    per_source = (time.perf_counter() - start) / len(source_ids)
+
+    result = {
+        "per_source_ms": per_source * 1000,
+        # Every source is equally expensive on a synthetic constellation, so extrapolate
+        "full_matrix_s": per_source * size,
+    }
+
+    if workers > 1:
+        pairs = {
+            (source_id, dest_id)
+            for source_id in generator.satellites
+            for dest_id in generator.satellites
+            if source_id != dest_id
+        }
+        start = time.perf_counter()
+        generate_pairs_parallel(constellation, pairs, pairs, workers)
+        result["parallel_full_matrix_s"] = time.perf_counter() - start
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark route generation")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 100, 200, 400], help='Constellation sizes')
+    parser.add_argument('--degree', type=int, default=4, help='Minimum neighbours per node')
+    parser.add_argument('--sources', type=int, default=5, help='Sources to time per size')
+    parser.add_argument('--workers', type=int, default=1, help='Also time the full matrix across this many processes')
+    args = parser.parse_args()
+
+    print(f"{'nodes':>6} {'own-source (ms)':>16} {'full matrix (s)':>16}"
+          + (f" {'parallel (s)':>13}" if args.workers > 1 else ""))
+    for size in args.sizes:
+        result = benchmark(size, args.degree, args.sources, args.workers)
+        line = f"{size:>6} {result['per_source_ms']:>16.1f} {result['full_matrix_s']:>16.2f}"
+        if args.workers > 1:
+            line += f" {result['parallel_full_matrix_s']:>13.2f}"
+        print(line)
@@ -0,0 +1,245 @@
+"""
+Compact binary routing table format.
+
+The JSON routing tables are dominated by indentation and repeated "ip:port" strings, and have
+to be parsed completely before any route can be read. This format interns every string
+(satellite IDs, route types, metric names) into a table of integer IDs, stores paths as small
+integer arrays, and keeps an index of where each (source, destination) record starts. Readers
+mmap the file and only decode the record they need, so processes on the same host share the
+file through the page cache instead of each holding a parsed copy.
+
+Layout (all integers big-endian):
+    header      magic, ID width (2 or 4 bytes), string count, record count
+    strings     for each string: u16 length, UTF-8 bytes
+    index       for each record, sorted: u32 source ID, u32 destination ID, u32 offset, u32 length
+    records     u8 route count,
+                the ranked route indices for each priority (u8 each),
+                then for each route: type ID, f64 score, u16 hop count, hop IDs,
+                                     u8 metric count, and for each metric: key ID, u8 kind, 8 byte value
+"""
+import mmap
+import os
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.routing.route_ranking import PRIORITY_WEIGHTS
+
+MAGIC = b"BOBBRT01"
+HEADER = struct.Struct("!8sBxxxII")
+STRING_LENGTH = struct.Struct("!H")
+INDEX_ENTRY = struct.Struct("!IIII")
+ROUTE_HEADER = struct.Struct("!dH")
+COUNT = struct.Struct("!B")
+
+METRIC_INT = 0
+METRIC_FLOAT = 1
+
+# Order the ranked route indices are stored in for each record
+PRIORITIES = list(PRIORITY_WEIGHTS)
+
+
+def binary_routes_file_path(source: str) -> str:
+    return os.path.join("resources", "satellite_routes", f"{source}.bin")
+
+
+class _StringTable:
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.strings: List[str] = []
+
+    def intern(self, value: str) -> int:
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.ids[value] = string_id
+            self.strings.append(value)
+        return string_id
+
+
+def write_binary_routing_table(
+    path: str,
+    routes: Dict[str, Dict[str, List[dict]]],
+    rankings: Dict[str, Dict[str, Dict[str, List[int]]]]
+):
+    """
+    Write serialised routes ({source: {destination: [route, ...]}}) and their rankings
+    ({source: {destination: {priority: [index, ...]}}}) to path, replacing it atomically.
+    """
+    strings = _StringTable()
+    # Intern satellite IDs first, so records can be sorted by ID before their encoding is known
+    for source, source_routes in routes.items():
+        strings.intern(source)
+        for destination in source_routes:
+            strings.intern(destination)
+    for source_routes in routes.values():
+        for dest_routes in source_routes.values():
+            for route in dest_routes:
+                strings.intern(route["type"])
+                for hop in route["path"]:
+                    strings.intern(hop)
+                for key in route["metrics"]:
+                    strings.intern(key)
+
+    id_width = 2 if len(strings.strings) <= 0xFFFF else 4
+    id_format = "H" if id_width == 2 else "I"
+    string_id = struct.Struct(f"!{id_format}")
+
+    records = []
+    for source, source_routes in routes.items():
+        for destination, dest_routes in source_routes.items():
+            ranked = rankings[source][destination]
+            record = bytearray(COUNT.pack(len(dest_routes)))
+            for priority in PRIORITIES:
+                record += bytes(ranked[priority])
+            for route in dest_routes:
+                record += string_id.pack(strings.ids[route["type"]])
+                record += ROUTE_HEADER.pack(route["score"], len(route["path"]))
+                record += struct.pack(f"!{len(route['path'])}{id_format}", *(strings.ids[hop] for hop in route["path"]))
+                record += COUNT.pack(len(route["metrics"]))
+                for key, value in route["metrics"].items():
+                    record += string_id.pack(strings.ids[key])
+                    if isinstance(value, int):
+                        record += struct.pack("!Bq", METRIC_INT, value)
+                    else:
+                        record += struct.pack("!Bd", METRIC_FLOAT, value)
+            records.append((strings.ids[source], strings.ids[destination], bytes(record)))
+    records.sort(key=lambda record: (record[0], record[1]))
+
+    encoded_strings = bytearray()
+    for value in strings.strings:
+        encoded = value.encode("utf-8")
+        encoded_strings += STRING_LENGTH.pack(len(encoded)) + encoded
+
+    offset = HEADER.size + len(encoded_strings) + INDEX_ENTRY.size * len(records)
+    index = bytearray()
+    for source_id, destination_id, record in records:
+        index += INDEX_ENTRY.pack(source_id, destination_id, offset, len(record))
+        offset += len(record)
+
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, id_width, len(strings.strings), len(records)))
+        f.write(encoded_strings)
+        f.write(index)
+        for _, _, record in records:
+            f.write(record)
+    os.replace(f"{path}.tmp", path)
+
+
+class BinaryRoutingTable:
+    """Read-only view of a binary routing table file, decoding records on demand"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.file_stamp = (stat.st_mtime_ns, stat.st_ino)
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, id_width, string_count, self._record_count = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a binary routing table")
+        self._id_format = "H" if id_width == 2 else "I"
+        self._string_id = struct.Struct(f"!{self._id_format}")
+
+        # Strings are needed to map satellite IDs to their integer IDs, so decode them up front
+        self._strings: List[str] = []
+        position = HEADER.size
+        for _ in range(string_count):
+            (length,) = STRING_LENGTH.unpack_from(self._data, position)
+            position += STRING_LENGTH.size
+            self._strings.append(self._data[position:position + length].decode("utf-8"))
+            position += length
+        self._ids = {value: string_id for string_id, value in enumerate(self._strings)}
+        self._index_offset = position
+
+    def _index_entry(self, position: int) -> Tuple[int, int, int, int]:
+        return INDEX_ENTRY.unpack_from(self._data, self._index_offset + position * INDEX_ENTRY.size)
+
+    def _find_record(self, source: str, destination: str) -> Optional[Tuple[int, int]]:
+        """Binary search the index for a record, returning its offset and length"""
+        key = (self._ids.get(source), self._ids.get(destination))
+        if None in key:
+            return None
+        low, high = 0, self._record_count
+        while low < high:
+            middle = (low + high) // 2
+            source_id, destination_id, offset, length = self._index_entry(middle)
+            if (source_id, destination_id) < key:
+                low = middle + 1
+            elif (source_id, destination_id) > key:
+                high = middle
+            else:
+                return offset, length
+        return None
+
+    def ranking(self, source: str, destination: str) -> Optional[Dict[str, List[int]]]:
+        """Ranked route indices for each priority, or None if destination is not in the table"""
+        record = self._find_record(source, destination)
+        if record is None:
+            return None
+        offset, _ = record
+        (route_count,) = COUNT.unpack_from(self._data, offset)
+        position = offset + COUNT.size
+        ranked = {}
+        for priority in PRIORITIES:
+            ranked[priority] = list(self._data[position:position + route_count])
+            position += route_count
+        return ranked
+
+    def routes(self, source: str, destination: str) -> Optional[List[dict]]:
+        """Decode the routes from source to destination, or None if they are not in the table"""
+        record = self._find_record(source, destination)
+        if record is None:
+            return None
+        offset, _ = record
+        return self._decode_routes(offset)
+
+    def _decode_routes(self, offset: int) -> List[dict]:
+        (route_count,) = COUNT.unpack_from(self._data, offset)
+        position = offset + COUNT.size + route_count * len(PRIORITIES)
+
+        routes = []
+        for _ in range(route_count):
+            (type_id,) = self._string_id.unpack_from(self._data, position)
+            position += self._string_id.size
+            score, hop_count = ROUTE_HEADER.unpack_from(self._data, position)
+            position += ROUTE_HEADER.size
+            path_format = struct.Struct(f"!{hop_count}{self._id_format}")
+            path = [self._strings[hop_id] for hop_id in path_format.unpack_from(self._data, position)]
+            position += path_format.size
+
+            (metric_count,) = COUNT.unpack_from(self._data, position)
+            position += COUNT.size
+            metrics = {}
+            for _ in range(metric_count):
+                (key_id,) = self._string_id.unpack_from(self._data, position)
+                position += self._string_id.size
+                (kind,) = COUNT.unpack_from(self._data, position)
+                value_format = "!q" if kind == METRIC_INT else "!d"
+                (metrics[self._strings[key_id]],) = struct.unpack_from(value_format, self._data, position + COUNT.size)
+                position += COUNT.size + 8
+
+            routes.append({
+                "path": path,
+                "type": self._strings[type_id],
+                "score": score,
+                "metrics": metrics
+            })
+        return routes
+
+    def destinations(self, source: str) -> Iterator[str]:
+        """Every destination the table holds routes to from source"""
+        source_id = self._ids.get(source)
+        for position in range(self._record_count):
+            entry_source_id, destination_id, _, _ = self._index_entry(position)
+            if entry_source_id == source_id:
+                yield self._strings[destination_id]
+
+    def source_routes(self, source: str) -> Dict[str, List[dict]]:
+        """Decode every route from source, keyed by destination"""
+        source_id = self._ids.get(source)
+        routes = {}
+        for position in range(self._record_count):
+            entry_source_id, destination_id, offset, _ = self._index_entry(position)
+            if entry_source_id == source_id:
+                routes[self._strings[destination_id]] = self._decode_routes(offset)
+        return routes
@@ -0,0 +1,60 @@
+"""
+Link latency and predicted contact windows, used for contact plan routes.
+
+Each satellite measures the RTT of its links from its heartbeat round trips, less the time the
+neighbour reports it spent processing the heartbeat, smoothed over successive heartbeats. It
+gossips the RTT in its constellation entry, but only again once it has changed noticeably, see
+gossiped_rtt(). LEO links
+are only up while both satellites can see each other, so a satellite can also be given a contact
+plan predicting when each link will be up, in resources/contact_plans/contact_plan_<port>.json as
+    { neighbour id: [[start, end], ...] }
+with times in seconds since the epoch. Links without windows are assumed to always be up.
+"""
+import json
+import os
+from typing import Dict, List, Optional
+
+# Weight of the latest measurement in the smoothed RTT of a link
+rtt_smoothing = float(os.getenv("RTT_SMOOTHING", 0.3))
+# Relative change of a link's RTT from the one last gossiped before it is gossiped again,
+# and the smallest change in milliseconds that is
+rtt_change_threshold = float(os.getenv("RTT_CHANGE_THRESHOLD", 0.2))
+rtt_change_min_ms = float(os.getenv("RTT_CHANGE_MIN_MS", 5))
+
+
+def contact_plan_file_path(port: Optional[str]) -> str:
+    return os.path.join("resources", "contact_plans", f"contact_plan_{port}.json")
+
+
+def read_contact_plan(port: Optional[str]) -> Dict[str, List[List[float]]]:
+    try:
+        with open(contact_plan_file_path(port), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def upcoming_windows(windows: List[List[float]], now: float) -> List[List[float]]:
+    """The windows that haven't ended yet, in order"""
+    return sorted([start, end] for start, end in windows if end > now)
+
+
+def smoothed_rtt(previous: Optional[float], measured: float) -> float:
+    """RTT of a link after a new measurement, in whole milliseconds"""
+    if previous is None:
+        return round(measured)
+    return round(rtt_smoothing * measured + (1 - rtt_smoothing) * previous)
+
+
+def gossiped_rtt(previous: Optional[float], measured: float) -> float:
+    """
+    RTT to gossip for a link: the one gossiped before, unless the measured RTT has moved away from it
+    by more than RTT_CHANGE_THRESHOLD of it, and at least RTT_CHANGE_MIN_MS.
+    Each gossiped change makes a new version of our constellation entry, and regenerates contact plan
+    routes everywhere, so jitter isn't gossiped.
+    """
+    if previous is None:
+        return measured
+    if abs(measured - previous) <= max(rtt_change_threshold * previous, rtt_change_min_ms):
+        return previous
+    return measured
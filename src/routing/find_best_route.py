@@ -9,22 +9,20 @@ import os
 
 from flask import Blueprint, app, jsonify
 
-from src.config.constants import SATELLITE_FUNCTION_DISASTER_IMAGING, BASESTATION
+from src.config.constants import SATELLITE_FUNCTION_DISASTER_IMAGING, BASESTATION, ROUTING_TABLE_MODE_LAZY
 from src.controllers.create_headers import create_header
 from src.controllers.hello import hello
 from src.controllers.identify import return_identity
 from src.controllers.handshake import handshake
 from src.heartbeat.heartbeat import heartbeat
 from src.middleware.header_middleware import check_headers
+from src.routing.forwarding_table import ForwardingTable
+from src.routing.lazy_routes import lazy_route_provider
+from src.routing.route_generator import routing_table_mode
+from src.routing.route_ranking import RouteType, scored_route
+from src.routing.routing_table_cache import RoutingTable, routing_table_cache
 from enum import Enum
-from typing import Dict, List, Optional, Tuple
-
-
-class RouteType(Enum):
-    DIRECT = 10
-    FUNCTION_BASED = 3
-    LOAD_BALANCED = 2
-    RANDOM = 1
+from typing import Dict, Iterable, List, Optional, Tuple
 
 
 @dataclass
@@ -35,68 +33,54 @@ class Route:
     metrics: Dict[str, float]
 
 
+def get_routing_table(source: str) -> RoutingTable:
+    """Routing table of source, generated on demand in lazy mode"""
+    if routing_table_mode == ROUTING_TABLE_MODE_LAZY:
+        return lazy_route_provider.get_table(source)
+    return routing_table_cache.get_table(source)
+
+
+# Forwarding table of each source, derived from its routing table again whenever that changes
+_forwarding_tables: Dict[str, ForwardingTable] = {}
+
+
+def get_forwarding_table(source: str) -> ForwardingTable:
+    """
+    Next hop forwarding table of source.
+    Raises FileNotFoundError if no routing table has been built for source.
+    """
+    routing_table = get_routing_table(source)
+    forwarding_table = _forwarding_tables.get(source)
+    if (forwarding_table is None or forwarding_table.generation != routing_table.generation
+            or forwarding_table.file_stamp != routing_table.file_stamp):
+        forwarding_table = ForwardingTable(routing_table)
+        _forwarding_tables[source] = forwarding_table
+    return forwarding_table
+
+
+def query_route(source: str, destination: str, priority: str = "medium",
+                excluded: Iterable[str] = ()) -> Optional[Dict]:
+    """
+    Best route from source to destination for the priority that doesn't pass through any
+    excluded satellite, or None if no route survives.
+    Routes are filtered in the source's in-memory forwarding table.
+    """
+    forwarding_table = get_forwarding_table(source)
+    ranked_path = forwarding_table.best_path(destination, excluded, priority)
+    if ranked_path is None:
+        return None
+    _, index, _ = ranked_path
+    return forwarding_table.route(destination, index, priority)
+
+
 def find_best_route(source: str, destination: str, priority: str = "medium") -> Optional[Dict]:
     """
     Find the best route based on priority and weights.
     Returns route information including path, type, and metrics.
     """
     try:
-        # Load routing table for source satellite
-        routes_file = f"resources/satellite_routes/{source}.json"
-
-        with open(routes_file, 'r') as f:
-            routing_table = json.load(f)
-            f.close()
-
-        if destination not in routing_table[source]:
-            return None
-
-        available_routes = routing_table[source][destination]
-
-        # Assign weights based on priority
-        priority_weights = {
-            "high": {
-                "DIRECT": 1.0,
-                "FUNCTION_BASED": 0.8,
-                "LOAD_BALANCED": 0.6,
-                "RANDOM": 0.4
-            },
-            "medium": {
-                "DIRECT": 0.8,
-                "FUNCTION_BASED": 1.0,
-                "LOAD_BALANCED": 0.8,
-                "RANDOM": 0.6
-            },
-            "low": {
-                "DIRECT": 0.6,
-                "FUNCTION_BASED": 0.8,
-                "LOAD_BALANCED": 1.0,
-                "RANDOM": 0.8
-            }
-        }
-
-        # Score each route based on type and metrics
-        scored_routes = []
-        for route in available_routes:
-            # print(route)
-            base_weight = RouteType[route["type"]].value
-            priority_weight = priority_weights[priority][route["type"]]
-
-            # Calculate composite score
-            score = base_weight * priority_weight * route["score"]
-
-            scored_routes.append({
-                "path": route["path"],
-                "type": route["type"],
-                "score": score,
-                "metrics": route["metrics"]
-            })
-
-        # Select best route
-        best_route = max(scored_routes, key=lambda x: x["score"])
-        # print(best_route)
-
-        return best_route
+        # Routes are ranked by priority when the table is built, so this is the first one
+        return query_route(source, destination, priority)
 
     except Exception as e:
         print(f"Error finding route: {str(e)}")
@@ -126,68 +110,16 @@ def get_next_available_hop(route: List[str], current_hop_index: int, routing_tab
     return None
 
 
-def find_alternate_route(source: str, destination: str, failed_satellites: List[str], priority: str = "medium") -> Optional[Dict]:
+def find_alternate_route(source: str, destination: str, failed_satellites: List[str], priority: str = "medium",
+                         include_routing_table: bool = False) -> Optional[Dict]:
     """
-    Find an alternate route avoiding failed satellites
+    Find an alternate route avoiding failed satellites.
+    With include_routing_table, every route from source is attached as "routing_table".
     """
     try:
-        routes_file = f"resources/satellite_routes/{source}.json"
-        with open(routes_file, 'r') as f:
-            routing_table = json.load(f)
-
-        if destination not in routing_table[source]:
-            return None
-
-        available_routes = routing_table[source][destination]
-
-        # Filter out routes that use failed satellites
-        valid_routes = [
-            route for route in available_routes
-            if not any(sat in failed_satellites for sat in route["path"])
-        ]
-
-        if not valid_routes:
-            return None
-
-        # Use existing priority system to select best valid route
-        priority_weights = {
-            "high": {
-                "DIRECT": 1.0,
-                "FUNCTION_BASED": 0.8,
-                "BALANCED": 0.6,
-                "RANDOM": 0.4
-            },
-            "medium": {
-                "DIRECT": 0.8,
-                "FUNCTION_BASED": 1.0,
-                "BALANCED": 0.8,
-                "RANDOM": 0.6
-            },
-            "low": {
-                "DIRECT": 0.6,
-                "FUNCTION_BASED": 0.8,
-                "BALANCED": 1.0,
-                "RANDOM": 0.8
-            }
-        }
-
-        scored_routes = []
-        for route in valid_routes:
-            base_weight = RouteType[route["type"]].value
-            priority_weight = priority_weights[priority][route["type"]]
-            score = base_weight * priority_weight * route["score"]
-            scored_routes.append({
-                "path": route["path"],
-                "type": route["type"],
-                "score": score,
-                "metrics": route["metrics"]
-            })
-
-        if not scored_routes:
-            return None
-
-        best_route = max(scored_routes, key=lambda x: x["score"])
-        best_route["routing_table"] = routing_table[source]
+        best_route = query_route(source, destination, priority, failed_satellites)
+        if best_route is not None and include_routing_table:
+            best_route["routing_table"] = get_routing_table(source).routes
         return best_route
 
     except Exception as e:
@@ -0,0 +1,53 @@
+"""
+Sliding window counters of the traffic this satellite forwards.
+
+Every message relayed by /image, /call_satellite_from_whale or /route is recorded against the
+next hop it was sent to. The totals are gossiped in our constellation entry with each heartbeat,
+so LOAD_BALANCED routes elsewhere in the constellation can steer around relays that are busy.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+# Seconds of traffic the counters cover
+load_window = int(os.getenv("LOAD_WINDOW", 60))
+
+
+class ForwardingLoad:
+    def __init__(self, window: int = load_window):
+        self.window = window
+        # (time, next hop, bytes) of every forwarded message, oldest first
+        self._messages: Deque[Tuple[float, str, int]] = deque()
+        self._lock = threading.Lock()
+
+    def record(self, next_hop: str, size: int):
+        """Count a message of size bytes forwarded to next_hop"""
+        with self._lock:
+            now = time.time()
+            self._messages.append((now, next_hop, size))
+            self._expire(now)
+
+    def _expire(self, now: float):
+        while self._messages and self._messages[0][0] < now - self.window:
+            self._messages.popleft()
+
+    def snapshot(self) -> Dict:
+        """Messages and bytes forwarded within the window, in total and per next hop"""
+        with self._lock:
+            self._expire(time.time())
+            next_hops = {}
+            for _, next_hop, size in self._messages:
+                counters = next_hops.setdefault(next_hop, {"messages": 0, "bytes": 0})
+                counters["messages"] += 1
+                counters["bytes"] += size
+            return {
+                "window": self.window,
+                "messages": len(self._messages),
+                "bytes": sum(counters["bytes"] for counters in next_hops.values()),
+                "next_hops": next_hops
+            }
+
+
+forwarding_load = ForwardingLoad()
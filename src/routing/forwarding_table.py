@@ -0,0 +1,99 @@
+"""
+Next hop forwarding tables.
+
+Forwarding a message only needs to know where to send it next, not the scores and metrics of
+every route in the routing table. A ForwardingTable is derived from a routing table each time
+that table changes, and maps each destination to the paths of its routes in ranked order for
+every priority, along with the distinct next hops those paths start with. Destinations are only
+derived when they are first looked up, so only their routes are read from the routing table.
+The routes each destination was derived from are kept, so the route returned for a path is
+always the one that path was checked on, even if the routing table changed in the meantime.
+
+Each path also gets a bitset of the satellites on it, so the best path avoiding a set of failed
+satellites is found with one AND per path.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.routing.route_ranking import scored_route
+from src.routing.routing_table_cache import RoutingTable
+
+# Path of a route, its position in the routing table's list of routes to the destination,
+# and the bitset of the satellites on it
+RankedPath = Tuple[Tuple[str, ...], int, int]
+
+
+class ForwardingTable:
+    def __init__(self, routing_table: RoutingTable):
+        self.source = routing_table.source
+        self.generation = routing_table.generation
+        self.file_stamp = routing_table.file_stamp
+        self._routing_table = routing_table
+        self._routes: Dict[str, List[dict]] = {}
+        self._paths: Dict[str, Dict[str, List[RankedPath]]] = {}
+        self._next_hops: Dict[str, Dict[str, List[str]]] = {}
+        # Bit of each satellite in the path bitsets
+        self._node_bits: Dict[str, int] = {}
+        # Destinations are derived by whichever request thread looks them up first
+        self._lock = threading.Lock()
+
+    def _node_mask(self, path: List[str]) -> int:
+        mask = 0
+        for node_id in path:
+            bit = self._node_bits.get(node_id)
+            if bit is None:
+                bit = 1 << len(self._node_bits)
+                self._node_bits[node_id] = bit
+            mask |= bit
+        return mask
+
+    def _derive(self, destination: str):
+        routes, ranked = self._routing_table.ranked_routes(destination)
+        ranked = ranked or {}
+        masks = [self._node_mask(route["path"]) for route in routes]
+        paths = {
+            priority: [(tuple(routes[index]["path"]), index, masks[index]) for index in indices]
+            for priority, indices in ranked.items()
+        }
+        # dict.fromkeys keeps the first, best ranked, occurrence of each next hop
+        next_hops = {
+            priority: list(dict.fromkeys(path[0] for path, _, _ in ranked_paths if path))
+            for priority, ranked_paths in paths.items()
+        }
+        self._routes[destination] = routes
+        self._paths[destination] = paths
+        self._next_hops[destination] = next_hops
+
+    def _entry(self, table: dict, destination: str) -> dict:
+        entry = table.get(destination)
+        if entry is None:
+            with self._lock:
+                if destination not in table:
+                    self._derive(destination)
+                entry = table[destination]
+        return entry
+
+    def next_hops(self, destination: str, priority: str = "medium") -> List[str]:
+        """Next hops towards destination, best first"""
+        return self._entry(self._next_hops, destination).get(priority, [])
+
+    def next_hop(self, destination: str, priority: str = "medium", avoid: Iterable[str] = ()) -> Optional[str]:
+        """Best next hop towards destination that isn't in avoid"""
+        avoid = set(avoid)
+        return next((hop for hop in self.next_hops(destination, priority) if hop not in avoid), None)
+
+    def best_path(self, destination: str, excluded: Iterable[str] = (), priority: str = "medium") -> Optional[RankedPath]:
+        """Best ranked path to destination that doesn't pass through any excluded satellite"""
+        ranked_paths = self._entry(self._paths, destination).get(priority, [])
+        # Satellites that are on none of the paths can't exclude any of them
+        excluded_mask = 0
+        for node_id in excluded:
+            excluded_mask |= self._node_bits.get(node_id, 0)
+        for ranked_path in ranked_paths:
+            if not ranked_path[2] & excluded_mask:
+                return ranked_path
+        return None
+
+    def route(self, destination: str, index: int, priority: str = "medium") -> Dict:
+        """The full route a path was taken from, with its score for priority"""
+        return scored_route(self._entry(self._routes, destination)[index], priority)
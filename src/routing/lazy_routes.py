@@ -0,0 +1,160 @@
+"""
+Lazy, on-demand route generation.
+
+Most destinations in a routing table are never looked up - traffic mostly goes to a handful
+of base stations. In lazy mode (ROUTING_TABLE_MODE=lazy) no routing tables are built on
+heartbeats. Instead a RouteGenerator is kept in memory, routes for a (source, destination)
+pair are generated the first time they are looked up, and the results are kept in a bounded
+LRU cache. When the constellation changes only the cached pairs whose walks touched a changed
+node are evicted, or all of them if a link was added or removed. Contact plan routes depend on
+the RTT of every link, so when only those change the cached pairs are kept, and just their
+contact plan route is regenerated the next time they are looked up.
+"""
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from src.helpers.state_store import constellation_path, constellation_stamp
+from src.routing.route_generator import Route, RouteGenerator, read_constellation, serialise_route, sort_routes
+from src.routing.route_ranking import rank_routes
+from src.routing.routing_table_cache import RoutingTable
+
+# Maximum number of (source, destination) pairs whose routes are kept in memory
+lazy_route_cache_size = int(os.getenv("LAZY_ROUTE_CACHE_SIZE", 256))
+
+
+@dataclass
+class LazyRoutes:
+    routes: List[dict]
+    ranked: Dict[str, List[int]]
+    # Nodes read while generating the routes - if any of them change, they are evicted
+    dependencies: Set[str]
+    # Walk and shortest path routes, which the contact plan route is added to
+    base_routes: List[Route]
+    # Value of LazyRouteProvider.contact_generation the contact plan route was generated at
+    contact_generation: int
+
+
+class LazyRouteProvider:
+    def __init__(self, constellation_file: str, max_entries: int = lazy_route_cache_size):
+        self.constellation_file = constellation_file
+        self.max_entries = max_entries
+        self.generator: Optional[RouteGenerator] = None
+        self.generation = 0
+        # Incremented whenever contact plan routes may have changed, see LazyRoutes.contact_generation
+        self.contact_generation = 0
+        self._file_stamp: Optional[Tuple[int, int]] = None
+        self._cache: "OrderedDict[Tuple[str, str], LazyRoutes]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def refresh(self):
+        """Pick up constellation changes, evicting the cached routes they affect"""
+        with self._lock:
+            file_stamp = constellation_stamp(self.constellation_file)
+            if file_stamp is None:
+                raise FileNotFoundError(f"No constellation at {self.constellation_file}")
+            if file_stamp == self._file_stamp:
+                return
+
+            constellation = read_constellation(self.constellation_file)
+            self._file_stamp = file_stamp
+            self.generation += 1
+            if self.generator is None:
+                # Routes are only generated from the sources that are looked up
+                self.generator = RouteGenerator(self.constellation_file, constellation, dense_hop_distances=False)
+                return
+
+            change = self.generator.update_constellation(constellation)
+            if change.link_metrics_changed or (change.dirty and self.generator.has_contact_windows):
+                self.contact_generation += 1
+            if change.topology_changed:
+                # Shortest paths depend on every link
+                self._cache.clear()
+                return
+            stale_pairs = [
+                pair for pair, entry in self._cache.items()
+                if not entry.dependencies.isdisjoint(change.dirty)
+            ]
+            for pair in stale_pairs:
+                del self._cache[pair]
+
+    def get(self, source: str, destination: str) -> Optional[LazyRoutes]:
+        """Routes from source to destination, generating them if they are not cached"""
+        with self._lock:
+            self.refresh()
+            satellites = self.generator.satellites
+            if source not in satellites or destination not in satellites or source == destination:
+                return None
+
+            pair = (source, destination)
+            entry = self._cache.get(pair)
+            if entry is not None:
+                self._cache.move_to_end(pair)
+                if entry.contact_generation != self.contact_generation:
+                    entry = self._with_contact_route(source, destination, entry.base_routes, entry.dependencies)
+                    self._cache[pair] = entry
+                return entry
+
+            walk_routes, dependencies = self.generator.trace_walk_routes(source, destination)
+            base_routes = walk_routes + self.generator.generate_shortest_path_routes(source, destination)
+            entry = self._with_contact_route(source, destination, base_routes, dependencies)
+
+            self._cache[pair] = entry
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            return entry
+
+    def _with_contact_route(
+            self, source: str, destination: str, base_routes: List[Route], dependencies: Set[str]
+    ) -> LazyRoutes:
+        routes = list(base_routes)
+        contact_route = self.generator.generate_contact_plan_route(source, destination)
+        if contact_route:
+            routes.append(contact_route)
+        routes = sort_routes(routes)
+        serialised_routes = [serialise_route(route) for route in routes]
+        return LazyRoutes(
+            routes=serialised_routes,
+            ranked=rank_routes(serialised_routes),
+            dependencies=dependencies,
+            base_routes=base_routes,
+            contact_generation=self.contact_generation
+        )
+
+    def get_table(self, source: str) -> "LazyRoutingTable":
+        with self._lock:
+            self.refresh()
+            return LazyRoutingTable(self, source)
+
+
+class LazyRoutingTable(RoutingTable):
+    """Routing table view that generates the routes to each destination when they are read"""
+
+    def __init__(self, provider: LazyRouteProvider, source: str):
+        super().__init__(source, provider.generation, provider._file_stamp)
+        self._provider = provider
+
+    def routes_to(self, destination: str) -> List[dict]:
+        entry = self._provider.get(self.source, destination)
+        return entry.routes if entry is not None else []
+
+    def ranking(self, destination: str) -> Optional[Dict[str, List[int]]]:
+        entry = self._provider.get(self.source, destination)
+        return entry.ranked if entry is not None else None
+
+    def ranked_routes(self, destination: str) -> Tuple[List[dict], Optional[Dict[str, List[int]]]]:
+        # One lookup, as the constellation may change between two
+        entry = self._provider.get(self.source, destination)
+        return (entry.routes, entry.ranked) if entry is not None else ([], None)
+
+    def destinations(self) -> Iterable[str]:
+        return [sat_id for sat_id in self._provider.generator.satellites if sat_id != self.source]
+
+    @property
+    def routes(self) -> Dict[str, List[dict]]:
+        return {destination: self.routes_to(destination) for destination in self.destinations()}
+
+
+lazy_route_provider = LazyRouteProvider(constellation_path(os.getenv("PORT")))
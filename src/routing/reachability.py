@@ -0,0 +1,87 @@
+"""
+Connected components of the constellation, for failing fast on destinations no route can reach.
+
+When the constellation is partitioned, looking routes up for a destination in another partition
+only burns attempts. The route builder publishes the components of each constellation it
+generates routes for. When it hasn't (lazy mode, or routes from the routing service), they are
+computed from the constellation, and recomputed whenever it changes.
+"""
+import json
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from src.helpers.state_store import constellation_path, constellation_stamp, load_constellation
+
+
+def constellation_components(constellation: Dict[str, dict]) -> Dict[str, int]:
+    """Component number of every satellite in the constellation, treating links as bidirectional"""
+    links: Dict[str, set] = {}
+    for sat_id, data in constellation.items():
+        links.setdefault(sat_id, set())
+        for neighbour_id in data['neighbours']:
+            links[sat_id].add(neighbour_id)
+            links.setdefault(neighbour_id, set()).add(sat_id)
+
+    components = {}
+    component = 0
+    for start_id in links:
+        if start_id in components:
+            continue
+        component += 1
+        components[start_id] = component
+        stack = [start_id]
+        while stack:
+            for neighbour_id in links[stack.pop()]:
+                if neighbour_id not in components:
+                    components[neighbour_id] = component
+                    stack.append(neighbour_id)
+    return components
+
+
+class Reachability:
+    def __init__(self, constellation_file: str):
+        self.constellation_file = constellation_file
+        self._components: Dict[str, int] = {}
+        self._file_stamp: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def publish(self, constellation_file: str, components: Dict[str, int], stamp: Optional[Tuple[int, int]]):
+        """
+        Called by the route builder with the components of the constellation it just read,
+        and the stamp it had before reading it. Other satellites' constellations are ignored.
+        """
+        if os.path.abspath(constellation_file) != os.path.abspath(self.constellation_file):
+            return
+        with self._lock:
+            self._components = components
+            self._file_stamp = stamp
+
+    def reachable(self, source: str, destination: str) -> bool:
+        """
+        False if no path can exist between source and destination. Satellites we know nothing
+        about are assumed to be reachable, and left to the route lookup.
+        """
+        components = self._current_components()
+        if source not in components or destination not in components:
+            return True
+        return components[source] == components[destination]
+
+    def _current_components(self) -> Dict[str, int]:
+        stamp = constellation_stamp(self.constellation_file)
+        if stamp is None or stamp == self._file_stamp:
+            return self._components
+
+        with self._lock:
+            if stamp != self._file_stamp:
+                try:
+                    constellation = load_constellation(self.constellation_file)
+                except (FileNotFoundError, json.JSONDecodeError) as e:
+                    print(f"Error reading constellation for reachability: {e}")
+                    return self._components
+                self._components = constellation_components(constellation)
+                self._file_stamp = stamp
+            return self._components
+
+
+reachability = Reachability(constellation_path(os.getenv("PORT")))
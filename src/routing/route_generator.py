@@ -1,19 +1,65 @@
 # Written by Aryan, modified by Niels
+import argparse
+import atexit
+import heapq
+import itertools
 import json
+import multiprocessing
 import os
 import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass
-from typing import Dict, List, Set, Optional, Tuple
+from typing import Dict, List, Set, Optional, Tuple, Union
 from collections import defaultdict
 import networkx as nx
+import numpy as np
+import requests
 from enum import Enum, auto
 
+from src.config.constants import ROUTING_TABLE_MODE_OWN_SOURCE, ROUTING_TABLE_MODE_FULL, ROUTING_TABLE_MODE_LAZY, \
+    ROUTING_TABLE_FORMAT_JSON, ROUTING_TABLE_FORMAT_BINARY, ROUTING_TABLE_FORMAT_BOTH
+from src.helpers import http_client, state_store
+from src.helpers.state_store import constellation_stamp, get_state_store, load_constellation, use_state_store
+from src.routing.areas import hierarchical_routing, read_area_summaries, routing_area, summarise_area
+from src.routing.binary_routing_table import write_binary_routing_table
+from src.routing.reachability import constellation_components, reachability
+from src.routing.route_ranking import rank_routing_table
+from src.routing.routing_table_cache import routing_table_cache
+from src.routing.routing_table_versions import record_build
+
+# Which sources routing tables are generated for - see create_routing_tables()
+routing_table_mode = os.getenv("ROUTING_TABLE_MODE", ROUTING_TABLE_MODE_OWN_SOURCE)
+# Which files routing tables are written to - JSON for tooling, binary for fast lookups
+routing_table_format = os.getenv("ROUTING_TABLE_FORMAT", ROUTING_TABLE_FORMAT_BOTH)
+# Optional shared routing service for co-located satellites, e.g. http://127.0.0.1:33000
+routing_service_url = os.getenv("ROUTING_SERVICE_URL")
+# Number of loop-free shortest paths kept per destination by the SHORTEST_PATH strategy
+k_shortest_paths = int(os.getenv("K_SHORTEST_PATHS", 3))
+# Worker processes used when many routes have to be generated at once, 1 to disable
+route_workers = int(os.getenv("ROUTE_WORKERS", os.cpu_count() or 1))
+# Fewer pairs than this are generated in-process, as starting the workers costs more than it saves
+parallel_route_min_pairs = int(os.getenv("PARALLEL_ROUTE_MIN_PAIRS", 2000))
+
+# Hop limit of the greedy walks, and the hop distance of nodes that cannot be reached at all
+MAX_WALK_HOPS = 3
+UNREACHABLE = np.iinfo(np.int32).max
+# Forwarded messages per load window that weigh as much as one other route through a satellite
+load_unit = int(os.getenv("LOAD_UNIT", 10))
+# Round trip time assumed for links whose RTT hasn't been measured yet
+default_link_rtt_ms = float(os.getenv("DEFAULT_LINK_RTT_MS", 100))
+
 
 class RouteType(Enum):
     DIRECT = auto()
     FUNCTION_BASED = auto()
     LOAD_BALANCED = auto()
     RANDOM = auto()
+    SHORTEST_PATH = auto()
+    INTER_AREA = auto()
+    CONTACT_PLAN = auto()
 
 
 @dataclass
@@ -23,7 +69,9 @@ class SatelliteNode:
     last_contact: int
     public_key: str
     neighbours: Dict[str, dict]
+    # Messages and bytes the satellite forwarded in its last load window, as it gossiped them
     load: int = 0
+    load_bytes: int = 0
 
     def __hash__(self):
         return hash(self.id)
@@ -37,29 +85,223 @@ class Route:
     metrics: Dict[str, float]
 
 
+@dataclass
+class ConstellationChange:
+    added: Set[str]
+    removed: Set[str]
+    modified: Set[str]
+    # Every node whose data (or candidate set) differs from the previous constellation
+    dirty: Set[str]
+    # Whether any link was added or removed, which invalidates shortest paths
+    topology_changed: bool
+    # Whether the RTT or contact windows of any link changed, which invalidates contact plan routes
+    link_metrics_changed: bool = False
+    # Hop distances from before a topology change and the index they follow, if any were computed:
+    # the matrix, or the rows that were computed (see RouteGenerator.dense_hop_distances)
+    previous_hop_distances: Optional[Tuple[Union[np.ndarray, Dict[str, np.ndarray]], Dict[str, int]]] = None
+
+
 class RouteGenerator:
-    def __init__(self, constellation_file: str):
+    def __init__(
+        self, constellation_file: Optional[str] = None, constellation: Optional[Dict[str, dict]] = None,
+        dense_hop_distances: bool = True
+    ):
         self.constellation_file = constellation_file
-        self.satellites = self._load_satellites()
+        # Whether hop distances are computed between every pair of satellites at once, which pays off when
+        # routes are generated from every source. Otherwise they are only computed from the satellites
+        # walks read them from, which are all within a few hops of the sources
+        self.dense_hop_distances = dense_hop_distances
+        if constellation is None:
+            constellation = read_constellation(constellation_file)
+        self.constellation = constellation
+        self.satellites = self._load_satellites(constellation)
         self.route_stats = defaultdict(int)
         self.network_graph = self._create_network_graph()
-
-    def _load_satellites(self) -> Dict[str, SatelliteNode]:
-        with open(self.constellation_file, 'r') as f:
-            constellation = json.load(f)
-            f.close()
-
+        # Shortest path tree of each source over network_graph, computed on first use
+        self._shortest_path_trees: Dict[str, Dict[str, List[str]]] = {}
+        # Earliest arrival tree of each source over the measured links, see contact_plan_tree()
+        self._contact_plan_trees: Dict[str, Dict[str, Tuple[float, float, List[str]]]] = {}
+        # Position of each satellite in the constellation, and its neighbours within the
+        # constellation in that order, so candidates are found in O(degree) per hop
+        self.index: Dict[str, int] = {}
+        self.adjacency: Dict[str, List[str]] = {}
+        self._build_adjacency_index()
+        # Hops from each satellite to every other one along the adjacency index, see hop_distances(),
+        # or from the satellites they were needed from, see hop_distance_row()
+        self._hop_distances: Optional[np.ndarray] = None
+        self._hop_distance_rows: Dict[str, np.ndarray] = {}
+        # Connected component of each satellite, see components()
+        self._components: Optional[Dict[str, int]] = None
+        # When set, candidate lookups record every node they read into this set
+        self._trace: Optional[Set[str]] = None
+
+    def _load_satellites(self, constellation: Dict[str, dict]) -> Dict[str, SatelliteNode]:
         satellites = {}
         for sat_id, data in constellation.items():
-            satellites[sat_id] = SatelliteNode(
-                id=sat_id,
-                function=list(data['neighbours'].values())[0]['function'],
-                last_contact=data['freshness'],
-                public_key=list(data['neighbours'].values())[0]['public_key'],
-                neighbours=data['neighbours']
-            )
+            satellites[sat_id] = self._create_satellite(sat_id, data)
         return satellites
 
+    def _create_satellite(self, sat_id: str, data: dict) -> SatelliteNode:
+        # Satellites running older versions don't gossip their load
+        load = data.get('load', {})
+        return SatelliteNode(
+            id=sat_id,
+            function=list(data['neighbours'].values())[0]['function'],
+            last_contact=data['freshness'],
+            public_key=list(data['neighbours'].values())[0]['public_key'],
+            neighbours=data['neighbours'],
+            load=load.get('messages', 0),
+            load_bytes=load.get('bytes', 0)
+        )
+
+    def update_constellation(self, constellation: Dict[str, dict]) -> ConstellationChange:
+        """
+        Replace the constellation with a newer copy, rebuilding only the entries that changed.
+        Returns which nodes were added, removed or modified, and the dirty set that routes depending
+        on them need to be recomputed for.
+        """
+        added = set(constellation) - set(self.constellation)
+        removed = set(self.constellation) - set(constellation)
+        modified = {
+            sat_id for sat_id in set(constellation) & set(self.constellation)
+            if constellation[sat_id] != self.constellation[sat_id]
+        }
+
+        # Build the new nodes before touching any state, so a malformed entry leaves us unchanged
+        new_nodes = {sat_id: self._create_satellite(sat_id, constellation[sat_id]) for sat_id in added | modified}
+
+        dirty = added | removed | modified
+        if added or removed:
+            # Nodes that already listed an added/removed node as a neighbour gain or lose a candidate
+            dirty.update(
+                sat_id for sat_id, data in constellation.items()
+                if any(node_id in data['neighbours'] for node_id in added | removed)
+            )
+
+        topology_changed = bool(added or removed) or any(
+            constellation[sat_id]['neighbours'].keys() != self.constellation[sat_id]['neighbours'].keys()
+            for sat_id in modified
+        )
+        link_metrics_changed = topology_changed or any(
+            link_metrics(constellation[sat_id]) != link_metrics(self.constellation[sat_id])
+            for sat_id in modified
+        )
+
+        # Rebuild in constellation order so candidate ordering matches a fresh load
+        order_changed = list(constellation) != list(self.constellation)
+        previous_hop_distances = None
+        if topology_changed and self._hop_distances is not None:
+            previous_hop_distances = (self._hop_distances, self.index)
+        elif topology_changed and self._hop_distance_rows:
+            previous_hop_distances = (self._hop_distance_rows, self.index)
+        self.satellites = {
+            sat_id: new_nodes.get(sat_id) or self.satellites[sat_id]
+            for sat_id in constellation
+        }
+        self.constellation = constellation
+        if dirty:
+            self.network_graph = self._create_network_graph()
+            self._shortest_path_trees = {}
+            self._contact_plan_trees = {}
+        if order_changed:
+            self._build_adjacency_index()
+        else:
+            for sat_id in modified:
+                self.adjacency[sat_id] = self._neighbours_in_constellation(sat_id)
+        if topology_changed or order_changed:
+            self._hop_distances = None
+            self._hop_distance_rows = {}
+        if topology_changed:
+            self._components = None
+
+        return ConstellationChange(
+            added=added,
+            removed=removed,
+            modified=modified,
+            dirty=dirty,
+            topology_changed=topology_changed,
+            link_metrics_changed=link_metrics_changed,
+            previous_hop_distances=previous_hop_distances
+        )
+
+    def _build_adjacency_index(self):
+        self.index = {sat_id: position for position, sat_id in enumerate(self.satellites)}
+        self.adjacency = {
+            sat_id: self._neighbours_in_constellation(sat_id)
+            for sat_id in self.satellites
+        }
+
+    def _neighbours_in_constellation(self, sat_id: str) -> List[str]:
+        neighbours = [
+            neighbour_id for neighbour_id in self.satellites[sat_id].neighbours
+            if neighbour_id in self.index
+        ]
+        neighbours.sort(key=self.index.__getitem__)
+        return neighbours
+
+    def hop_distances(self) -> np.ndarray:
+        """
+        Matrix of the number of hops from each satellite to every other one (rows and columns
+        follow self.index), UNREACHABLE if there is no path. Computed once per topology.
+        """
+        if self._hop_distances is None:
+            self._hop_distances = hop_distance_matrix(self.adjacency, self.index)
+        return self._hop_distances
+
+    def hop_distance_row(self, sat_id: str) -> np.ndarray:
+        """Hops from one satellite to every other one (following self.index), computed once per topology"""
+        row = self._hop_distance_rows.get(sat_id)
+        if row is None:
+            row = hop_distance_row(self.adjacency, self.index, sat_id)
+            self._hop_distance_rows[sat_id] = row
+        return row
+
+    def hop_distance_changes(
+        self, previous: Union[np.ndarray, Dict[str, np.ndarray]], previous_index: Dict[str, int]
+    ) -> Dict[str, Set[str]]:
+        """
+        Satellites whose hop distance to each destination differs from previous hop distances,
+        given with the index they follow: a matrix, or the rows of the satellites they were
+        computed from. Satellites missing from either are left out.
+        """
+        common = [sat_id for sat_id in self.index if sat_id in previous_index]
+        positions = np.array([self.index[sat_id] for sat_id in common], dtype=np.intp)
+        previous_positions = np.array([previous_index[sat_id] for sat_id in common], dtype=np.intp)
+
+        changes: Dict[str, Set[str]] = defaultdict(set)
+        if isinstance(previous, dict):
+            for sat_id, previous_row in previous.items():
+                if sat_id not in self.index:
+                    continue
+                differs = self.hop_distance_row(sat_id)[positions] != previous_row[previous_positions]
+                for column in np.nonzero(differs)[0]:
+                    changes[common[column]].add(sat_id)
+            return changes
+
+        differs = (
+            self.hop_distances()[np.ix_(positions, positions)]
+            != previous[np.ix_(previous_positions, previous_positions)]
+        )
+        for row, column in zip(*np.nonzero(differs)):
+            changes[common[column]].add(common[row])
+        return changes
+
+    def components(self) -> Dict[str, int]:
+        """Connected component of every satellite, which routes can never leave"""
+        if self._components is None:
+            self._components = constellation_components(self.constellation)
+        return self._components
+
+    def hop_distance(self, from_id: str, to_id: str) -> int:
+        if self.dense_hop_distances:
+            return int(self.hop_distances()[self.index[from_id], self.index[to_id]])
+        return int(self.hop_distance_row(from_id)[self.index[to_id]])
+
+    def _proximity_score(self, next_id: str, dest_id: str) -> float:
+        # 80 for stepping onto the destination, 40 for one of its neighbours, less the further away
+        remaining = self.hop_distance(next_id, dest_id)
+        return 0 if remaining == UNREACHABLE else 80 / (1 + remaining)
+
     def _create_network_graph(self) -> nx.Graph:
         """Create a NetworkX graph of the satellite constellation"""
         G = nx.Graph()
@@ -80,6 +322,17 @@ class RouteGenerator:
             )
         return None
 
+    def _candidates(self, current_sat: SatelliteNode, visited: Set[str]) -> List[str]:
+        """Unvisited neighbours of the current satellite that are part of the constellation"""
+        candidates = [
+            sat_id for sat_id in self.adjacency[current_sat.id]
+            if sat_id not in visited
+        ]
+        if self._trace is not None:
+            self._trace.add(current_sat.id)
+            self._trace.update(candidates)
+        return candidates
+
     def generate_function_based_route(
         self, source_id: str, dest_id: str, existing_routes: List[Route]
     ) -> Optional[Route]:
@@ -104,17 +357,18 @@ class RouteGenerator:
             scores['freshness'] = 30 * (1 / (1 + time_diff/1000))
 
             # Distance to destination
-            scores['dest_proximity'] = 40 if dest_id in next_sat.neighbours else 0
+            scores['dest_proximity'] = self._proximity_score(next_sat.id, dest_id)
 
             total_score = sum(scores.values())
             return total_score, scores
 
+        # Don't walk towards destinations that are out of reach
+        if self.hop_distance(source_id, dest_id) > MAX_WALK_HOPS:
+            return None
+
         while current != dest_id:
             current_sat = self.satellites[current]
-            candidates = [
-                sat_id for sat_id, sat in self.satellites.items()
-                if sat_id not in visited and sat_id in current_sat.neighbours
-            ]
+            candidates = self._candidates(current_sat, visited)
 
             if not candidates:
                 return None
@@ -137,7 +391,7 @@ class RouteGenerator:
             visited.add(next_hop)
             current = next_hop
 
-            if len(route) > 3:
+            if len(route) > MAX_WALK_HOPS:
                 return None
 
         return Route(
@@ -159,8 +413,8 @@ class RouteGenerator:
         def score_next_hop(next_sat: SatelliteNode) -> Tuple[float, Dict[str, float]]:
             scores = {}
 
-            # Load balancing
-            current_load = satellite_load[next_sat.id]
+            # Load balancing, over both the other routes for this pair and the traffic the satellite forwards
+            current_load = satellite_load[next_sat.id] + next_sat.load / load_unit
             scores['load_balance'] = 100 * (1 / (1 + current_load))
 
             # Connection freshness
@@ -175,17 +429,17 @@ class RouteGenerator:
                 (available_connections / len(next_sat.neighbours))
 
             # Distance to destination
-            scores['dest_proximity'] = 40 if dest_id in next_sat.neighbours else 0
+            scores['dest_proximity'] = self._proximity_score(next_sat.id, dest_id)
 
             total_score = sum(scores.values())
             return total_score, scores
 
+        if self.hop_distance(source_id, dest_id) > MAX_WALK_HOPS:
+            return None
+
         while current != dest_id:
             current_sat = self.satellites[current]
-            candidates = [
-                sat_id for sat_id, sat in self.satellites.items()
-                if sat_id not in visited and sat_id in current_sat.neighbours
-            ]
+            candidates = self._candidates(current_sat, visited)
 
             if not candidates:
                 return None
@@ -207,7 +461,7 @@ class RouteGenerator:
             current = next_hop
             satellite_load[next_hop] += 1
 
-            if len(route) > 3:
+            if len(route) > MAX_WALK_HOPS:
                 return None
 
         return Route(
@@ -218,7 +472,7 @@ class RouteGenerator:
         )
 
     def generate_random_route(
-        self, source_id: str, dest_id: str, max_hops: int = 3
+        self, source_id: str, dest_id: str, max_hops: int = MAX_WALK_HOPS
     ) -> Optional[Route]:
         """Generate a random valid route"""
         route = []
@@ -226,12 +480,12 @@ class RouteGenerator:
         current = source_id
         metrics = {"randomness": random.random() * 100}
 
+        if self.hop_distance(source_id, dest_id) > max_hops:
+            return None
+
         while current != dest_id:
             current_sat = self.satellites[current]
-            candidates = [
-                sat_id for sat_id, sat in self.satellites.items()
-                if sat_id not in visited and sat_id in current_sat.neighbours
-            ]
+            candidates = self._candidates(current_sat, visited)
 
             if not candidates:
                 return None
@@ -251,6 +505,176 @@ class RouteGenerator:
             metrics=metrics
         )
 
+    def shortest_path_tree(self, source_id: str) -> Dict[str, List[str]]:
+        """
+        Shortest paths (by hop count) from source to every reachable node, including the source.
+        Computed once per source and reused for every destination.
+        """
+        tree = self._shortest_path_trees.get(source_id)
+        if tree is None:
+            tree = nx.single_source_shortest_path(self.network_graph, source_id)
+            self._shortest_path_trees[source_id] = tree
+        return tree
+
+    def generate_shortest_path_routes(
+        self, source_id: str, dest_id: str, k: Optional[int] = None
+    ) -> List[Route]:
+        """
+        Generate up to k loop-free routes in increasing hop count. The first comes from the
+        source's shortest path tree, the others from Yen's k-shortest paths algorithm.
+        Unlike the greedy strategies these have no hop limit, so they also reach far destinations.
+        """
+        k = k_shortest_paths if k is None else k
+        shortest_path = self.shortest_path_tree(source_id).get(dest_id)
+        if shortest_path is None or k < 1:
+            return []
+
+        paths = [shortest_path]
+        if k > 1:
+            for path in nx.shortest_simple_paths(self.network_graph, source_id, dest_id):
+                if path != shortest_path:
+                    paths.append(path)
+                if len(paths) >= k:
+                    break
+
+        return [
+            Route(
+                path=path[1:],
+                type=RouteType.SHORTEST_PATH,
+                score=100.0 / (len(path) - 1),
+                metrics={"hops": len(path) - 1, "rank": rank}
+            )
+            for rank, path in enumerate(paths)
+        ]
+
+    @property
+    def has_contact_windows(self) -> bool:
+        """Whether any link is only up at certain times, making routes over it time dependent"""
+        return any(
+            link.get('contact_windows')
+            for data in self.constellation.values()
+            for link in data['neighbours'].values()
+        )
+
+    def contact_plan_tree(self, source_id: str) -> Dict[str, Tuple[float, float, List[str]]]:
+        """
+        Earliest arrival at every reachable node from source, leaving now, with how long of that
+        was spent waiting for links to come up, and the path taken.
+        Links are taken in the direction the satellite that measured them reported them. Each link
+        takes half its RTT, and can only be entered during one of its contact windows, if it has any.
+        """
+        tree = self._contact_plan_trees.get(source_id)
+        if tree is not None:
+            return tree
+
+        start = time.time()
+        tree = {}
+        queue = [(start, 0.0, source_id, [source_id])]
+        while queue:
+            arrival, waited, node_id, path = heapq.heappop(queue)
+            if node_id in tree:
+                continue
+            tree[node_id] = (arrival - start, waited, path)
+            if node_id not in self.constellation:
+                continue
+
+            for neighbour_id, link in self.constellation[node_id]['neighbours'].items():
+                if neighbour_id in tree:
+                    continue
+                departure = link_departure(link, arrival)
+                if departure is None:
+                    continue
+                rtt = link.get('rtt', default_link_rtt_ms)
+                heapq.heappush(queue, (
+                    departure + rtt / 2000, waited + departure - arrival, neighbour_id, path + [neighbour_id]
+                ))
+
+        self._contact_plan_trees[source_id] = tree
+        return tree
+
+    def generate_contact_plan_route(self, source_id: str, dest_id: str) -> Optional[Route]:
+        """
+        Generate the route that reaches the destination soonest over the measured, time varying links.
+        Without a measured RTT or contact window on any of its links, it would only be a shortest path
+        by hop count, so there is no route. The score is that of a shortest path of the same length,
+        scaled by how much sooner than over links of the default RTT it arrives.
+        """
+        reached = self.contact_plan_tree(source_id).get(dest_id)
+        if reached is None or dest_id == source_id:
+            return None
+
+        delay, waited, path = reached
+        links = [self.constellation[node_id]['neighbours'][next_id] for node_id, next_id in zip(path, path[1:])]
+        if not any('rtt' in link or link.get('contact_windows') for link in links):
+            return None
+
+        hops = len(path) - 1
+        default_delay = hops * default_link_rtt_ms / 2000
+        return Route(
+            path=path[1:],
+            type=RouteType.CONTACT_PLAN,
+            score=100.0 / hops * default_delay / max(delay, 0.001),
+            metrics={"hops": hops, "latency_ms": round((delay - waited) * 1000, 3), "wait_s": round(waited, 3)}
+        )
+
+    def generate_inter_area_routes(
+        self, source_id: str, summaries: Dict[str, dict], area: str
+    ) -> Dict[str, List[Route]]:
+        """
+        Routes from source to the satellites of other areas (see areas.py), which this generator
+        only holds the border links to. Each route leads to the nearest satellite in the next
+        area on the way, or straight to the destination if it is that close.
+        """
+        area_of = {
+            member_id: summary_area
+            for summary_area, summary in summaries.items()
+            for member_id in summary["members"]
+        }
+
+        # Areas are linked wherever a border satellite of one has a neighbour in the other
+        area_links = defaultdict(set)
+        for summary_area, summary in summaries.items():
+            for foreign_ids in summary["links"].values():
+                for foreign_id in foreign_ids:
+                    other_area = area_of.get(foreign_id)
+                    if other_area is not None and other_area != summary_area:
+                        area_links[summary_area].add(other_area)
+                        area_links[other_area].add(summary_area)
+
+        # First area on the way to every other area, by breadth first search over the areas
+        next_area = {linked_area: linked_area for linked_area in area_links[area]}
+        queue = list(next_area)
+        while queue:
+            current_area = queue.pop(0)
+            for linked_area in area_links[current_area]:
+                if linked_area != area and linked_area not in next_area:
+                    next_area[linked_area] = next_area[current_area]
+                    queue.append(linked_area)
+
+        # Shortest path to the nearest satellite of each neighbouring area
+        tree = self.shortest_path_tree(source_id)
+        exits = {}
+        for node_id, path in tree.items():
+            node_area = area_of.get(node_id)
+            if node_area is not None and node_area != area and (
+                    node_area not in exits or len(path) < len(exits[node_area])):
+                exits[node_area] = path
+
+        routes = {}
+        for dest_id, dest_area in area_of.items():
+            if dest_area == area or dest_id in self.satellites or dest_id == source_id:
+                continue
+            path = tree.get(dest_id) or exits.get(next_area.get(dest_area))
+            if path is None:
+                continue
+            routes[dest_id] = [Route(
+                path=path[1:],
+                type=RouteType.INTER_AREA,
+                score=100.0 / (len(path) - 1),
+                metrics={"hops": len(path) - 1}
+            )]
+        return routes
+
     def _calculate_network_load(self, routes: List[Route]) -> Dict[str, int]:
         """Calculate current load on each satellite"""
         load = defaultdict(int)
@@ -259,57 +683,653 @@ class RouteGenerator:
                 load[hop] += 1
         return load
 
+    def generate_routes(self, source_id: str, dest_id: str) -> List[Route]:
+        """Generate the routes of every strategy between one source and destination"""
+        existing_routes = self.generate_walk_routes(source_id, dest_id)
 
-def generate_all_routes(constellation_file: str) -> Dict[str, Dict[str, List[Route]]]:
-    generator = RouteGenerator(constellation_file)
-    routes = {}
+        # 5. Shortest paths over the network graph
+        existing_routes.extend(
+            self.generate_shortest_path_routes(source_id, dest_id))
 
-    for source_id in generator.satellites:
-        routes[source_id] = {}
+        # 6. Route that arrives soonest over the measured links
+        contact_route = self.generate_contact_plan_route(source_id, dest_id)
+        if contact_route:
+            existing_routes.append(contact_route)
 
-        for dest_id in generator.satellites:
-            if source_id != dest_id:
-                routes[source_id][dest_id] = []
-                existing_routes = routes[source_id][dest_id]
+        return sort_routes(existing_routes)
 
-                # 1. Direct Route (Highest Priority)
-                direct_route = generator.generate_direct_route(
-                    source_id, dest_id)
-                if direct_route:
-                    existing_routes.append(direct_route)
-
-                # 2. Function-based Route
-                func_route = generator.generate_function_based_route(
-                    source_id, dest_id, existing_routes
-                )
-                if func_route:
-                    existing_routes.append(func_route)
-
-                # 3. Load-balanced Route
-                balanced_route = generator.generate_load_balanced_route(
-                    source_id, dest_id, existing_routes
-                )
-                if balanced_route:
-                    existing_routes.append(balanced_route)
-
-                # 4. Random Route (Lowest Priority)
-                random_route = generator.generate_random_route(
-                    source_id, dest_id)
-                if random_route:
-                    existing_routes.append(random_route)
+    def generate_walk_routes(self, source_id: str, dest_id: str) -> List[Route]:
+        """Generate the routes of the strategies that walk the constellation hop by hop"""
+        existing_routes = []
 
-                # Sort routes by score within their priority class
-                existing_routes.sort(
-                    key=lambda x: (x.type.value, -x.score)
-                )
+        # 1. Direct Route (Highest Priority)
+        direct_route = self.generate_direct_route(source_id, dest_id)
+        if direct_route:
+            existing_routes.append(direct_route)
 
-    # Generate visualizations
-    # generator.visualize_routes(routes, "resources/route_visualizations")
+        # 2. Function-based Route
+        func_route = self.generate_function_based_route(
+            source_id, dest_id, existing_routes
+        )
+        if func_route:
+            existing_routes.append(func_route)
 
+        # 3. Load-balanced Route
+        balanced_route = self.generate_load_balanced_route(
+            source_id, dest_id, existing_routes
+        )
+        if balanced_route:
+            existing_routes.append(balanced_route)
+
+        # 4. Random Route (Lowest Priority)
+        random_route = self.generate_random_route(source_id, dest_id)
+        if random_route:
+            existing_routes.append(random_route)
+
+        return existing_routes
+
+    def trace_walk_routes(self, source_id: str, dest_id: str) -> Tuple[List[Route], Set[str]]:
+        """
+        Generate the walk routes for a pair, along with every node whose data was read while doing so.
+        If none of those nodes change, regenerating the pair would explore the same candidates.
+        """
+        self._trace = {source_id}
+        try:
+            routes = self.generate_walk_routes(source_id, dest_id)
+            return routes, self._trace
+        finally:
+            self._trace = None
+
+
+def hop_distance_matrix(adjacency: Dict[str, List[str]], index: Dict[str, int]) -> np.ndarray:
+    """
+    All-pairs hop distances over an adjacency list, by breadth first search from every node at
+    once: each step multiplies the frontiers of all sources with the adjacency matrix.
+    """
+    size = len(index)
+    links = np.zeros((size, size), dtype=np.float32)
+    for sat_id, neighbours in adjacency.items():
+        links[index[sat_id], [index[neighbour_id] for neighbour_id in neighbours]] = 1
+
+    distances = np.full((size, size), UNREACHABLE, dtype=np.int32)
+    np.fill_diagonal(distances, 0)
+    reached = np.eye(size, dtype=bool)
+    frontier = reached
+    hops = 0
+    while frontier.any():
+        hops += 1
+        frontier = ((frontier.astype(np.float32) @ links) > 0) & ~reached
+        distances[frontier] = hops
+        reached |= frontier
+    return distances
+
+
+def hop_distance_row(adjacency: Dict[str, List[str]], index: Dict[str, int], source_id: str) -> np.ndarray:
+    """Hops from one node to every other one over an adjacency list, by breadth first search"""
+    distances = np.full(len(index), UNREACHABLE, dtype=np.int32)
+    distances[index[source_id]] = 0
+    reached = {source_id}
+    frontier = [source_id]
+    hops = 0
+    while frontier:
+        hops += 1
+        next_frontier = []
+        for sat_id in frontier:
+            for neighbour_id in adjacency[sat_id]:
+                if neighbour_id not in reached:
+                    reached.add(neighbour_id)
+                    next_frontier.append(neighbour_id)
+        distances[[index[sat_id] for sat_id in next_frontier]] = hops
+        frontier = next_frontier
+    return distances
+
+
+def link_metrics(entry: dict) -> Dict[str, tuple]:
+    """RTT and contact windows of the links in a constellation entry"""
+    return {
+        neighbour_id: (link.get('rtt'), link.get('contact_windows'))
+        for neighbour_id, link in entry['neighbours'].items()
+    }
+
+
+def link_departure(link: dict, ready: float) -> Optional[float]:
+    """Earliest time from ready at which a link can be entered, or None if it won't be up again"""
+    windows = link.get('contact_windows')
+    if not windows:
+        return ready
+    for window_start, window_end in sorted(windows):
+        if ready < window_end:
+            return max(ready, window_start)
+    return None
+
+
+def sort_routes(routes: List[Route]) -> List[Route]:
+    # Sort routes by score within their priority class
+    routes.sort(
+        key=lambda x: (x.type.value, -x.score)
+    )
     return routes
 
 
-def create_routing_tables():
+def compact_constellation(constellation: Dict[str, dict]) -> List[tuple]:
+    """
+    What walks and shortest paths need of a constellation: the function, freshness, load and
+    neighbour IDs of each satellite, without the keys and metrics of their links.
+    """
+    return [
+        (sat_id, list(data['neighbours'].values())[0]['function'], data['freshness'],
+         data.get('load', {}), list(data['neighbours']))
+        for sat_id, data in constellation.items()
+    ]
+
+
+def expand_constellation(compact: List[tuple]) -> Dict[str, dict]:
+    """Constellation a RouteGenerator can be built from, from compact_constellation()"""
+    return {
+        sat_id: {
+            "freshness": freshness,
+            "load": load,
+            "neighbours": {
+                neighbour_id: {"function": function, "public_key": ""} for neighbour_id in neighbour_ids
+            }
+        }
+        for sat_id, function, freshness, load, neighbour_ids in compact
+    }
+
+
+# Generator of each worker process, and the constellation snapshot it was built from
+_worker_generator: Optional["RouteGenerator"] = None
+_worker_snapshot: Optional[int] = None
+
+
+def _generate_in_worker(
+    snapshot: int, compact: List[tuple], dense_hop_distances: bool,
+    walk_pairs: List[Tuple[str, str]], shortest_pairs: List[Tuple[str, str]]
+) -> Tuple[Dict[Tuple[str, str], Tuple[List[Route], Set[str]]], Dict[Tuple[str, str], List[Route]]]:
+    global _worker_generator, _worker_snapshot
+    if snapshot != _worker_snapshot:
+        # Built once per snapshot in each worker, then reused for its other chunks
+        _worker_generator = RouteGenerator(
+            constellation=expand_constellation(compact), dense_hop_distances=dense_hop_distances)
+        _worker_snapshot = snapshot
+    walk_routes = {pair: _worker_generator.trace_walk_routes(*pair) for pair in walk_pairs}
+    shortest_routes = {pair: _worker_generator.generate_shortest_path_routes(*pair) for pair in shortest_pairs}
+    return walk_routes, shortest_routes
+
+
+# Worker processes kept between generations, see get_route_pool()
+_route_pool: Optional[ProcessPoolExecutor] = None
+_route_pool_workers = 0
+_route_pool_lock = threading.Lock()
+_snapshots = itertools.count(1)
+
+
+def get_route_pool(workers: int = route_workers) -> ProcessPoolExecutor:
+    """
+    Pool of route worker processes, started on first use and kept for later generations.
+    Workers are started from a fresh process rather than forked from this one, whose scheduler
+    and request threads may hold locks a forked child would never see released.
+    """
+    global _route_pool, _route_pool_workers
+    with _route_pool_lock:
+        if _route_pool is None or _route_pool_workers != workers:
+            if _route_pool is not None:
+                _route_pool.shutdown(wait=False)
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                # Forked from a server that already imported the route generator, so workers start quickly
+                context.set_forkserver_preload(["src.routing.route_generator"])
+            else:
+                context = multiprocessing.get_context("spawn")
+            _route_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _route_pool_workers = workers
+        return _route_pool
+
+
+@atexit.register
+def shutdown_route_pool():
+    global _route_pool
+    with _route_pool_lock:
+        if _route_pool is not None:
+            _route_pool.shutdown(wait=False, cancel_futures=True)
+            _route_pool = None
+
+
+def generate_pairs_parallel(
+    constellation: Dict[str, dict],
+    walk_pairs: Set[Tuple[str, str]],
+    shortest_pairs: Set[Tuple[str, str]],
+    workers: int = route_workers,
+    dense_hop_distances: bool = True
+) -> Tuple[Dict[Tuple[str, str], Tuple[List[Route], Set[str]]], Dict[Tuple[str, str], List[Route]]]:
+    """
+    Generate walk routes (with their dependencies, see trace_walk_routes()) and shortest path
+    routes for many pairs across the pool of worker processes.
+    Pairs are split by source, so each worker computes a source's shortest path tree once.
+    Each chunk carries the compact constellation it is generated from, which workers only build
+    a generator from the first time they see it.
+    """
+    by_source: Dict[str, Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]] = defaultdict(lambda: ([], []))
+    for pair in walk_pairs:
+        by_source[pair[0]][0].append(pair)
+    for pair in shortest_pairs:
+        by_source[pair[0]][1].append(pair)
+
+    # A few chunks per worker, so one slow chunk does not leave the others idle
+    sources = list(by_source)
+    chunk_count = min(len(sources), workers * 4)
+    chunks = []
+    for position in range(chunk_count):
+        chunk_walk_pairs, chunk_shortest_pairs = [], []
+        for source_id in sources[position::chunk_count]:
+            chunk_walk_pairs.extend(by_source[source_id][0])
+            chunk_shortest_pairs.extend(by_source[source_id][1])
+        chunks.append((chunk_walk_pairs, chunk_shortest_pairs))
+
+    snapshot = next(_snapshots)
+    compact = compact_constellation(constellation)
+    tasks = [(snapshot, compact, dense_hop_distances, chunk_walk_pairs, chunk_shortest_pairs)
+             for chunk_walk_pairs, chunk_shortest_pairs in chunks]
+    try:
+        results = list(get_route_pool(workers).map(_generate_in_worker, *zip(*tasks)))
+    except BrokenProcessPool:
+        # A worker died, e.g. killed for using too much memory. Start a new pool and try once more
+        shutdown_route_pool()
+        results = list(get_route_pool(workers).map(_generate_in_worker, *zip(*tasks)))
+
+    walk_routes, shortest_routes = {}, {}
+    for chunk_walk_routes, chunk_shortest_routes in results:
+        walk_routes.update(chunk_walk_routes)
+        shortest_routes.update(chunk_shortest_routes)
+    return walk_routes, shortest_routes
+
+
+class IncrementalRouteEngine:
+    """
+    Keeps the routes for a constellation file in memory and, when the file changes,
+    only recomputes the (source, destination) pairs whose walks touched a changed node.
+    Shortest paths depend on the whole topology, so they are only recomputed (once per source)
+    when a link was added or removed.
+    If source_ids is given, only routes starting from those satellites are generated.
+    """
+
+    def __init__(self, constellation_file: Optional[str], source_ids: Optional[Set[str]] = None):
+        self.constellation_file = constellation_file
+        self.source_ids = set(source_ids) if source_ids is not None else None
+        # Sources added since the last refresh, whose routes have not been generated yet
+        self._pending_sources: Set[str] = set()
+        self.generator: Optional[RouteGenerator] = None
+        self.routes: Dict[str, Dict[str, List[Route]]] = {}
+        self._walk_routes: Dict[Tuple[str, str], List[Route]] = {}
+        self._shortest_routes: Dict[Tuple[str, str], List[Route]] = {}
+        self._contact_routes: Dict[Tuple[str, str], List[Route]] = {}
+        # Nodes read while generating each pair, and the reverse index used to find affected pairs
+        self._dependencies: Dict[Tuple[str, str], Set[str]] = {}
+        self._dependants: Dict[str, Set[Tuple[str, str]]] = defaultdict(set)
+
+    def refresh(self, constellation: Optional[Dict[str, dict]] = None) -> bool:
+        """
+        Bring the routes up to date with the constellation file, or with the given
+        constellation if the caller has already loaded it.
+        Returns True if any route was recomputed.
+        """
+        if constellation is None:
+            constellation = read_constellation(self.constellation_file)
+
+        if self.generator is None:
+            # Routes from only a few sources only need the hop distances from around them
+            self.generator = RouteGenerator(
+                self.constellation_file, constellation, dense_hop_distances=self.source_ids is None)
+            pairs = self._all_pairs()
+            shortest_pairs = pairs
+            contact_pairs = pairs
+        else:
+            change = self.generator.update_constellation(constellation)
+            for sat_id in change.removed:
+                self._drop_node(sat_id)
+            pairs = self._affected_pairs(change)
+            satellites = self.generator.satellites
+            for source_id in self._pending_sources & satellites.keys():
+                pairs.update((source_id, dest_id) for dest_id in satellites if dest_id != source_id)
+            if change.topology_changed:
+                pairs.update(self._hop_distance_pairs(change))
+                shortest_pairs = self._all_pairs()
+            else:
+                shortest_pairs = {pair for pair in pairs if pair not in self._shortest_routes}
+            # Contact plan routes depend on every link's RTT, and on the time if links have contact windows
+            if change.link_metrics_changed or (change.dirty and self.generator.has_contact_windows):
+                contact_pairs = self._all_pairs()
+            else:
+                contact_pairs = {pair for pair in pairs if pair not in self._contact_routes}
+        self._pending_sources.clear()
+
+        if route_workers > 1 and len(pairs) + len(shortest_pairs) >= parallel_route_min_pairs:
+            # Typically the first full table, or a link change in full mode
+            walk_routes, shortest_routes = generate_pairs_parallel(
+                self.generator.constellation, pairs, shortest_pairs,
+                dense_hop_distances=self.generator.dense_hop_distances)
+            for pair, (routes, dependencies) in walk_routes.items():
+                self._store_walk_routes(pair, routes, dependencies)
+            self._shortest_routes.update(shortest_routes)
+        else:
+            for source_id, dest_id in pairs:
+                self._recompute(source_id, dest_id)
+            for source_id, dest_id in shortest_pairs:
+                self._shortest_routes[(source_id, dest_id)] = self.generator.generate_shortest_path_routes(
+                    source_id, dest_id)
+        # One earliest arrival search per source, so these are always generated in-process
+        for source_id, dest_id in contact_pairs:
+            contact_route = self.generator.generate_contact_plan_route(source_id, dest_id)
+            self._contact_routes[(source_id, dest_id)] = [contact_route] if contact_route else []
+
+        for source_id, dest_id in pairs | shortest_pairs | contact_pairs:
+            pair = (source_id, dest_id)
+            self.routes.setdefault(source_id, {})[dest_id] = sort_routes(
+                self._walk_routes[pair] + self._shortest_routes[pair] + self._contact_routes[pair]
+            )
+        return bool(pairs or shortest_pairs or contact_pairs)
+
+    def add_source(self, source_id: str):
+        """Start generating routes from another satellite, from the next refresh onwards"""
+        if self.source_ids is None or source_id in self.source_ids:
+            return
+        self.source_ids.add(source_id)
+        self._pending_sources.add(source_id)
+
+    def _sources(self) -> List[str]:
+        if self.source_ids is None:
+            return list(self.generator.satellites)
+        return [source_id for source_id in self.source_ids if source_id in self.generator.satellites]
+
+    def _all_pairs(self) -> Set[Tuple[str, str]]:
+        satellites = self.generator.satellites
+        return {
+            (source_id, dest_id)
+            for source_id in self._sources()
+            for dest_id in satellites
+            if source_id != dest_id
+        }
+
+    def _affected_pairs(self, change: ConstellationChange) -> Set[Tuple[str, str]]:
+        pairs = set()
+        for sat_id in change.dirty:
+            pairs.update(self._dependants.get(sat_id, ()))
+
+        # New nodes need routes both from and to them
+        sources = self._sources()
+        for sat_id in change.added:
+            if sat_id in sources:
+                pairs.update((sat_id, dest_id) for dest_id in self.generator.satellites if dest_id != sat_id)
+            pairs.update((source_id, sat_id) for source_id in sources if source_id != sat_id)
+
+        satellites = self.generator.satellites
+        return {(s, d) for s, d in pairs if s in satellites and d in satellites}
+
+    def _hop_distance_pairs(self, change: ConstellationChange) -> Set[Tuple[str, str]]:
+        """
+        Pairs whose walks read the hop distance to their destination from a node it changed for.
+        Walks read it for every node in their dependencies, so the others would walk the same way.
+        """
+        if change.previous_hop_distances is None:
+            return self._all_pairs()
+        pairs = set()
+        for dest_id, node_ids in self.generator.hop_distance_changes(*change.previous_hop_distances).items():
+            for node_id in node_ids:
+                pairs.update(pair for pair in self._dependants.get(node_id, ()) if pair[1] == dest_id)
+        return pairs
+
+    def _drop_node(self, sat_id: str):
+        self.routes.pop(sat_id, None)
+        for dest_routes in self.routes.values():
+            dest_routes.pop(sat_id, None)
+        stale_pairs = [pair for pair in self._walk_routes if sat_id in pair]
+        for pair in stale_pairs:
+            self._forget_dependencies(pair)
+            self._walk_routes.pop(pair, None)
+            self._shortest_routes.pop(pair, None)
+            self._contact_routes.pop(pair, None)
+
+    def _forget_dependencies(self, pair: Tuple[str, str]):
+        for node_id in self._dependencies.pop(pair, ()):
+            dependants = self._dependants.get(node_id)
+            if dependants is not None:
+                dependants.discard(pair)
+                if not dependants:
+                    del self._dependants[node_id]
+
+    def _recompute(self, source_id: str, dest_id: str):
+        routes, dependencies = self.generator.trace_walk_routes(source_id, dest_id)
+        self._store_walk_routes((source_id, dest_id), routes, dependencies)
+
+    def _store_walk_routes(self, pair: Tuple[str, str], routes: List[Route], dependencies: Set[str]):
+        self._forget_dependencies(pair)
+        self._walk_routes[pair] = routes
+        self._dependencies[pair] = dependencies
+        for node_id in dependencies:
+            self._dependants[node_id].add(pair)
+
+
+def read_constellation(constellation_file: str) -> Dict[str, dict]:
+    # A constellation file, or the state store it is kept in with STATE_STORE=sqlite
+    return load_constellation(constellation_file)
+
+
+def serialise_routes(routes: Dict[str, Dict[str, List[Route]]]) -> Dict[str, Dict[str, List[dict]]]:
+    """Convert Route objects to the format stored in the routing table files"""
+    serializable_routes = {}
+    for source in routes:
+        serializable_routes[source] = {}
+        for dest in routes[source]:
+            serializable_routes[source][dest] = [
+                serialise_route(route) for route in routes[source][dest]
+            ]
+    return serializable_routes
+
+
+def serialise_route(route: Route) -> dict:
+    return {
+        "path": route.path,
+        "type": route.type.name,
+        "score": route.score,
+        "metrics": route.metrics
+    }
+
+
+def generate_routes_from_source(generator: RouteGenerator, source_id: str) -> Dict[str, List[Route]]:
+    """Generate the routes from one satellite to every other satellite in the constellation"""
+    return {
+        dest_id: generator.generate_routes(source_id, dest_id)
+        for dest_id in generator.satellites
+        if dest_id != source_id
+    }
+
+
+def merge_constellation(our_constellation: Dict[str, dict], received_constellation: Dict[str, dict]) -> Set[str]:
+    """
+    Merge a received constellation into ours, keeping the latest version of each node, or
+    the freshest copy of it if both have the same version.
+    Returns the IDs of the nodes whose entries changed.
+    """
+    changed = set()
+    for node_id, node_data in received_constellation.items():
+        # If node doesn't exist in our constellation, add it
+        if node_id not in our_constellation:
+            our_constellation[node_id] = node_data
+            changed.add(node_id)
+            continue
+
+        received_version = node_data.get('version', 0)
+        our_version = our_constellation[node_id].get('version', 0)
+        if received_version > our_version:
+            our_constellation[node_id] = node_data
+            changed.add(node_id)
+        # If node exists and received data is fresher
+        elif received_version == our_version and node_data['freshness'] > our_constellation[node_id]['freshness']:
+            # Compare neighbours data excluding freshness
+            current_neighbours = our_constellation[node_id]['neighbours']
+            new_neighbours = node_data['neighbours']
+
+            if current_neighbours != new_neighbours:
+                # Update entire node data if there are changes
+                our_constellation[node_id] = node_data
+            else:
+                # Only update freshness if no other changes. The entry is copied rather than
+                # modified in place, as route engines hold on to the previous entries
+                our_constellation[node_id] = {**our_constellation[node_id], 'freshness': node_data['freshness']}
+            changed.add(node_id)
+    return changed
+
+
+# One engine per constellation file and source, kept between heartbeats so only changes are recomputed
+_route_engines: Dict[Tuple[str, Optional[str]], IncrementalRouteEngine] = {}
+# Last routes generated to other areas for each constellation file, see areas.py
+_inter_area_routes: Dict[str, Dict[str, List[Route]]] = {}
+
+
+# Held while a routing table is built from each constellation, see create_routing_table()
+_route_build_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_route_build_locks_lock = threading.Lock()
+
+
+def route_build_lock(constellation_path: str) -> threading.Lock:
+    with _route_build_locks_lock:
+        return _route_build_locks[constellation_path]
+
+
+def get_route_engine(constellation_path: str, source_id: Optional[str] = None) -> IncrementalRouteEngine:
+    key = (constellation_path, source_id)
+    engine = _route_engines.get(key)
+    if engine is None:
+        source_ids = {source_id} if source_id is not None else None
+        engine = IncrementalRouteEngine(constellation_path, source_ids)
+        _route_engines[key] = engine
+    return engine
+
+
+def fetch_routes_from_service(satellite_id: str, constellation: Dict[str, dict]) -> Dict[str, List[dict]]:
+    """
+    Ask the host's shared routing service (see src/routing/routing_service.py) for the routes
+    from satellite_id, after merging our constellation into the one it keeps.
+    """
+    response = http_client.post(
+        f"{routing_service_url}/routes",
+        json={"source": satellite_id, "constellation": constellation},
+        timeout=10
+    )
+    response.raise_for_status()
+    return response.json()["data"]["routes"]
+
+
+def create_routing_table(constellation_path: str, port: str, mode: str, routes_dir: str):
+    """Build and save the routing table for the satellite with the given constellation file"""
+    # Heartbeats from several neighbours are handled at once, and would otherwise refresh the route
+    # engine of the constellation, and write the table it produces, concurrently
+    with route_build_lock(constellation_path):
+        _build_routing_table(constellation_path, port, mode, routes_dir)
+
+
+def _build_routing_table(constellation_path: str, port: str, mode: str, routes_dir: str):
+    # Stamp the constellation before reading it, so a concurrent write is picked up by the next reachability check
+    stamp = constellation_stamp(constellation_path)
+    # Read constellation file to get the full satellite ID
+    constellation = read_constellation(constellation_path)
+    # Get the satellite ID that matches this port
+    satellite_id = next(
+        sat_id for sat_id in constellation.keys()
+        if sat_id.endswith(f":{port}")
+    )
+
+    serializable_routes = None
+    if routing_service_url and mode == ROUTING_TABLE_MODE_OWN_SOURCE:
+        try:
+            serializable_routes = {satellite_id: fetch_routes_from_service(satellite_id, constellation)}
+        except requests.RequestException as e:
+            print(f"Routing service unavailable, generating routes locally: {e}")
+
+    if serializable_routes is None:
+        # Only recompute the routes affected by what changed since the last heartbeat
+        source_id = satellite_id if mode == ROUTING_TABLE_MODE_OWN_SOURCE else None
+        engine = get_route_engine(constellation_path, source_id)
+        changed = engine.refresh(constellation)
+        reachability.publish(constellation_path, engine.generator.components(), stamp)
+
+        routes = engine.routes
+        if hierarchical_routing:
+            # Other areas are only known from their summaries, which change independently of our constellation
+            summaries = {**read_area_summaries(port), routing_area: summarise_area(constellation, routing_area)}
+            inter_area_routes = engine.generator.generate_inter_area_routes(satellite_id, summaries, routing_area)
+            changed = changed or inter_area_routes != _inter_area_routes.get(constellation_path)
+            _inter_area_routes[constellation_path] = inter_area_routes
+            routes = {**routes, satellite_id: {**routes.get(satellite_id, {}), **inter_area_routes}}
+        if not changed:
+            return
+
+        # Convert Route objects to serializable format
+        serializable_routes = serialise_routes(routes)
+
+    rankings = {
+        source: rank_routing_table(source_routes)
+        for source, source_routes in serializable_routes.items()
+    }
+
+    if use_state_store:
+        # Only the destinations whose routes changed are written
+        store = get_state_store(port)
+        for source, source_routes in serializable_routes.items():
+            store.write_routes(source, source_routes, rankings[source])
+    else:
+        write_routing_table_files(satellite_id, serializable_routes, rankings, routes_dir)
+
+    # Lookups in this process can use the new table, and its route rankings, straight away
+    if satellite_id in serializable_routes:
+        routing_table_cache.publish(satellite_id, serializable_routes[satellite_id], rankings[satellite_id])
+
+        # Record which destinations changed, for clients syncing the table incrementally
+        versions_file = os.path.join(routes_dir, f"{satellite_id}.version.json")
+        record_build(versions_file, serializable_routes[satellite_id], rankings[satellite_id])
+
+    # print(f"Generated routes for satellite {satellite_id}")
+
+
+def write_routing_table_files(
+    satellite_id: str, serializable_routes: Dict[str, Dict[str, List[dict]]],
+    rankings: Dict[str, Dict[str, Dict[str, List[int]]]], routes_dir: str
+):
+    """Write a routing table to the files chosen by ROUTING_TABLE_FORMAT, removing the others"""
+    # Save routes to file using full satellite ID
+    routes_file = os.path.join(
+        routes_dir, f"{satellite_id}.json")  # Using full IP:port
+    binary_routes_file = os.path.join(routes_dir, f"{satellite_id}.bin")
+    if routing_table_format in (ROUTING_TABLE_FORMAT_JSON, ROUTING_TABLE_FORMAT_BOTH):
+        # Write to a temporary file and swap it in, so readers never see a half written table
+        with open(f"{routes_file}.tmp", 'w') as f:
+            json.dump(serializable_routes, f, indent=4)
+            f.close()
+        os.replace(f"{routes_file}.tmp", routes_file)
+    elif os.path.exists(routes_file):
+        os.remove(routes_file)
+
+    if routing_table_format in (ROUTING_TABLE_FORMAT_BINARY, ROUTING_TABLE_FORMAT_BOTH):
+        write_binary_routing_table(binary_routes_file, serializable_routes, rankings)
+    elif os.path.exists(binary_routes_file):
+        # Lookups prefer the binary table, so it must not be left behind out of date
+        os.remove(binary_routes_file)
+
+
+def create_routing_tables(mode: Optional[str] = None, port: Optional[str] = None):
+    """
+    Build the routing table for the satellite on the given port, or for every constellation
+    under resources/ if no port is given.
+    In own-source mode (the default) each table only holds the routes from its own satellite,
+    which is all find_best_route() reads. Full mode computes every source/destination pair.
+    Lazy mode builds no tables, routes are generated when they are looked up (see lazy_routes.py).
+    """
+    mode = mode or routing_table_mode
+    if mode == ROUTING_TABLE_MODE_LAZY:
+        return
+    if mode not in (ROUTING_TABLE_MODE_OWN_SOURCE, ROUTING_TABLE_MODE_FULL):
+        raise ValueError(f"Unknown routing table mode: {mode}")
+
     base_dir = os.getcwd()
     constellation_dir = os.path.join(
         base_dir, "resources", "satellite_constellation_set")
@@ -317,48 +1337,36 @@ def create_routing_tables():
 
     os.makedirs(routes_dir, exist_ok=True)
 
+    if port is not None:
+        # Co-located satellites share resources/, so only build our own table
+        if use_state_store:
+            constellation_path = state_store.constellation_path(port)
+        else:
+            constellation_path = os.path.join(constellation_dir, f"constellation_{port}.json")
+        create_routing_table(constellation_path, str(port), mode, routes_dir)
+        return
+
+    if use_state_store:
+        for filename in os.listdir(os.path.join(base_dir, "resources", "state")):
+            if filename.startswith("state_") and filename.endswith(".db"):
+                port = filename[len("state_"):-len(".db")]
+                create_routing_table(state_store.constellation_path(port), port, mode, routes_dir)
+        return
+
     for filename in os.listdir(constellation_dir):
         if filename.startswith("constellation_") and filename.endswith(".json"):
             port = filename.split("_")[1].split(".")[0]
             constellation_path = os.path.join(constellation_dir, filename)
-
-            # Read constellation file to get the full satellite ID
-            with open(constellation_path, 'r') as f:
-                constellation = json.load(f)
-                # Get the satellite ID that matches this port
-                satellite_id = next(
-                    sat_id for sat_id in constellation.keys()
-                    if sat_id.endswith(f":{port}")
-                )
-                f.close()
-
-            # Generate routes with all strategies
-            routes = generate_all_routes(constellation_path)
-
-            # Convert Route objects to serializable format
-            serializable_routes = {}
-            for source in routes:
-                serializable_routes[source] = {}
-                for dest in routes[source]:
-                    serializable_routes[source][dest] = [
-                        {
-                            "path": route.path,
-                            "type": route.type.name,
-                            "score": route.score,
-                            "metrics": route.metrics
-                        }
-                        for route in routes[source][dest]
-                    ]
-
-            # Save routes to file using full satellite ID
-            routes_file = os.path.join(
-                routes_dir, f"{satellite_id}.json")  # Using full IP:port
-            with open(routes_file, 'w') as f:
-                json.dump(serializable_routes, f, indent=4)
-                f.close()
-
-            # print(f"Generated routes for satellite {satellite_id}")
+            create_routing_table(constellation_path, port, mode, routes_dir)
 
 
 if __name__ == "__main__":
-    create_routing_tables()
+    parser = argparse.ArgumentParser(description="Generate the routing tables for every constellation file")
+    parser.add_argument('--mode', type=str, default=None,
+                        choices=[ROUTING_TABLE_MODE_OWN_SOURCE, ROUTING_TABLE_MODE_FULL],
+                        help='Which sources to generate routes for (defaults to ROUTING_TABLE_MODE)')
+    parser.add_argument('--port', type=str, default=None,
+                        help='Only generate the table for the satellite on this port')
+    args = parser.parse_args()
+
+    create_routing_tables(args.mode, args.port)
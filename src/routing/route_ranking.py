@@ -0,0 +1,89 @@
+"""
+Ranking of routes by priority.
+
+The weights only depend on the route type and the priority level, so the order in which
+routes should be tried can be worked out once when a routing table is built, rather than
+on every lookup.
+"""
+from enum import Enum
+from typing import Dict, List
+
+
+class RouteType(Enum):
+    """Base weight of each route type"""
+    DIRECT = 10
+    FUNCTION_BASED = 3
+    LOAD_BALANCED = 2
+    RANDOM = 1
+    SHORTEST_PATH = 4
+    INTER_AREA = 5
+    # Below SHORTEST_PATH, so a contact plan route only wins where its links are measurably faster
+    CONTACT_PLAN = 3.5
+
+
+# Assign weights based on priority
+PRIORITY_WEIGHTS = {
+    "high": {
+        "DIRECT": 1.0,
+        "FUNCTION_BASED": 0.8,
+        "LOAD_BALANCED": 0.6,
+        "RANDOM": 0.4,
+        "SHORTEST_PATH": 1.0,
+        "INTER_AREA": 1.0,
+        "CONTACT_PLAN": 1.0
+    },
+    "medium": {
+        "DIRECT": 0.8,
+        "FUNCTION_BASED": 1.0,
+        "LOAD_BALANCED": 0.8,
+        "RANDOM": 0.6,
+        "SHORTEST_PATH": 0.8,
+        "INTER_AREA": 0.8,
+        "CONTACT_PLAN": 0.8
+    },
+    "low": {
+        "DIRECT": 0.6,
+        "FUNCTION_BASED": 0.8,
+        "LOAD_BALANCED": 1.0,
+        "RANDOM": 0.8,
+        "SHORTEST_PATH": 0.6,
+        "INTER_AREA": 0.6,
+        "CONTACT_PLAN": 0.6
+    }
+}
+
+
+def priority_score(route: dict, priority: str) -> float:
+    """Composite score of a serialised route for the given priority"""
+    base_weight = RouteType[route["type"]].value
+    priority_weight = PRIORITY_WEIGHTS[priority][route["type"]]
+    return base_weight * priority_weight * route["score"]
+
+
+def scored_route(route: dict, priority: str) -> dict:
+    """Copy of a serialised route, with its score replaced by the composite score for priority"""
+    return {
+        "path": route["path"],
+        "type": route["type"],
+        "score": priority_score(route, priority),
+        "metrics": route["metrics"]
+    }
+
+
+def rank_routes(routes: List[dict]) -> Dict[str, List[int]]:
+    """
+    Indices of routes from best to worst, for each priority.
+    Ties keep the stored order, which is what max() over the routes used to pick.
+    """
+    return {
+        priority: sorted(range(len(routes)), key=lambda i: -priority_score(routes[i], priority))
+        for priority in PRIORITY_WEIGHTS
+    }
+
+
+def rank_routing_table(source_routes: Dict[str, List[dict]]) -> Dict[str, Dict[str, List[int]]]:
+    """Ranked route indices for each destination and priority"""
+    return {
+        destination: rank_routes(routes)
+        for destination, routes in source_routes.items()
+    }
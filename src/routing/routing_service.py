@@ -0,0 +1,62 @@
+"""
+Shared routing service for satellites running on the same host.
+
+When multi-device.sh starts many satellites on one machine, each of them would otherwise
+generate routes over its own copy of the constellation. This service keeps one merged
+constellation and one incremental route engine for all of them, so every change is only
+computed once per host. Satellites use it when ROUTING_SERVICE_URL is set, e.g.
+
+    python3 -m src.routing.routing_service --port 33000
+    export ROUTING_SERVICE_URL=http://127.0.0.1:33000
+"""
+import argparse
+import threading
+from typing import Dict
+
+from flask import Flask, request
+
+from src.helpers.response_helper import create_response
+from src.routing.route_generator import IncrementalRouteEngine, merge_constellation, serialise_routes
+
+app = Flask(__name__)
+
+# Merged constellation of every satellite that has asked for routes
+constellation: Dict[str, dict] = {}
+engine = IncrementalRouteEngine(None, source_ids=set())
+lock = threading.Lock()
+
+
+@app.route('/routes', methods=['POST'])
+def get_routes():
+    """
+    Merge a satellite's constellation into the shared one and return its routes.
+    Expected POST body: {
+        "source": "ip:port",
+        "constellation": {constellation of the satellite}
+    }
+    """
+    body = request.get_json()
+    if not body or "source" not in body:
+        return create_response({"error": "Missing source satellite"}, 400)
+    source = body["source"]
+
+    with lock:
+        merge_constellation(constellation, body.get("constellation", {}))
+        engine.add_source(source)
+        try:
+            # Shallow copy, so the engine can compare the next merge against this one
+            engine.refresh(dict(constellation))
+        except Exception as e:
+            return create_response({"error": f"Failed to generate routes: {e}"}, 500)
+        routes = serialise_routes({source: engine.routes.get(source, {})})[source]
+
+    return create_response({"routes": routes}, 200)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared routing service for co-located satellites")
+    parser.add_argument('--host', type=str, default="127.0.0.1", help='Address to listen on')
+    parser.add_argument('--port', type=int, default=33000, help='Port number')
+    args = parser.parse_args()
+
+    app.run(host=args.host, port=args.port, threaded=True)
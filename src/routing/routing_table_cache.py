@@ -0,0 +1,209 @@
+"""
+Process-wide cache of parsed routing tables.
+
+Routing table files can be several megabytes of indented JSON, and /route, /image and the
+disaster imaging job look routes up many times between two rebuilds. Parsed tables are kept
+in memory and only reloaded when the route builder publishes a new generation, or when the
+file on disk was rewritten by another process (detected through its modification time and
+inode, as the builder replaces the file atomically).
+
+Binary tables (see binary_routing_table.py) are preferred when present: they are mmapped
+rather than parsed, and routes are only decoded for the destinations that are looked up.
+With STATE_STORE=sqlite tables are kept in the device's state store instead, where routes are
+also read one destination at a time, and reloads are detected by the version of the routes.
+"""
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.helpers.state_store import StateStore, route_stamp, route_store_path, state_store_at, use_state_store
+from src.routing.binary_routing_table import BinaryRoutingTable, binary_routes_file_path
+from src.routing.route_ranking import rank_routing_table
+
+
+def routes_file_path(source: str) -> str:
+    return os.path.join("resources", "satellite_routes", f"{source}.json")
+
+
+def _table_file(source: str) -> Tuple[str, Tuple[int, int]]:
+    """The file lookups for source are served from, binary if there is one, and its stamp"""
+    if use_state_store:
+        path = route_store_path(source)
+        if path is None:
+            raise FileNotFoundError(f"No routing table for {source}")
+        return path, route_stamp(path, source)
+    for path in (binary_routes_file_path(source), routes_file_path(source)):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        return path, (stat.st_mtime_ns, stat.st_ino)
+    raise FileNotFoundError(f"No routing table for {source}")
+
+
+class RoutingTable(ABC):
+    """Routes from one satellite, keyed by destination"""
+
+    def __init__(self, source: str, generation: int, file_stamp: Tuple[int, int]):
+        self.source = source
+        self.generation = generation
+        self.file_stamp = file_stamp
+
+    @abstractmethod
+    def routes_to(self, destination: str) -> List[dict]:
+        pass
+
+    @abstractmethod
+    def ranking(self, destination: str) -> Optional[Dict[str, List[int]]]:
+        """Indices into routes_to(destination) from best to worst for each priority, None if unknown"""
+
+    def ranked_routes(self, destination: str) -> Tuple[List[dict], Optional[Dict[str, List[int]]]]:
+        """routes_to(destination) and its ranking, read together so the indices match the routes"""
+        return self.routes_to(destination), self.ranking(destination)
+
+    @abstractmethod
+    def destinations(self) -> Iterable[str]:
+        pass
+
+    @property
+    @abstractmethod
+    def routes(self) -> Dict[str, List[dict]]:
+        """Every route in the table, keyed by destination"""
+
+
+class InMemoryRoutingTable(RoutingTable):
+    def __init__(
+        self, source: str, generation: int, file_stamp: Tuple[int, int],
+        routes: Dict[str, List[dict]], ranked: Dict[str, Dict[str, List[int]]]
+    ):
+        super().__init__(source, generation, file_stamp)
+        self._routes = routes
+        self._ranked = ranked
+
+    def routes_to(self, destination: str) -> List[dict]:
+        return self._routes.get(destination, [])
+
+    def ranking(self, destination: str) -> Optional[Dict[str, List[int]]]:
+        return self._ranked.get(destination)
+
+    def destinations(self) -> Iterable[str]:
+        return self._routes.keys()
+
+    @property
+    def routes(self) -> Dict[str, List[dict]]:
+        return self._routes
+
+
+class MappedRoutingTable(RoutingTable):
+    def __init__(self, source: str, generation: int, table: BinaryRoutingTable):
+        super().__init__(source, generation, table.file_stamp)
+        self._table = table
+
+    def routes_to(self, destination: str) -> List[dict]:
+        return self._table.routes(self.source, destination) or []
+
+    def ranking(self, destination: str) -> Optional[Dict[str, List[int]]]:
+        return self._table.ranking(self.source, destination)
+
+    def destinations(self) -> Iterable[str]:
+        return self._table.destinations(self.source)
+
+    @property
+    def routes(self) -> Dict[str, List[dict]]:
+        return self._table.source_routes(self.source)
+
+
+class StoredRoutingTable(RoutingTable):
+    def __init__(self, source: str, generation: int, file_stamp: Tuple[int, int], store: StateStore):
+        super().__init__(source, generation, file_stamp)
+        self._store = store
+
+    def routes_to(self, destination: str) -> List[dict]:
+        stored = self._store.routes_to(self.source, destination)
+        return stored[0] if stored is not None else []
+
+    def ranking(self, destination: str) -> Optional[Dict[str, List[int]]]:
+        stored = self._store.routes_to(self.source, destination)
+        return stored[1] if stored is not None else None
+
+    def ranked_routes(self, destination: str) -> Tuple[List[dict], Optional[Dict[str, List[int]]]]:
+        stored = self._store.routes_to(self.source, destination)
+        return stored if stored is not None else ([], None)
+
+    def destinations(self) -> Iterable[str]:
+        return self._store.route_destinations(self.source)
+
+    @property
+    def routes(self) -> Dict[str, List[dict]]:
+        return {destination: self.routes_to(destination) for destination in self.destinations()}
+
+
+class RoutingTableCache:
+    def __init__(self):
+        self._tables: Dict[str, RoutingTable] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, source: str) -> Dict[str, List[dict]]:
+        """
+        Return the routes from source, keyed by destination.
+        Raises FileNotFoundError if no routing table has been built for source.
+        """
+        return self.get_table(source).routes
+
+    def get_table(self, source: str) -> RoutingTable:
+        """Return the cached routing table of source, reloading it if it was rebuilt"""
+        path, file_stamp = _table_file(source)
+
+        cached = self._tables.get(source)
+        if cached is not None and cached.file_stamp == file_stamp:
+            return cached
+
+        with self._lock:
+            # Another thread may have reloaded the table while we waited for the lock
+            cached = self._tables.get(source)
+            if cached is not None and cached.file_stamp == file_stamp:
+                return cached
+
+            self._generation += 1
+            if use_state_store:
+                table = StoredRoutingTable(source, self._generation, file_stamp, state_store_at(path))
+            elif path.endswith(".bin"):
+                table = MappedRoutingTable(source, self._generation, BinaryRoutingTable(path))
+            else:
+                with open(path, 'r') as f:
+                    # Stamp the file we actually opened, in case it is replaced again meanwhile
+                    stat = os.fstat(f.fileno())
+                    file_stamp = (stat.st_mtime_ns, stat.st_ino)
+                    routes = json.load(f)[source]
+                table = InMemoryRoutingTable(source, self._generation, file_stamp, routes, rank_routing_table(routes))
+            self._tables[source] = table
+            return table
+
+    def publish(self, source: str, routes: Dict[str, List[dict]], ranked: Dict[str, Dict[str, List[int]]]):
+        """
+        Called by the route builder once it has written a new table for source, along with
+        the rankings it computed, so this process does not need to read the file it just wrote.
+        """
+        _, file_stamp = _table_file(source)
+        with self._lock:
+            self._generation += 1
+            self._tables[source] = InMemoryRoutingTable(source, self._generation, file_stamp, routes, ranked)
+
+    def invalidate(self, source: Optional[str] = None):
+        """Drop the cached table for source, or every cached table"""
+        with self._lock:
+            if source is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(source, None)
+
+    def generation(self, source: str) -> Optional[int]:
+        """Generation of the cached table for source, which increases every time it is replaced"""
+        cached = self._tables.get(source)
+        return cached.generation if cached is not None else None
+
+
+routing_table_cache = RoutingTableCache()
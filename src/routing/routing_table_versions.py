@@ -0,0 +1,108 @@
+"""
+Versions of each satellite's routing table, for clients that sync it incrementally.
+
+Every build that changes the ranked routes to any destination gets the next version number.
+The version each destination last changed in is kept, so GET /routing_table/changes can return
+only the destinations that changed since the version a client last saw. Versions are stored
+next to the routing table, so they keep increasing when the satellite restarts.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+
+def versions_file_path(source: str) -> str:
+    return os.path.join("resources", "satellite_routes", f"{source}.version.json")
+
+
+def ranked_routes_digest(routes: List[dict], ranked: Dict[str, List[int]]) -> str:
+    """Digest of the routes to one destination and their ranking"""
+    encoded = json.dumps([routes, ranked], sort_keys=True).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+class RoutingTableVersions:
+    def __init__(self, version: int = 0, changed: Dict[str, int] = None,
+                 removed: Dict[str, int] = None, digests: Dict[str, str] = None):
+        self.version = version
+        # Version each destination's routes last changed in, or it was removed in
+        self.changed = changed or {}
+        self.removed = removed or {}
+        self.digests = digests or {}
+
+    @classmethod
+    def load(cls, path: str) -> "RoutingTableVersions":
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return cls()
+        return cls(data["version"], data["changed"], data["removed"], data["digests"])
+
+    def save(self, path: str):
+        # Replaced atomically like the routing tables, so readers never see half a file
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump({
+                "version": self.version,
+                "changed": self.changed,
+                "removed": self.removed,
+                "digests": self.digests
+            }, f)
+        os.replace(f"{path}.tmp", path)
+
+    def update(self, routes: Dict[str, List[dict]], ranked: Dict[str, Dict[str, List[int]]]) -> bool:
+        """
+        Record a new build of the table. Returns True, and moves to the next version,
+        if the ranked routes to any destination were added, changed or removed.
+        """
+        digests = {
+            destination: ranked_routes_digest(dest_routes, ranked[destination])
+            for destination, dest_routes in routes.items()
+        }
+        changed = [destination for destination, digest in digests.items() if self.digests.get(destination) != digest]
+        removed = [destination for destination in self.digests if destination not in digests]
+        if not changed and not removed:
+            return False
+
+        self.version += 1
+        for destination in changed:
+            self.changed[destination] = self.version
+            self.removed.pop(destination, None)
+        for destination in removed:
+            self.changed.pop(destination, None)
+            self.removed[destination] = self.version
+        self.digests = digests
+        return True
+
+    def changes_since(self, version: int) -> Tuple[List[str], List[str]]:
+        """Destinations whose routes changed, and destinations that were removed, after version"""
+        if version > self.version:
+            # The client saw a table this one doesn't descend from, so everything is new to it
+            version = 0
+        changed = [destination for destination, changed_in in self.changed.items() if changed_in > version]
+        removed = [destination for destination, removed_in in self.removed.items() if removed_in > version]
+        return changed, removed
+
+
+# Held while each versions file is loaded, updated and saved again, see record_build()
+_versions_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_versions_locks_lock = threading.Lock()
+
+
+def record_build(path: str, routes: Dict[str, List[dict]], ranked: Dict[str, Dict[str, List[int]]]) -> bool:
+    """
+    Record a new build of a table in the versions file at path, see RoutingTableVersions.update().
+    Two builds that both loaded version V would otherwise both save V + 1 with different changes,
+    and clients that synced to V would never see the first build's changes.
+    """
+    with _versions_locks_lock:
+        lock = _versions_locks[path]
+    with lock:
+        versions = RoutingTableVersions.load(path)
+        if not versions.update(routes, ranked):
+            return False
+        versions.save(path)
+        return True
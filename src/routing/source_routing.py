@@ -0,0 +1,44 @@
+"""
+Source routing of images.
+
+The satellite an image originates from looks up a route once and sends it along in the
+X-Bobb-Route-Header with a cursor pointing at the current hop. Each satellite on the way moves
+the cursor on and forwards to the next hop without looking routes up itself. Only when the next
+hop can't be reached does it fall back to its own forwarding table, from where on the message
+is forwarded hop by hop.
+"""
+import os
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from src.config.constants import X_BOBB_ROUTE_HEADER
+from src.utils.headers.route_header import BobbRouteHeader
+
+# Set SOURCE_ROUTING=false to look the route up again at every hop
+source_routing = os.getenv("SOURCE_ROUTING", "true").lower() != "false"
+
+
+def route_headers(headers: Mapping[str, str], path: Optional[List[str]], cursor: int = 0) -> Dict[str, str]:
+    """
+    Copy of headers carrying the source route of a message sent to path[cursor],
+    or without a route if path is None and the message is forwarded hop by hop.
+    """
+    headers = dict(headers)
+    headers.pop(X_BOBB_ROUTE_HEADER, None)
+    if source_routing and path is not None:
+        headers[X_BOBB_ROUTE_HEADER] = BobbRouteHeader(path, cursor).build_route_header().hex()
+    return headers
+
+
+def next_hop_from_route(route_header: Optional[dict], current_id: str) -> Optional[Tuple[List[str], int]]:
+    """
+    Path and cursor to forward a source routed message with, or None if the message has no
+    usable route and one has to be looked up.
+    """
+    if not source_routing or route_header is None:
+        return None
+
+    path, cursor = route_header["path"], route_header["cursor"]
+    # The route must have been sent to us, and must continue after us
+    if path[cursor] != current_id or cursor + 1 >= len(path):
+        return None
+    return path, cursor + 1
@@ -0,0 +1,46 @@
+# protocol/route_header.py
+
+import socket
+import struct
+
+
+class BobbRouteHeader:
+    """
+    Source route of a message: every hop after the originator, up to and including the
+    destination, and a cursor pointing at the hop the message is being sent to.
+    Each hop is packed as a 4 byte IPv4 address and a 2 byte port.
+    """
+
+    def __init__(self, path=None, cursor=0):
+        self.path = path if path is not None else []
+        self.cursor = cursor
+
+    def build_route_header(self):
+        if not 0 <= self.cursor < len(self.path) <= 255:
+            raise ValueError("Invalid route cursor or length")
+
+        header = struct.pack("!BB", self.cursor, len(self.path))
+        for hop in self.path:
+            ip, port = hop.split(":")
+            try:
+                header += socket.inet_pton(socket.AF_INET, ip)
+            except socket.error:
+                raise ValueError("Invalid IPv4 address")
+            header += struct.pack("!H", int(port))
+        return header
+
+    def parse_route_header(self, raw_data):
+        cursor, hop_count = struct.unpack("!BB", raw_data[:2])
+        if len(raw_data) != 2 + 6 * hop_count or cursor >= hop_count:
+            raise ValueError("Invalid route header length")
+
+        path = []
+        for position in range(2, len(raw_data), 6):
+            ip = socket.inet_ntop(socket.AF_INET, raw_data[position:position + 4])
+            port = struct.unpack("!H", raw_data[position + 4:position + 6])[0]
+            path.append(f"{ip}:{port}")
+
+        return {
+            "cursor": cursor,
+            "path": path
+        }
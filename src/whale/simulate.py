@@ -5,21 +5,12 @@ import time
 import argparse
 import sys
 import socket
-import requests
 import signal
 import math
 from src.utils.headers import necessary_headers
 from src.discovery.discovery import find_x_satellites
 from src.config.constants import BASESTATION
-
-# TODO set up local verification
-import urllib3
-urllib3.disable_warnings()
-
-proxies = {
-    "http": "",
-    "https": "",
-}
+from src.helpers import http_client
 
 def handle_sigint(signal, frame):
     print("Program interrupted. Exiting...")
@@ -88,14 +79,13 @@ class WhaleModel:
 
         # Send acknowledgment request to satellite
         try:
-            # TODO: enable verification
-            response = requests.post(f"https://{self.satellite_ip}:{self.satellite_port}/call_satellite_from_whale", verify=False, timeout=surface_time, proxies=proxies, headers=headers, json= {
+            response = http_client.post(f"https://{self.satellite_ip}:{self.satellite_port}/call_satellite_from_whale", timeout=surface_time, headers=headers, json= {
                 "source": f"{self.ip}:{self.port}",
                 "destination": f"{self.destination_ip}:{self.destination_port}",
                 "message": sample_data,
                 "priority": "high"
             })
-            #response = requests.get(f"https://{self.satellite_ip}:{self.satellite_port}/route", headers=headers, verify=False, timeout=surface_time, proxies=proxies)
+            #response = http_client.get(f"https://{self.satellite_ip}:{self.satellite_port}/route", headers=headers, timeout=surface_time)
             print(f"Whale {self.whale_id} received response code {response.status_code} and content: {response.text}")
         except Exception as e:
             print(f"Failed to send data for whale {self.whale_id}: {e}")
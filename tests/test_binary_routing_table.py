@@ -0,0 +1,70 @@
+import json
+
+from src.routing.benchmark import synthetic_constellation
+from src.routing.binary_routing_table import BinaryRoutingTable, write_binary_routing_table
+from src.routing.route_generator import RouteGenerator, generate_routes_from_source, serialise_routes
+from src.routing.route_ranking import rank_routing_table
+
+
+def json_routes(constellation):
+    generator = RouteGenerator(constellation=constellation)
+    routes = {source_id: generate_routes_from_source(generator, source_id) for source_id in generator.satellites}
+    # Read back the way the JSON routing tables are
+    return json.loads(json.dumps(serialise_routes(routes)))
+
+
+def write_table(path, routes):
+    rankings = {source: rank_routing_table(source_routes) for source, source_routes in routes.items()}
+    write_binary_routing_table(str(path), routes, rankings)
+    return rankings
+
+
+def test_binary_table_matches_json_table(tmp_path):
+    routes = json_routes(synthetic_constellation(15, degree=3))
+    rankings = write_table(tmp_path / "routes.bin", routes)
+
+    table = BinaryRoutingTable(str(tmp_path / "routes.bin"))
+    for source, source_routes in routes.items():
+        assert sorted(table.destinations(source)) == sorted(source_routes)
+        assert table.source_routes(source) == source_routes
+        for destination, dest_routes in source_routes.items():
+            assert table.routes(source, destination) == dest_routes
+            assert table.ranking(source, destination) == rankings[source][destination]
+
+
+def test_metrics_keep_their_type(tmp_path):
+    route = {"path": ["a:1", "b:2"], "type": "DIRECT", "score": 0.25,
+             "metrics": {"hops": 1, "load": 0.5, "delay": 12.0}}
+    write_table(tmp_path / "routes.bin", {"a:1": {"b:2": [route]}})
+
+    decoded = BinaryRoutingTable(str(tmp_path / "routes.bin")).routes("a:1", "b:2")[0]
+    assert decoded == route
+    assert type(decoded["metrics"]["hops"]) is int
+    assert type(decoded["metrics"]["delay"]) is float
+
+
+def test_missing_records(tmp_path):
+    routes = json_routes(synthetic_constellation(5, degree=2))
+    write_table(tmp_path / "routes.bin", routes)
+    source = next(iter(routes))
+
+    table = BinaryRoutingTable(str(tmp_path / "routes.bin"))
+    assert table.routes(source, source) is None
+    assert table.ranking(source, "10.99.0.1:33001") is None
+    assert table.routes("10.99.0.1:33001", source) is None
+    assert list(table.destinations("10.99.0.1:33001")) == []
+    assert table.source_routes("10.99.0.1:33001") == {}
+
+
+def test_wide_ids_past_65535_strings(tmp_path):
+    hops = [f"10.{i // 65536}.{i // 256 % 256}.{i % 256}:33001" for i in range(70000)]
+    routes = {hops[0]: {
+        hops[-1]: [
+            {"path": hops[:40000], "type": "RANDOM", "score": 0.1, "metrics": {}},
+            {"path": hops[40000:], "type": "RANDOM", "score": 0.2, "metrics": {}},
+        ]
+    }}
+    write_table(tmp_path / "routes.bin", routes)
+
+    table = BinaryRoutingTable(str(tmp_path / "routes.bin"))
+    assert table.routes(hops[0], hops[-1]) == routes[hops[0]][hops[-1]]
@@ -0,0 +1,60 @@
+from src.routing.forwarding_table import ForwardingTable
+from src.routing.route_ranking import rank_routes
+from src.routing.routing_table_cache import InMemoryRoutingTable
+
+
+def route(*path, score=1.0):
+    return {"path": list(path), "type": "SHORTEST_PATH", "score": score, "metrics": {"hops": len(path)}}
+
+
+class ChangingRoutingTable(InMemoryRoutingTable):
+    """Routing table whose routes change after every lookup, like a lazy table whose constellation changes"""
+
+    def __init__(self, versions):
+        self._versions = iter(versions)
+        super().__init__("a:1", 1, (0, 0), {}, {})
+        self._next()
+
+    def _next(self):
+        routes = next(self._versions, [])
+        self._routes = {"d:4": routes}
+        self._ranked = {"d:4": rank_routes(routes)}
+
+    def routes_to(self, destination):
+        routes = super().routes_to(destination)
+        self._next()
+        return routes
+
+    def ranking(self, destination):
+        ranked = super().ranking(destination)
+        self._next()
+        return ranked
+
+    def ranked_routes(self, destination):
+        ranked_routes = self._routes.get(destination, []), self._ranked.get(destination)
+        self._next()
+        return ranked_routes
+
+
+def test_next_hops_and_best_path():
+    routes = [route("b:2", "d:4", score=3.0), route("c:3", "d:4", score=2.0), route("b:2", "c:3", "d:4", score=1.0)]
+    table = ForwardingTable(InMemoryRoutingTable("a:1", 1, (0, 0), {"d:4": routes}, {"d:4": rank_routes(routes)}))
+
+    assert table.next_hops("d:4") == ["b:2", "c:3"]
+    assert table.next_hop("d:4", avoid={"b:2"}) == "c:3"
+    assert table.best_path("d:4", excluded={"b:2"})[0] == ("c:3", "d:4")
+    assert table.best_path("d:4", excluded={"b:2", "c:3"}) is None
+    assert table.best_path("d:4", excluded={"x:9"})[0] == ("b:2", "d:4")
+    assert table.best_path("e:5") is None
+
+
+def test_route_is_the_checked_path_when_the_table_changes():
+    table = ForwardingTable(ChangingRoutingTable([
+        [route("b:2", "d:4", score=2.0), route("c:3", "d:4", score=1.0)],
+        [route("x:9", "d:4")],
+        [],
+    ]))
+
+    path, index, _ = table.best_path("d:4", excluded={"b:2"})
+    assert path == ("c:3", "d:4")
+    assert table.route("d:4", index)["path"] == ["c:3", "d:4"]
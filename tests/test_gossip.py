@@ -0,0 +1,131 @@
+import copy
+
+from src.heartbeat.gossip import GossipState, apply_freshness, delivery_stamp, freshness_map, next_version
+from src.routing.route_generator import merge_constellation
+
+
+def link(node_id, function="basestation"):
+    ip, port = node_id.split(":")
+    return {"ip": ip, "port": int(port), "public_key": "", "function": function, "last_contact": 0}
+
+
+def constellation():
+    return {
+        "10.0.0.1:33001": {"freshness": 100, "version": 3, "neighbours": {"10.0.0.2:33002": link("10.0.0.2:33002")}},
+        "10.0.0.2:33002": {"freshness": 100, "version": 1, "neighbours": {"10.0.0.1:33001": link("10.0.0.1:33001")}},
+        # From a satellite that predates versions
+        "10.0.0.3:33003": {"freshness": 100, "neighbours": {"10.0.0.1:33001": link("10.0.0.1:33001")}},
+    }
+
+
+def test_next_version_ignores_freshness():
+    previous = constellation()["10.0.0.1:33001"]
+    assert next_version(None, previous) == 1
+    assert next_version(previous, {**previous, "freshness": 200}) == 3
+    moved = copy.deepcopy(previous)
+    moved["neighbours"]["10.0.0.3:33003"] = link("10.0.0.3:33003")
+    assert next_version(previous, moved) == 4
+
+
+def test_delta_only_holds_what_changed():
+    state = GossipState(full_sync_rounds=10)
+    ours = constellation()
+    assert state.delta("n", ours, full_sync=False) == ours
+
+    state.delivered("n", ours)
+    assert state.delta("n", ours, full_sync=False) == {}
+
+    ours["10.0.0.1:33001"] = {**ours["10.0.0.1:33001"], "freshness": 200}
+    assert state.delta("n", ours, full_sync=False) == {}
+    ours["10.0.0.2:33002"] = {**ours["10.0.0.2:33002"], "version": 2}
+    assert list(state.delta("n", ours, full_sync=False)) == ["10.0.0.2:33002"]
+    assert state.delta("n", ours, full_sync=True) == ours
+
+
+def test_missing_entries_are_resent():
+    state = GossipState()
+    ours = constellation()
+    state.delivered("n", ours, missing=["10.0.0.2:33002"])
+    assert list(state.delta("n", ours, full_sync=False)) == ["10.0.0.2:33002"]
+
+    state.delivered("n", ours)
+    state.forget("n")
+    assert state.delta("n", ours, full_sync=False) == ours
+
+
+def test_full_sync_rounds():
+    state = GossipState(full_sync_rounds=3)
+    assert [state.begin_round() for _ in range(7)] == [True, False, False, True, False, False, True]
+
+
+def test_version_0_entries_are_resent_when_fresher():
+    state = GossipState()
+    ours = constellation()
+    state.delivered("n", ours)
+
+    entry = copy.deepcopy(ours["10.0.0.3:33003"])
+    entry["freshness"] = 150
+    entry["neighbours"]["10.0.0.2:33002"] = link("10.0.0.2:33002")
+    ours["10.0.0.3:33003"] = entry
+    assert delivery_stamp(entry) == (0, 150)
+    assert state.delta("n", ours, full_sync=False) == {"10.0.0.3:33003": entry}
+
+
+def test_apply_freshness():
+    theirs = constellation()
+    theirs["10.0.0.1:33001"] = {**theirs["10.0.0.1:33001"], "freshness": 150}
+    theirs["10.0.0.2:33002"] = {**theirs["10.0.0.2:33002"], "freshness": 150, "version": 2}
+    theirs["10.0.0.3:33003"] = {**theirs["10.0.0.3:33003"], "freshness": 150}
+    theirs["10.0.0.4:33004"] = {"freshness": 150, "version": 1, "neighbours": {}}
+
+    ours = constellation()
+    previous = ours["10.0.0.1:33001"]
+    changed, missing = apply_freshness(ours, freshness_map(theirs))
+
+    assert changed == {"10.0.0.1:33001"}
+    assert sorted(missing) == ["10.0.0.2:33002", "10.0.0.4:33004"]
+    assert ours["10.0.0.1:33001"]["freshness"] == 150
+    # Copied rather than modified in place
+    assert previous["freshness"] == 100
+    # A version 0 entry may have changed along with its freshness, so it waits for the entry itself
+    assert ours["10.0.0.3:33003"]["freshness"] == 100
+
+
+def test_merge_keeps_latest_version_or_freshest_copy():
+    ours = constellation()
+    received = copy.deepcopy(constellation())
+    received["10.0.0.1:33001"]["version"] = 4
+    received["10.0.0.1:33001"]["neighbours"] = {}
+    received["10.0.0.2:33002"]["freshness"] = 50
+    received["10.0.0.3:33003"]["freshness"] = 150
+    received["10.0.0.3:33003"]["neighbours"]["10.0.0.2:33002"] = link("10.0.0.2:33002")
+    received["10.0.0.4:33004"] = {"freshness": 150, "version": 1, "neighbours": {}}
+
+    changed = merge_constellation(ours, received)
+
+    assert changed == {"10.0.0.1:33001", "10.0.0.3:33003", "10.0.0.4:33004"}
+    assert ours["10.0.0.1:33001"]["neighbours"] == {}
+    assert ours["10.0.0.2:33002"]["freshness"] == 100
+    assert set(ours["10.0.0.3:33003"]["neighbours"]) == {"10.0.0.1:33001", "10.0.0.2:33002"}
+    assert ours["10.0.0.4:33004"] == received["10.0.0.4:33004"]
+
+
+def test_delta_heartbeats_converge():
+    sender = constellation()
+    receiver = {}
+    state = GossipState(full_sync_rounds=100)
+    for round_number in range(4):
+        full_sync = state.begin_round()
+        sent = state.delta("receiver", sender, full_sync)
+        merge_constellation(receiver, copy.deepcopy(sent))
+        _, missing = apply_freshness(receiver, freshness_map(sender))
+        state.delivered("receiver", sender, missing)
+        assert receiver == sender
+
+        # One change of each kind before the next heartbeat
+        if round_number == 0:
+            sender["10.0.0.1:33001"] = {**sender["10.0.0.1:33001"], "freshness": 200}
+        elif round_number == 1:
+            sender["10.0.0.2:33002"] = {**sender["10.0.0.2:33002"], "version": 2, "neighbours": {}}
+        elif round_number == 2:
+            sender["10.0.0.3:33003"] = {**sender["10.0.0.3:33003"], "freshness": 300, "neighbours": {}}
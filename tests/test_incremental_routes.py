@@ -0,0 +1,136 @@
+import copy
+
+import pytest
+
+from src.routing.benchmark import synthetic_constellation
+from src.routing.route_generator import IncrementalRouteEngine, RouteGenerator, RouteType
+
+
+def comparable(routes):
+    # Random walks differ between runs, every other strategy is deterministic
+    return {
+        source_id: {
+            dest_id: [(route.path, route.type, route.score) for route in dest_routes if route.type != RouteType.RANDOM]
+            for dest_id, dest_routes in source_routes.items()
+        }
+        for source_id, source_routes in routes.items()
+    }
+
+
+def fresh_routes(constellation):
+    generator = RouteGenerator(constellation=constellation)
+    return {
+        source_id: {dest_id: generator.generate_routes(source_id, dest_id)
+                    for dest_id in generator.satellites if dest_id != source_id}
+        for source_id in generator.satellites
+    }
+
+
+def touch(constellation):
+    node_id = next(iter(constellation))
+    constellation[node_id]["freshness"] += 60
+
+
+def remove_link(constellation):
+    node_id = list(constellation)[3]
+    del constellation[node_id]["neighbours"][next(iter(constellation[node_id]["neighbours"]))]
+
+
+def remove_node(constellation):
+    node_id = list(constellation)[-1]
+    del constellation[node_id]
+    for entry in constellation.values():
+        entry["neighbours"].pop(node_id, None)
+
+
+def add_node(constellation):
+    node_ids = list(constellation)
+    neighbour = copy.deepcopy(constellation[node_ids[1]]["neighbours"])
+    constellation["10.36.0.1:33001"] = {"freshness": constellation[node_ids[0]]["freshness"], "neighbours": neighbour}
+    constellation[node_ids[0]]["neighbours"]["10.36.0.1:33001"] = {
+        "ip": "10.36.0.1", "port": 33001, "public_key": "", "function": "basestation", "last_contact": 0
+    }
+
+
+def measure_link(constellation):
+    node_id = list(constellation)[5]
+    for link in constellation[node_id]["neighbours"].values():
+        link["rtt"] = 40
+
+
+@pytest.mark.parametrize("change", [touch, remove_link, remove_node, add_node, measure_link])
+def test_incremental_routes_match_a_fresh_generation(change):
+    constellation = synthetic_constellation(30, degree=3)
+    engine = IncrementalRouteEngine(None)
+    engine.refresh(constellation)
+
+    constellation = copy.deepcopy(constellation)
+    change(constellation)
+    engine.refresh(constellation)
+
+    assert comparable(engine.routes) == comparable(fresh_routes(constellation))
+
+
+def test_successive_changes_match_a_fresh_generation():
+    constellation = synthetic_constellation(30, degree=3)
+    engine = IncrementalRouteEngine(None)
+    engine.refresh(constellation)
+
+    for change in [remove_link, touch, add_node, remove_node, measure_link]:
+        constellation = copy.deepcopy(constellation)
+        change(constellation)
+        engine.refresh(constellation)
+
+    assert comparable(engine.routes) == comparable(fresh_routes(constellation))
+
+
+def test_unchanged_constellation_recomputes_nothing():
+    constellation = synthetic_constellation(30, degree=3)
+    engine = IncrementalRouteEngine(None)
+    engine.refresh(constellation)
+
+    assert not engine.refresh(copy.deepcopy(constellation))
+
+
+def test_source_engine_only_keeps_routes_from_its_source():
+    constellation = synthetic_constellation(30, degree=3)
+    source_id = list(constellation)[2]
+    engine = IncrementalRouteEngine(None, source_ids={source_id})
+    engine.refresh(constellation)
+
+    constellation = copy.deepcopy(constellation)
+    remove_link(constellation)
+    engine.refresh(constellation)
+
+    assert list(engine.routes) == [source_id]
+    assert comparable(engine.routes)[source_id] == comparable(fresh_routes(constellation))[source_id]
+
+
+def test_hop_distances_from_each_source_match_the_matrix():
+    constellation = synthetic_constellation(30, degree=3)
+    remove_link(constellation)
+    dense = RouteGenerator(constellation=constellation)
+    sparse = RouteGenerator(constellation=constellation, dense_hop_distances=False)
+
+    for source_id in constellation:
+        assert (sparse.hop_distance_row(source_id) == dense.hop_distances()[dense.index[source_id]]).all()
+        for dest_id in constellation:
+            if dest_id != source_id:
+                assert comparable({source_id: {dest_id: sparse.generate_walk_routes(source_id, dest_id)}}) == \
+                    comparable({source_id: {dest_id: dense.generate_walk_routes(source_id, dest_id)}})
+
+
+@pytest.mark.parametrize("change", [remove_link, remove_node, add_node])
+def test_source_engine_link_changes_match_a_fresh_generation(change):
+    constellation = synthetic_constellation(30, degree=3)
+    source_id = list(constellation)[2]
+    engine = IncrementalRouteEngine(None, source_ids={source_id})
+    engine.refresh(constellation)
+    assert not engine.generator.dense_hop_distances
+
+    for _ in range(2):
+        constellation = copy.deepcopy(constellation)
+        change(constellation)
+        engine.refresh(constellation)
+
+    assert comparable(engine.routes)[source_id] == comparable(fresh_routes(constellation))[source_id]
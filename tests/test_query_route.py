@@ -0,0 +1,87 @@
+import json
+import os
+import random
+
+import pytest
+
+from src.routing.benchmark import synthetic_constellation
+from src.routing.route_generator import RouteGenerator, generate_routes_from_source, serialise_routes
+from src.routing.route_ranking import PRIORITY_WEIGHTS, priority_score, scored_route
+
+
+def write_routing_table(source, constellation):
+    generator = RouteGenerator(constellation=constellation)
+    routes = serialise_routes({source: generate_routes_from_source(generator, source)})
+    path = os.path.join("resources", "satellite_routes", f"{source}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Replaced the way the route builder does, so the cache sees a new file
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(routes, f)
+    os.replace(f"{path}.tmp", path)
+    return routes[source]
+
+
+def brute_force_route(routes, priority, excluded):
+    surviving = [route for route in routes if not any(node_id in excluded for node_id in route["path"])]
+    if not surviving:
+        return None
+    # max() keeps the first of equally scored routes, in the order they are stored
+    return scored_route(max(surviving, key=lambda route: priority_score(route, priority)), priority)
+
+
+@pytest.fixture
+def find_best_route(tmp_path, monkeypatch):
+    # Importing the heartbeat module creates its resources directories in the working directory
+    monkeypatch.chdir(tmp_path)
+    from src.routing import find_best_route
+    find_best_route.routing_table_cache.invalidate()
+    find_best_route._forwarding_tables.clear()
+    return find_best_route
+
+
+def test_query_route_matches_brute_force(find_best_route):
+    constellation = synthetic_constellation(25, degree=3)
+    source = list(constellation)[0]
+    routes = write_routing_table(source, constellation)
+
+    rng = random.Random(0)
+    for destination, dest_routes in routes.items():
+        satellites = [node_id for node_id in constellation if node_id not in (source, destination)]
+        for excluded in [set()] + [set(rng.sample(satellites, rng.randint(1, 6))) for _ in range(5)]:
+            for priority in PRIORITY_WEIGHTS:
+                assert find_best_route.query_route(source, destination, priority, excluded) == \
+                    brute_force_route(dest_routes, priority, excluded)
+
+
+def test_excluding_every_route(find_best_route):
+    constellation = synthetic_constellation(10, degree=2)
+    source = list(constellation)[0]
+    routes = write_routing_table(source, constellation)
+    destination = next(iter(routes))
+
+    excluded = {node_id for route in routes[destination] for node_id in route["path"][:-1]} - {source}
+    excluded.add(destination)
+    assert find_best_route.query_route(source, destination, "high", excluded) is None
+    assert find_best_route.find_alternate_route(source, destination, list(excluded), "high") is None
+
+
+def test_rewritten_table_is_queried(find_best_route):
+    constellation = synthetic_constellation(10, degree=2)
+    source = list(constellation)[0]
+    write_routing_table(source, constellation)
+    destination = list(constellation)[5]
+    find_best_route.query_route(source, destination)
+
+    for entry in constellation.values():
+        entry["neighbours"].pop(destination, None)
+    constellation[source]["neighbours"] = {destination: {"function": "basestation", "public_key": ""}}
+    routes = write_routing_table(source, constellation)
+
+    assert find_best_route.query_route(source, destination) == brute_force_route(routes[destination], "medium", set())
+    assert find_best_route.find_best_route(source, destination)["path"] == [destination]
+
+
+def test_missing_table_raises(find_best_route):
+    with pytest.raises(FileNotFoundError):
+        find_best_route.query_route("10.99.0.1:33001", "10.99.0.2:33001")
+    assert find_best_route.find_best_route("10.99.0.1:33001", "10.99.0.2:33001") is None
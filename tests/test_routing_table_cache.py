@@ -0,0 +1,38 @@
+import pytest
+
+from src.routing.binary_routing_table import BinaryRoutingTable, write_binary_routing_table
+from src.routing.route_ranking import rank_routing_table
+from src.routing.routing_table_cache import InMemoryRoutingTable, MappedRoutingTable, RoutingTable
+
+ROUTES = {
+    "b:2": [{"path": ["b:2"], "type": "DIRECT", "score": 100.0, "metrics": {"hops": 1}}],
+    "c:3": [{"path": ["b:2", "c:3"], "type": "SHORTEST_PATH", "score": 50.0, "metrics": {"hops": 2}},
+            {"path": ["d:4", "c:3"], "type": "RANDOM", "score": 50.0, "metrics": {}}],
+}
+
+
+def test_incomplete_routing_table_cannot_be_created():
+    class NoRoutes(RoutingTable):
+        def routes_to(self, destination):
+            return []
+
+        def ranking(self, destination):
+            return None
+
+        def destinations(self):
+            return []
+
+    with pytest.raises(TypeError):
+        NoRoutes("a:1", 1, (0, 0))
+
+
+def test_mapped_table_matches_in_memory_table(tmp_path):
+    ranked = rank_routing_table(ROUTES)
+    write_binary_routing_table(str(tmp_path / "a:1.bin"), {"a:1": ROUTES}, {"a:1": ranked})
+    in_memory = InMemoryRoutingTable("a:1", 1, (0, 0), ROUTES, ranked)
+    mapped = MappedRoutingTable("a:1", 2, BinaryRoutingTable(str(tmp_path / "a:1.bin")))
+
+    assert sorted(mapped.destinations()) == sorted(in_memory.destinations())
+    assert mapped.routes == in_memory.routes
+    for destination in [*ROUTES, "e:5"]:
+        assert mapped.ranked_routes(destination) == in_memory.ranked_routes(destination)
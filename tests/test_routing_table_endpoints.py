@@ -0,0 +1,35 @@
+import pytest
+from flask import Flask
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Importing the heartbeat module creates its resources directories in the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("IP", "10.0.0.1")
+    monkeypatch.setenv("PORT", "33001")
+    from src.routers import __main__ as routers
+    monkeypatch.setattr(routers, "check_headers", lambda: True)
+    app = Flask(__name__)
+    app.register_blueprint(routers.router)
+    return app.test_client()
+
+
+@pytest.mark.parametrize("path", ["/routing_table", "/routing_table/changes"])
+@pytest.mark.parametrize("source", ["../../etc/passwd", "a/b:1", "10.0.0.2", "10.0.0.2:port"])
+def test_routing_table_rejects_invalid_sources(client, path, source):
+    response = client.get(path, query_string={"source": source})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("path", ["/routing_table", "/routing_table/changes"])
+def test_routing_table_of_unknown_source(client, path):
+    assert client.get(path, query_string={"source": "10.0.0.2:33002"}).status_code == 404
+
+
+@pytest.mark.parametrize("field", ["source", "destination"])
+def test_route_rejects_invalid_satellite_ids(client, field):
+    body = {"source": "10.0.0.1:33001", "destination": "10.0.0.2:33002", "message": "m", field: "../x"}
+    response = client.post("/route", json=body)
+    assert response.status_code == 400
+    assert response.json["message"].startswith(field)
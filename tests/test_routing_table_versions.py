@@ -0,0 +1,33 @@
+import threading
+
+from src.routing.routing_table_versions import RoutingTableVersions, record_build
+
+RANKED = {"high": [0], "medium": [0], "low": [0]}
+
+
+def build(destination, score):
+    return {destination: [{"path": [destination], "type": "DIRECT", "score": score, "metrics": {}}]}, {destination: RANKED}
+
+
+def test_changes_since():
+    versions = RoutingTableVersions()
+    assert versions.update(*build("b:2", 1.0))
+    assert not versions.update(*build("b:2", 1.0))
+    assert versions.update(*build("c:3", 1.0))
+
+    assert versions.version == 2
+    assert versions.changes_since(1) == (["c:3"], ["b:2"])
+    assert versions.changes_since(0) == (["c:3"], ["b:2"])
+    assert versions.changes_since(5) == (["c:3"], ["b:2"])
+    assert versions.changes_since(2) == ([], [])
+
+
+def test_concurrent_builds_each_get_a_version(tmp_path):
+    path = str(tmp_path / "a:1.version.json")
+    threads = [threading.Thread(target=record_build, args=(path, *build("b:2", float(score)))) for score in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert RoutingTableVersions.load(path).version == 20
@@ -0,0 +1,172 @@
+import csv
+import json
+import os
+
+import pytest
+
+from src.heartbeat.neighbour_table import NeighbourTable
+from src.helpers import state_store
+from src.helpers.state_store import FULL_SATELLITE_LISTING, LISTING_FIELDS, TO_BE_DISCOVERED, StateStore
+
+PORT = "33001"
+
+
+def neighbour(ip, port, last_contact=0):
+    return {"ip": ip, "port": port, "public_key": f"key {ip}", "function": "basestation", "last_contact": last_contact}
+
+
+def entry(freshness, version=1, *neighbour_ids):
+    return {"freshness": freshness, "version": version, "neighbours": {node_id: {} for node_id in neighbour_ids}}
+
+
+def listing_row(ip, port, function="basestation"):
+    return {"IPv4": ip, "Port": port, "Contact Time": "1700000000", "Device Function": function}
+
+
+@pytest.fixture(params=["files", "sqlite"])
+def backend(request, tmp_path, monkeypatch):
+    """Runs a test against the files, then against the state store, of a device with an empty blocklist"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("PORT", PORT)
+    monkeypatch.setattr(state_store, "use_state_store", request.param == "sqlite")
+    monkeypatch.setattr(state_store, "_state_stores", {})
+    os.makedirs(os.path.dirname(state_store.blocklist_file_path(PORT)))
+    with open(state_store.blocklist_file_path(PORT), 'w') as f:
+        json.dump([], f)
+    return request.param
+
+
+def test_constellation(backend):
+    constellation = {"10.0.0.1:33001": entry(100, 1, "10.0.0.2:33002"), "10.0.0.2:33002": entry(100, 1)}
+    state_store.write_constellation(constellation, constellation)
+    stamp = state_store.constellation_stamp(state_store.constellation_path(PORT))
+
+    constellation["10.0.0.3:33003"] = entry(120, 1)
+    constellation["10.0.0.1:33001"] = entry(150, 2)
+    state_store.write_constellation(constellation, {"10.0.0.3:33003", "10.0.0.1:33001"})
+
+    assert state_store.read_constellation() == constellation
+    assert list(state_store.read_constellation()) == list(constellation)
+    assert state_store.load_constellation(state_store.constellation_path(PORT)) == constellation
+    if backend == "sqlite":
+        assert state_store.constellation_stamp(state_store.constellation_path(PORT)) != stamp
+
+
+def test_missing_constellation(backend):
+    assert state_store.read_constellation() == {}
+    assert state_store.constellation_stamp(state_store.constellation_path(PORT)) is None
+
+
+def test_blocklist(backend):
+    assert state_store.add_to_blocklist(neighbour("10.0.0.2", 33002))
+    assert state_store.add_to_blocklist(neighbour("10.0.0.3", 33003))
+    assert not state_store.add_to_blocklist(neighbour("10.0.0.2", 33002))
+
+    assert state_store.read_blocklist() == [neighbour("10.0.0.2", 33002), neighbour("10.0.0.3", 33003)]
+
+
+def test_listings(backend):
+    rows = [listing_row("10.0.0.2", "33002"), listing_row("10.0.0.3", 33003, "whale_tracking"), listing_row("10.0.0.4", 33004)]
+    state_store.write_listing(FULL_SATELLITE_LISTING, rows)
+    state_store.write_listing(TO_BE_DISCOVERED, rows[:1])
+    state_store.remove_from_listing(FULL_SATELLITE_LISTING, {"IPv4": "10.0.0.3", "Port": "33003"})
+
+    # As read from the CSV files, every value is a string
+    assert state_store.read_listing(FULL_SATELLITE_LISTING) == [
+        {field: str(value) for field, value in row.items()} for row in (rows[0], rows[2])
+    ]
+    assert state_store.read_listing(TO_BE_DISCOVERED) == [rows[0]]
+
+
+def test_neighbour_table(backend):
+    store = state_store.get_state_store() if backend == "sqlite" else None
+    table = NeighbourTable(state_store.neighbours_file_path(PORT), flush_interval=60, store=store)
+    for port in (33002, 33003, 33004):
+        table.add(neighbour("10.0.0.1", port))
+    table.flush()
+    table.remove("10.0.0.1", 33003)
+    table.record_contacts({("10.0.0.1", 33002): 40.0})
+    table.flush()
+
+    reloaded = NeighbourTable(state_store.neighbours_file_path(PORT), store=store)
+    assert reloaded.all() == table.all()
+    assert [n["port"] for n in reloaded.all()] == [33002, 33004]
+    assert reloaded.all()[0]["rtt"] == 40
+
+
+def test_routes_version_only_changes_with_the_routes(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    route = {"path": ["b:2"], "type": "DIRECT", "score": 1.0, "metrics": {"hops": 1}}
+    ranked = {"high": [0], "medium": [0], "low": [0]}
+
+    assert store.write_routes("a:1", {"b:2": [route], "c:3": []}, {"b:2": ranked, "c:3": {}})
+    assert store.route_version("a:1") == 1
+    assert not store.write_routes("a:1", {"b:2": [route], "c:3": []}, {"b:2": ranked, "c:3": {}})
+    assert store.route_version("a:1") == 1
+
+    assert store.write_routes("a:1", {"b:2": [{**route, "score": 0.5}]}, {"b:2": ranked})
+    assert store.route_version("a:1") == 2
+    assert store.route_destinations("a:1") == ["b:2"]
+    assert store.routes_to("a:1", "b:2") == ([{**route, "score": 0.5}], ranked)
+    assert store.routes_to("a:1", "c:3") is None
+    assert store.route_version("b:2") == 0
+
+
+def test_migrate_from_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    constellation = {"10.0.0.1:33001": entry(100, 1), "10.0.0.2:33002": entry(100, 3)}
+    neighbours = [neighbour("10.0.0.2", 33002), neighbour("10.0.0.3", 33003)]
+    blocklist = [neighbour("10.0.0.9", 33009)]
+    rows = [listing_row("10.0.0.2", "33002")]
+    for path, data in [(state_store.constellation_file_path(PORT), constellation),
+                       (state_store.neighbours_file_path(PORT), neighbours),
+                       (state_store.blocklist_file_path(PORT), blocklist)]:
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            json.dump(data, f)
+    for listing in (FULL_SATELLITE_LISTING, TO_BE_DISCOVERED):
+        os.makedirs(os.path.dirname(state_store.listing_file_path(PORT, listing)))
+        with open(state_store.listing_file_path(PORT, listing), 'w', newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=LISTING_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    store = StateStore(state_store.state_db_path(PORT))
+    store.migrate_from_files(PORT)
+    # Only imported once, so later changes to the files are ignored
+    with open(state_store.constellation_file_path(PORT), 'w') as f:
+        json.dump({}, f)
+    store.migrate_from_files(PORT)
+
+    assert store.constellation() == constellation
+    assert store.constellation_version() == 1
+    assert store.neighbours() == neighbours
+    assert store.blocklist() == blocklist
+    assert store.listing(FULL_SATELLITE_LISTING) == rows
+    assert store.listing(TO_BE_DISCOVERED) == rows
+
+
+@pytest.mark.parametrize("port", [PORT, None])
+def test_routes_are_read_from_the_store_of_their_source(tmp_path, monkeypatch, port):
+    from src.routing import routing_table_cache
+    monkeypatch.chdir(tmp_path)
+    if port is None:
+        monkeypatch.delenv("PORT", raising=False)
+    else:
+        monkeypatch.setenv("PORT", port)
+    monkeypatch.setattr(state_store, "_state_stores", {})
+    monkeypatch.setattr(routing_table_cache, "use_state_store", True)
+    cache = routing_table_cache.RoutingTableCache()
+    ranked = {"high": [0], "medium": [0], "low": [0]}
+    # Co-located devices each keep the routes from themselves in their own store
+    for source, destination in [("10.0.0.1:33001", "10.0.0.2:33002"), ("10.0.0.2:33002", "10.0.0.1:33001")]:
+        route = {"path": [destination], "type": "DIRECT", "score": 100.0, "metrics": {}}
+        state_store.get_state_store(source.split(":")[1]).write_routes(source, {destination: [route]}, {destination: ranked})
+
+    assert list(cache.get_table("10.0.0.2:33002").destinations()) == ["10.0.0.1:33001"]
+    assert list(cache.get_table("10.0.0.1:33001").destinations()) == ["10.0.0.2:33002"]
+    with pytest.raises(FileNotFoundError):
+        cache.get_table("10.0.0.3:33003")
+    # Without creating a store for a port no device runs on
+    assert sorted(path.name for path in (tmp_path / "resources" / "state").glob("*.db")) == \
+        ["state_33001.db", "state_33002.db"]